@@ -147,11 +147,13 @@ AUTH_PASSWORD_VALIDATORS = [
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#middleware
 MIDDLEWARE = [
+    'rink.utils.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'league.middleware.LeagueMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -306,4 +308,12 @@ DATE_FORMAT = '%n/%j/%Y'
 DATE_FORMAT_PYTHON = '%-m/%-d/%Y'
 
 DJANGO_TABLES2_TEMPLATE = 'django_tables2/bootstrap4.html'
+
+# Fraction of requests profiled by rink.utils.profiling, 0 turns it off.
+RINK_PROFILING_SAMPLE_RATE = env.float('RINK_PROFILING_SAMPLE_RATE', default=0)
+# Sampled requests kept for the admin summary page.
+RINK_PROFILING_BUFFER_SIZE = env.int('RINK_PROFILING_BUFFER_SIZE', default=1000)
+# Also log each sampled request to the "rink.profiling" logger as JSON.
+RINK_PROFILING_LOG = env.bool('RINK_PROFILING_LOG', default=False)
+
 IMPORT_EXPORT_USE_TRANSACTIONS = True
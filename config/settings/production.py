@@ -202,7 +202,12 @@ LOGGING = {
             'level': 'ERROR',
             'handlers': ['console', 'mail_admins'],
             'propagate': True
-        }
+        },
+        'rink.profiling': {
+            'level': 'INFO',
+            'handlers': ['console'],
+            'propagate': False
+        },
     }
 }
 
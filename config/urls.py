@@ -6,12 +6,15 @@ from django.urls import reverse
 from django.views.generic import TemplateView, RedirectView
 from django.views import defaults as default_views
 
+from rink.utils.profiling import profiling_summary
+
 urlpatterns = [
     #url(r'^$', TemplateView.as_view(template_name='pages/home.html'), name='home'),
     url(r'^$', RedirectView.as_view(url='/billing/pay', permanent=False), name="home"),
     url(r'^about$', TemplateView.as_view(template_name='pages/about.html'), name='about'),
 
     # Django Admin, use {% url 'admin:index' %}
+    url(settings.ADMIN_URL + r'profiling/$', admin.site.admin_view(profiling_summary), name="profiling_summary"),
     url(settings.ADMIN_URL, admin.site.urls),
 
     # User management
@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import (
     BillingPeriod, BillingGroup, BillingPeriodCustomPaymentAmount,
     BillingGroupMembership, BillingSubscription, Invoice, Payment,
-    UserStripeCard
+    UserStripeCard, CaptureAttempt, InvoiceLedger, RefundBatch
 )
 
 admin.site.register(BillingGroup)
@@ -13,3 +13,26 @@ admin.site.register(BillingSubscription)
 admin.site.register(Invoice)
 admin.site.register(Payment)
 admin.site.register(UserStripeCard)
+
+
+@admin.register(CaptureAttempt)
+class CaptureAttemptAdmin(admin.ModelAdmin):
+    list_display = ['attempt_date', 'user', 'league', 'amount', 'status', 'error_type']
+    list_filter = ['status', 'league']
+    raw_id_fields = ['user', 'invoices', 'payment']
+
+
+@admin.register(InvoiceLedger)
+class InvoiceLedgerAdmin(admin.ModelAdmin):
+    list_display = ['league', 'billing_period', 'status', 'month', 'invoice_count', 'invoice_amount', 'paid_amount']
+    list_filter = ['status', 'league']
+    raw_id_fields = ['billing_period']
+
+
+@admin.register(RefundBatch)
+class RefundBatchAdmin(admin.ModelAdmin):
+    list_display = [
+        'create_date', 'league', 'event', 'billing_period', 'status', 'payment_count', 'refunded_count', 'failed_count',
+    ]
+    list_filter = ['status', 'league']
+    raw_id_fields = ['billing_period', 'requested_by']
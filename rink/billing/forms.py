@@ -2,7 +2,8 @@ from django import forms
 from django.utils import timezone
 from crispy_forms.helper import FormHelper
 
-from .models import PAYMENT_PROCESSOR_CHOICES, Invoice
+from .models import PAYMENT_PROCESSOR_CHOICES, BillingPeriod, Invoice, RefundBatch
+from registration.models import RegistrationEvent
 
 
 class UpdateStripeCardForm(forms.Form):
@@ -45,4 +46,32 @@ class QuickInvoiceForm(forms.ModelForm):
 
 class QuickRefundForm(forms.Form):
     refund_amount = forms.DecimalField(min_value=0.00, decimal_places=2)
-    refund_reason = forms.CharField(max_length=200, required=False)
\ No newline at end of file
+    refund_reason = forms.CharField(max_length=200, required=False)
+
+
+class RefundBatchForm(forms.ModelForm):
+    confirm = forms.BooleanField(
+        label="Refund every paid invoice",
+        help_text="Card payments are refunded through Stripe right away. This cannot be undone.",
+    )
+
+    class Meta:
+        model = RefundBatch
+        fields = ['event', 'billing_period', 'refund_reason']
+
+    def __init__(self, *args, league=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['event'].queryset = RegistrationEvent.objects.filter(league=league)
+        self.fields['billing_period'].queryset = BillingPeriod.objects.filter(league=league).select_related('event')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        event = cleaned_data.get('event')
+        billing_period = cleaned_data.get('billing_period')
+        if billing_period and not event:
+            cleaned_data['event'] = billing_period.event
+        elif billing_period and billing_period.event_id != event.pk:
+            raise forms.ValidationError("That billing period is not part of {}.".format(event))
+        elif not event and not billing_period:
+            raise forms.ValidationError("Choose an event or a billing period to refund.")
+        return cleaned_data
@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 
-from .models import Invoice, Payment, UserStripeCard
+from .ledger import (
+    add_ledger_entry, apply_ledger_deltas, get_invoice_ledger_entry, rebuild_invoice_ledger, record_invoice_changes,
+)
+from .models import (
+    BillingGroup, BillingGroupMembership, BillingPeriod, BillingPeriodCustomPaymentAmount,
+    Invoice, Payment, UserStripeCard,
+)
+from .resolvers import InvoiceAmountResolver
 from users.models import UserLog
 
 
@@ -45,3 +52,63 @@ def user_log_payment_created(sender, instance, created, **kwargs):
         group="billing",
         content_object=instance,
     )
+
+
+@receiver(post_save, sender=BillingGroup)
+@receiver(post_delete, sender=BillingGroup)
+@receiver(post_save, sender=BillingGroupMembership)
+@receiver(post_delete, sender=BillingGroupMembership)
+def invalidate_invoice_amounts_for_league(sender, instance, **kwargs):
+    InvoiceAmountResolver.invalidate_on_commit(instance.league_id)
+
+
+# pre_delete runs before anything in the cascade is deleted, so the custom
+# amounts going with a group or billing period find the league queued.
+
+@receiver(pre_delete, sender=BillingGroup)
+def invalidate_invoice_amounts_for_deleted_group(sender, instance, **kwargs):
+    InvoiceAmountResolver.invalidate_on_commit(instance.league_id, group_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=BillingPeriod)
+def invalidate_invoice_amounts_for_deleted_period(sender, instance, **kwargs):
+    InvoiceAmountResolver.invalidate_on_commit(instance.league_id, period_ids=[instance.pk])
+
+
+@receiver(post_save, sender=BillingPeriodCustomPaymentAmount)
+@receiver(post_delete, sender=BillingPeriodCustomPaymentAmount)
+def invalidate_invoice_amounts_for_period(sender, instance, **kwargs):
+    if InvoiceAmountResolver.invalidation_pending(group_id=instance.group_id, period_id=instance.period_id):
+        return
+    league_id = BillingGroup.objects.filter(pk=instance.group_id).values_list('league_id', flat=True).first()
+    if league_id:
+        InvoiceAmountResolver.invalidate_on_commit(league_id, group_ids=[instance.group_id])
+
+
+# The invoice ledger is adjusted the same way as the registration counters:
+# each invoice remembers where it was counted when it was loaded, and a save
+# moves its amounts from there to wherever it belongs now.
+
+@receiver(post_init, sender=Invoice)
+def remember_invoice_ledger_entry(sender, instance, **kwargs):
+    instance._ledger_entry = get_invoice_ledger_entry(instance) if instance.pk else None
+    # Loaded with deferred fields, so where it was counted isn't known.
+    instance._ledger_unknown = bool(instance.pk) and instance._ledger_entry is None
+
+
+@receiver(post_save, sender=Invoice)
+def record_invoice_ledger_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_invoice_changes([instance])
+
+
+@receiver(post_delete, sender=Invoice)
+def record_invoice_ledger_delete(sender, instance, **kwargs):
+    if instance._ledger_unknown:
+        rebuild_invoice_ledger(instance.league_id, [instance.billing_period_id])
+    elif instance._ledger_entry:
+        deltas = {}
+        add_ledger_entry(deltas, instance._ledger_entry, -1)
+        # A missing row is being deleted along with the league or billing
+        # period, don't recreate it.
+        apply_ledger_deltas(deltas, create=False)
@@ -0,0 +1,165 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from datetime import datetime, time
+
+from .ledger import record_invoice_changes, record_invoices
+from .models import BillingPeriod, BillingSubscription, Invoice, Payment
+from .resolvers import InvoiceAmountResolver
+from rink.utils.bulk import bulk_update
+from roster.search import refresh_search_entries
+from users.models import UserLog
+
+
+def complete_subscriptions(subscription_ids, event_id):
+    # Set based version of BillingSubscription.check_completed() for a batch of
+    # subscriptions in the same event. Any subscription that has been invoiced
+    # for every future billing period is marked completed.
+    future_periods = set(BillingPeriod.objects.filter(
+        event_id=event_id,
+        due_date__gte=timezone.now().date(),
+    ).values_list('pk', flat=True))
+
+    invoiced = {}
+    for subscription_id, period_id in Invoice.objects.filter(
+            subscription_id__in=subscription_ids,
+            billing_period_id__in=future_periods).values_list('subscription_id', 'billing_period_id'):
+        invoiced.setdefault(subscription_id, set()).add(period_id)
+
+    completed_ids = [pk for pk in subscription_ids if not future_periods - invoiced.get(pk, set())]
+    if completed_ids:
+        BillingSubscription.objects.filter(pk__in=completed_ids, status='active').update(
+            status='completed',
+            deactive_date=timezone.now(),
+        )
+    return completed_ids
+
+
+def update_invoice_fields(invoices, fields):
+    """
+    Write fields of invoices already changed in memory with one UPDATE, the
+    way bulk_update does in newer Djangos. The invoice ledger is kept up to
+    date, other post_save handlers don't run.
+    """
+    if not invoices:
+        return
+    bulk_update(invoices, fields)
+    record_invoice_changes(invoices)
+
+
+def generate_period_invoices(billing_period, description="Dues"):
+    """
+    Create every missing invoice for a billing period in one pass.
+
+    Does the same thing as calling BillingPeriod.generate_invoice() for each
+    active subscription, but with a fixed number of queries regardless of how
+    many people are subscribed. $0 invoices are marked paid right away.
+
+    Returns the list of newly created invoices that still need to be paid.
+    """
+    now = timezone.now()
+
+    # Subscriptions created before the invoice date (UTC) that don't have an
+    # invoice for this billing period yet.
+    subscriptions = list(BillingSubscription.objects.filter(
+        event_id=billing_period.event_id,
+        status='active',
+        create_date__lt=datetime.combine(billing_period.invoice_date, time.min).replace(tzinfo=timezone.utc),
+    ).exclude(
+        pk__in=Invoice.objects.filter(
+            billing_period=billing_period,
+            subscription__isnull=False,
+        ).values('subscription_id'),
+    ).select_related('user'))
+
+    if not subscriptions:
+        return []
+
+    # Always load fresh amounts here rather than the cached copy, this is money.
+    resolver = InvoiceAmountResolver(billing_period.league_id)
+    amounts = resolver.get_invoice_amounts(billing_period, {s.user_id for s in subscriptions})
+    invoice_description = billing_period.get_invoice_description(description)
+
+    with transaction.atomic():
+        # Always mark $0 invoices as paid, one cash payment per invoice.
+        free_subscriptions = [s for s in subscriptions if amounts[s.user_id] == 0]
+        payments = {}
+        if free_subscriptions:
+            Payment.objects.bulk_create([
+                Payment(
+                    user_id=s.user_id,
+                    league_id=billing_period.league_id,
+                    processor='cash',
+                    amount=0,
+                    payment_date=now,
+                ) for s in free_subscriptions
+            ])
+            # bulk_create doesn't hand back primary keys on every backend.
+            for payment in Payment.objects.filter(
+                    league_id=billing_period.league_id,
+                    user_id__in={s.user_id for s in free_subscriptions},
+                    processor='cash',
+                    payment_date=now):
+                payments.setdefault(payment.user_id, []).append(payment)
+
+        invoices = []
+        for subscription in subscriptions:
+            invoice = Invoice(
+                league_id=billing_period.league_id,
+                billing_period=billing_period,
+                user_id=subscription.user_id,
+                subscription=subscription,
+                invoice_amount=amounts[subscription.user_id],
+                invoice_date=now,
+                due_date=billing_period.due_date,
+                description=invoice_description,
+            )
+            if payments.get(subscription.user_id):
+                invoice.payment = payments[subscription.user_id].pop()
+                invoice.status = 'paid'
+                invoice.paid_date = now
+            invoices.append(invoice)
+        Invoice.objects.bulk_create(invoices)
+
+        users = {s.user_id: s.user for s in subscriptions}
+        invoices = list(Invoice.objects.filter(
+            billing_period=billing_period,
+            subscription__in=subscriptions,
+        ).select_related('payment'))
+        record_invoices(invoices)
+
+        # post_save handlers don't run for bulk_create, write the same
+        # UserLog entries they would have.
+        invoice_type = ContentType.objects.get_for_model(Invoice)
+        payment_type = ContentType.objects.get_for_model(Payment)
+        logs = []
+        for invoice in invoices:
+            logs.append(UserLog(
+                user_id=invoice.user_id,
+                league_id=invoice.league_id,
+                message="Invoice #{} created for *{}* with amount ${}.".format(
+                    invoice.pk, invoice.description, invoice.invoice_amount
+                ),
+                group="billing",
+                content_type=invoice_type,
+                object_id=invoice.pk,
+            ))
+            if invoice.payment:
+                invoice.payment.user = users[invoice.user_id]
+                logs.append(UserLog(
+                    user_id=invoice.user_id,
+                    league_id=invoice.league_id,
+                    message="Payment received: {}".format(invoice.payment),
+                    group="billing",
+                    content_type=payment_type,
+                    object_id=invoice.payment.pk,
+                ))
+        UserLog.objects.bulk_create(logs)
+
+        complete_subscriptions([s.pk for s in subscriptions], billing_period.event_id)
+
+        # Same for the roster search index.
+        refresh_search_entries(billing_period.league_id, list(users.keys()))
+
+    return [invoice for invoice in invoices if invoice.status == 'unpaid']
@@ -0,0 +1,218 @@
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from datetime import datetime
+from decimal import Decimal
+
+from .models import Invoice, InvoiceLedger
+
+
+# Everything about an invoice that decides where and how it's counted.
+LEDGER_FIELDS = (
+    'league_id', 'billing_period_id', 'status', 'invoice_date', 'due_date', 'paid_date',
+    'invoice_amount', 'paid_amount', 'refunded_amount',
+)
+
+LEDGER_AMOUNT_FIELDS = ('invoice_count', 'invoice_amount', 'paid_amount', 'refunded_amount')
+
+
+def as_date(value):
+    # Invoices built in memory sometimes carry datetimes in their date fields.
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
+
+
+def as_decimal(value):
+    return Decimal(str(value or 0))
+
+
+def get_ledger_entry(values):
+    """
+    (key, amounts) for an invoice, from a dict of LEDGER_FIELDS. The key
+    picks the InvoiceLedger row the invoice is counted in.
+    """
+    status = values['status']
+    paid_date = as_date(values['paid_date'])
+    key = (
+        values['league_id'],
+        values['billing_period_id'],
+        status,
+        as_date(values['invoice_date']).replace(day=1),
+        as_date(values['due_date']) if status == 'unpaid' else None,
+        paid_date.replace(day=1) if paid_date and status in ('paid', 'refunded') else None,
+    )
+    amounts = (
+        1,
+        as_decimal(values['invoice_amount']),
+        as_decimal(values['paid_amount']),
+        as_decimal(values['refunded_amount']),
+    )
+    return key, amounts
+
+
+def get_invoice_ledger_entry(invoice):
+    # None if the invoice was loaded without one of the fields it needs.
+    if any(field not in invoice.__dict__ for field in LEDGER_FIELDS):
+        return None
+    return get_ledger_entry(invoice.__dict__)
+
+
+def add_ledger_entry(deltas, entry, sign=1):
+    key, amounts = entry
+    delta = deltas.setdefault(key, [0, Decimal(0), Decimal(0), Decimal(0)])
+    for i, amount in enumerate(amounts):
+        delta[i] += amount * sign
+
+
+def apply_ledger_deltas(deltas, create=True):
+    """
+    Adds {key: [count, invoice_amount, paid_amount, refunded_amount]} to the
+    ledger, creating rows as needed. A couple of queries per distinct key.
+    """
+    for key, delta in deltas.items():
+        if not any(delta):
+            continue
+
+        league_id, billing_period_id, status, month, due_date, paid_month = key
+        lookup = {
+            'league_id': league_id,
+            'billing_period_id': billing_period_id,
+            'status': status,
+            'month': month,
+            'due_date': due_date,
+            'paid_month': paid_month,
+        }
+        entry_id = InvoiceLedger.objects.filter(**lookup).order_by('pk').values_list('pk', flat=True).first()
+        if entry_id is None:
+            if not create:
+                continue
+            InvoiceLedger.objects.create(**lookup, **dict(zip(LEDGER_AMOUNT_FIELDS, delta)))
+        else:
+            InvoiceLedger.objects.filter(pk=entry_id).update(**{
+                field: F(field) + amount for field, amount in zip(LEDGER_AMOUNT_FIELDS, delta)
+            })
+
+
+def record_invoices(invoices):
+    # For invoices created without post_save, eg. with bulk_create.
+    deltas = {}
+    for invoice in invoices:
+        add_ledger_entry(deltas, get_ledger_entry(invoice.__dict__))
+    apply_ledger_deltas(deltas)
+
+
+def record_invoice_changes(invoices):
+    """
+    Moves loaded invoices from where they were counted when loaded to where
+    they belong now. For invoices written without save(), and by the
+    post_save handler for the ones that were.
+    """
+    deltas = {}
+    rebuild = set()
+    for invoice in invoices:
+        if invoice._ledger_unknown:
+            rebuild.add((invoice.league_id, invoice.billing_period_id))
+            continue
+        entry = get_invoice_ledger_entry(invoice)
+        if entry != invoice._ledger_entry:
+            if invoice._ledger_entry:
+                add_ledger_entry(deltas, invoice._ledger_entry, -1)
+            add_ledger_entry(deltas, entry)
+    apply_ledger_deltas(deltas)
+
+    for league_id, billing_period_id in rebuild:
+        rebuild_invoice_ledger(league_id, [billing_period_id])
+
+    for invoice in invoices:
+        invoice._ledger_entry = get_invoice_ledger_entry(invoice)
+        invoice._ledger_unknown = invoice._ledger_entry is None
+
+
+def update_invoices(queryset, **changes):
+    # queryset.update(**changes) for plain fields, keeping the ledger in step.
+    invoices = list(queryset.values('pk', *LEDGER_FIELDS))
+    queryset.filter(pk__in=[invoice['pk'] for invoice in invoices]).update(**changes)
+
+    deltas = {}
+    for invoice in invoices:
+        add_ledger_entry(deltas, get_ledger_entry(invoice), -1)
+        add_ledger_entry(deltas, get_ledger_entry({**invoice, **changes}))
+    apply_ledger_deltas(deltas)
+    return len(invoices)
+
+
+def rebuild_invoice_ledger(league_id, billing_period_ids=None):
+    """
+    Recreates the ledger rows for a league (or some of its billing periods)
+    from the invoices. Returns the number of invoices counted.
+    """
+    ledger = InvoiceLedger.objects.filter(league_id=league_id)
+    invoices = Invoice.objects.filter(league_id=league_id)
+    if billing_period_ids is not None:
+        ledger = ledger.filter(billing_period_id__in=billing_period_ids)
+        invoices = invoices.filter(billing_period_id__in=billing_period_ids)
+
+    totals = {}
+    count = 0
+    for values in invoices.values(*LEDGER_FIELDS).iterator():
+        add_ledger_entry(totals, get_ledger_entry(values))
+        count += 1
+
+    ledger.delete()
+    InvoiceLedger.objects.bulk_create([
+        InvoiceLedger(
+            league_id=league_id,
+            billing_period_id=billing_period_id,
+            status=status,
+            month=month,
+            due_date=due_date,
+            paid_month=paid_month,
+            **dict(zip(LEDGER_AMOUNT_FIELDS, amounts))
+        )
+        for (league_id, billing_period_id, status, month, due_date, paid_month), amounts in totals.items()
+    ])
+    return count
+
+
+# Named apart from the ledger's own fields, annotations can't shadow them.
+LEDGER_TOTALS = {
+    'count': Sum('invoice_count'),
+    'invoiced': Sum('invoice_amount'),
+    'paid': Sum('paid_amount'),
+    'refunded': Sum('refunded_amount'),
+    'unpaid_count': Sum('invoice_count', filter=Q(status='unpaid')),
+    'unpaid': Sum('invoice_amount', filter=Q(status='unpaid')),
+}
+
+
+def get_ledger_summary(league_id, today=None):
+    """
+    Receivables for a league: the headline totals, then totals by month,
+    by event and by billing period. All of it comes from the ledger.
+    """
+    if today is None:
+        today = timezone.now().date()
+    this_month = today.replace(day=1)
+    ledger = InvoiceLedger.objects.filter(league_id=league_id)
+
+    totals = ledger.aggregate(
+        **LEDGER_TOTALS,
+        overdue_count=Sum('invoice_count', filter=Q(status='unpaid', due_date__lt=today)),
+        overdue=Sum('invoice_amount', filter=Q(status='unpaid', due_date__lt=today)),
+        collected_month_count=Sum('invoice_count', filter=Q(paid_month=this_month)),
+        collected_month=Sum('paid_amount', filter=Q(paid_month=this_month)),
+    )
+
+    return {
+        'totals': totals,
+        'months': list(ledger.values('month').annotate(**LEDGER_TOTALS).order_by('-month')),
+        'events': list(ledger.values(
+            'billing_period__event_id', 'billing_period__event__name',
+        ).annotate(**LEDGER_TOTALS).order_by('billing_period__event__name')),
+        'periods': list(ledger.filter(billing_period__isnull=False).values(
+            'billing_period_id', 'billing_period__name', 'billing_period__event__name', 'billing_period__due_date',
+        ).annotate(**LEDGER_TOTALS).order_by('-billing_period__due_date', 'billing_period__name')),
+    }
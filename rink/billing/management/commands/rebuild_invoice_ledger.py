@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from billing.ledger import rebuild_invoice_ledger
+from league.models import League
+
+
+class Command(BaseCommand):
+    help = "Rebuild the invoice ledger totals used by the billing dashboard from the invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', help="League slug, defaults to all leagues.")
+
+    def handle(self, *args, **options):
+        leagues = League.objects.order_by('pk')
+        if options['league']:
+            leagues = leagues.filter(slug=options['league'])
+            if not leagues.exists():
+                raise CommandError("No league with slug '{}'.".format(options['league']))
+
+        for league in leagues:
+            with transaction.atomic():
+                count = rebuild_invoice_ledger(league.pk)
+            self.stdout.write("Rebuilt invoice ledger for {} from {} invoices.".format(league, count))
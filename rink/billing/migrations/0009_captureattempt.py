@@ -0,0 +1,37 @@
+# Generated by Django 2.1.5 on 2026-10-18 01:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('league', '0003_auto_20180904_1548'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0008_auto_20190114_2027'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaptureAttempt',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Amount Attempted')),
+                ('idempotency_key', models.CharField(db_index=True, help_text='Sent to Stripe with the charge, so retrying the same attempt can never charge twice.', max_length=100, verbose_name='Idempotency Key')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('succeeded', 'Succeeded'), ('declined', 'Card Declined'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=50, verbose_name='Attempt Status')),
+                ('error_type', models.CharField(blank=True, max_length=100, verbose_name='Error Type')),
+                ('error_message', models.TextField(blank=True, verbose_name='Error Message')),
+                ('attempt_date', models.DateTimeField(auto_now_add=True, verbose_name='Attempt Date')),
+                ('completed_date', models.DateTimeField(blank=True, null=True, verbose_name='Completed Date')),
+                ('invoices', models.ManyToManyField(blank=True, to='billing.Invoice')),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='league.League')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='billing.Payment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-attempt_date'],
+            },
+        ),
+    ]
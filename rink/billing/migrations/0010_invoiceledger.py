@@ -0,0 +1,39 @@
+# Generated by Django 2.1.5 on 2026-10-18 02:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('league', '0004_leaguemembership'),
+        ('billing', '0009_captureattempt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceLedger',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('unpaid', 'Unpaid'), ('paid', 'Paid'), ('canceled', 'Canceled'), ('refunded', 'Refunded')], max_length=50)),
+                ('month', models.DateField()),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('paid_month', models.DateField(blank=True, null=True)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('invoice_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('refunded_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('billing_period', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='billing.BillingPeriod')),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='league.League')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='invoiceledger',
+            index=models.Index(fields=['league', 'month'], name='billing_inv_league__d21758_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceledger',
+            index=models.Index(fields=['league', 'billing_period'], name='billing_inv_league__ee6198_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.1.5 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0010_invoiceledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billingsubscription',
+            index=models.Index(fields=['event', 'status'], name='billing_bil_event_i_cf7d61_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['league', 'status', 'due_date'], name='billing_inv_league__6c8878_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['league', 'user', 'invoice_date'], name='billing_inv_league__c89a11_idx'),
+        ),
+    ]
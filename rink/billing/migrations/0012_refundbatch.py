@@ -0,0 +1,40 @@
+# Generated by Django 2.1.5 on 2026-10-18 02:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0011_invite_indexes'),
+        ('league', '0004_leaguemembership'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0011_invoice_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefundBatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refund_reason', models.CharField(blank=True, max_length=200, verbose_name='Reason for Refund')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed')], default='pending', max_length=50, verbose_name='Batch Status')),
+                ('payment_count', models.PositiveIntegerField(default=0)),
+                ('refunded_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('refunded_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('errors', models.TextField(blank=True)),
+                ('create_date', models.DateTimeField(auto_now_add=True)),
+                ('completed_date', models.DateTimeField(blank=True, null=True)),
+                ('billing_period', models.ForeignKey(blank=True, help_text='Only refund this billing period, leave empty to refund the whole event.', null=True, on_delete=django.db.models.deletion.CASCADE, to='billing.BillingPeriod')),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='registration.RegistrationEvent')),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='league.League')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-create_date'],
+            },
+        ),
+    ]
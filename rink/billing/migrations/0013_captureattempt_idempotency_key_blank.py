@@ -0,0 +1,18 @@
+# Generated by Django 2.1.5 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0012_refundbatch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='captureattempt',
+            name='idempotency_key',
+            field=models.CharField(blank=True, db_index=True, help_text='Sent to Stripe with the charge, so retrying the same attempt can never charge twice.', max_length=100, verbose_name='Idempotency Key'),
+        ),
+    ]
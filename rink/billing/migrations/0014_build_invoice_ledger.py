@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+def build_invoice_ledger(apps, schema_editor):
+    # Saving an invoice moves it from the ledger row it was counted in, so
+    # every existing invoice needs to be counted before that happens.
+    # rebuild_invoice_ledger does the same for a single league later on.
+    from billing.ledger import LEDGER_AMOUNT_FIELDS, LEDGER_FIELDS, add_ledger_entry, get_ledger_entry
+
+    Invoice = apps.get_model('billing', 'Invoice')
+    InvoiceLedger = apps.get_model('billing', 'InvoiceLedger')
+
+    totals = {}
+    for values in Invoice.objects.values(*LEDGER_FIELDS).iterator():
+        add_ledger_entry(totals, get_ledger_entry(values))
+
+    InvoiceLedger.objects.all().delete()
+    InvoiceLedger.objects.bulk_create([
+        InvoiceLedger(
+            league_id=league_id,
+            billing_period_id=billing_period_id,
+            status=status,
+            month=month,
+            due_date=due_date,
+            paid_month=paid_month,
+            **dict(zip(LEDGER_AMOUNT_FIELDS, amounts))
+        )
+        for (league_id, billing_period_id, status, month, due_date, paid_month), amounts in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0013_captureattempt_idempotency_key_blank'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_invoice_ledger, migrations.RunPython.noop),
+    ]
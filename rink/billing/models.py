@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import pre_save, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
@@ -11,6 +11,7 @@ from decimal import Decimal
 import stripe
 from stripe.error import CardError, InvalidRequestError
 
+from rink.utils.stripe import stripe_rate_limit
 from taskapp.celery import app as celery_app
 
 
@@ -325,6 +326,9 @@ class BillingSubscription(models.Model):
 
     class Meta:
         ordering = ['-create_date']
+        indexes = [
+            models.Index(fields=['event', 'status']),
+        ]
 
     def __str__(self):
         return "{} - {} - {} [{}]".format(
@@ -486,6 +490,12 @@ class Invoice(models.Model):
     class Meta:
         unique_together = ['user', 'league', 'billing_period', 'subscription']
         ordering = ['invoice_date']
+        indexes = [
+            # Billing admin status filters and unpaid/overdue lookups.
+            models.Index(fields=['league', 'status', 'due_date']),
+            # A member's invoices, in invoice order.
+            models.Index(fields=['league', 'user', 'invoice_date']),
+        ]
 
     def __str__(self):
         #  1234 - Billing Period - Event Name - League Name - $AMOUNT (STATUS)
@@ -682,48 +692,128 @@ class Payment(models.Model):
             card_details,
         )
 
-    def refund(self, amount=None, refund_reason=""):
-        if amount:
-            if amount > self.amount:
-                raise ValueError("Refund amount cannot be larger than the payment amount.")
-            if amount <= 0:
-                raise ValueError("Refund amount must be larger than zero.")
-        else:
-            amount = self.amount
+    def get_refund_idempotency_key(self, amount):
+        # The same refund of the same payment always gets the same key, so a
+        # retry after Stripe already refunded it can't refund it again.
+        return "refund-{}-{}-{}".format(self.pk, int((self.refund_amount or 0) * 100), int(amount * 100))
+
+    def refund(self, amount=None, refund_reason="", invoices=None, idempotency_key=None):
+        """
+        Refund some or all of this payment, through Stripe if that's how it
+        was paid. The refund is spread over the payment's invoices (or just
+        the invoices passed in) in order.
+
+        The refund is saved first and Stripe called afterwards, so the payment
+        isn't locked while we wait on Stripe and a database error can't lose a
+        refund Stripe has already made. If Stripe refuses it, the saved refund
+        is taken back off. Inside an outer transaction (eg. a request) nothing
+        is committed until that transaction is.
+        """
+        if invoices is not None and any(invoice.payment_id != self.pk for invoice in invoices):
+            raise ValueError("Invoices to refund must belong to this payment.")
+
+        # Avoid circular import
+        from .invoicing import update_invoice_fields
+        with transaction.atomic():
+            # The payment is locked until the refund is saved, so a refund from
+            # the admin and one from a refund batch can't both start from the
+            # same refund_amount. The invoices are read again under the lock.
+            locked = Payment.objects.select_for_update().values_list('refund_amount', 'refund_date', 'refund_reason')
+            self.refund_amount, self.refund_date, self.refund_reason = locked.get(pk=self.pk)
+            refund_invoices = Invoice.objects.filter(payment=self).order_by('pk')
+            if invoices is not None:
+                refund_invoices = refund_invoices.filter(pk__in=[invoice.pk for invoice in invoices])
+            invoices = list(refund_invoices)
+
+            refundable = self.amount - (self.refund_amount or 0)
+            if amount:
+                if amount > refundable:
+                    raise ValueError("Refund amount cannot be larger than the payment amount.")
+                if amount <= 0:
+                    raise ValueError("Refund amount must be larger than zero.")
+            else:
+                amount = refundable
 
-        if self.processor == 'stripe':
-            stripe.api_key = self.league.get_stripe_private_key()
-            stripe.api_version = settings.STRIPE_API_VERSION
+            if self.processor == 'stripe':
+                idempotency_key = idempotency_key or self.get_refund_idempotency_key(amount)
 
-            refund = stripe.Refund.create(
-                charge=self.transaction_id,
-                amount=int(amount * 100),
-            )
+            # What to put back if Stripe refuses the refund.
+            previous_refund = (self.refund_date, self.refund_reason)
+            previous_invoices = {
+                invoice.pk: (invoice.status, invoice.refund_date, invoice.refunded_amount or 0)
+                for invoice in invoices
+            }
 
-        refund_date = timezone.now()
+            refund_date = timezone.now()
+            allocate_refund(invoices, amount, refund_date)
+            for invoice in invoices:
+                status, previous_refund_date, previous_refunded_amount = previous_invoices.pop(invoice.pk)
+                if invoice.refund_date == refund_date:
+                    previous_invoices[invoice.pk] = (
+                        status, previous_refund_date, invoice.refunded_amount - previous_refunded_amount)
 
-        self.refund_amount = amount
-        self.refund_date = refund_date
-        self.refund_reason = refund_reason
-        self.save()
+            self.refund_amount = (self.refund_amount or 0) + amount
+            self.refund_date = refund_date
+            self.refund_reason = refund_reason
 
-        invoices = Invoice.objects.filter(payment=self)
-        # If it's a partial refund, this gets complicated
-        amount_remaining = amount
-        for invoice in invoices:
-            invoice.status = 'refunded'
-            invoice.refund_date = refund_date
+            self.save()
+            update_invoice_fields(invoices, ['status', 'refund_date', 'refunded_amount'])
 
-            # Partial refund half-assed attempt
-            if amount_remaining < invoice.paid_amount:
-                invoice_refund = amount_remaining
-                amount_remaining = 0
-            else:
-                invoice_refund = invoice.paid_amount
-                amount_remaining -= invoice.paid_amount
+        if self.processor == 'stripe':
+            stripe.api_key = self.league.get_stripe_private_key()
+            stripe.api_version = settings.STRIPE_API_VERSION
 
-            invoice.refunded_amount = invoice_refund
-            invoice.save()
+            try:
+                stripe_rate_limit(stripe.api_key)
+                stripe.Refund.create(
+                    charge=self.transaction_id,
+                    amount=int(amount * 100),
+                    idempotency_key=idempotency_key,
+                )
+            except Exception:
+                self.undo_refund(amount, refund_date, previous_refund, previous_invoices)
+                raise
+
+    def undo_refund(self, amount, refund_date, previous_refund, previous_invoices):
+        # Takes a saved refund back off the payment and its invoices.
+        # previous_invoices maps each refunded invoice's pk to its status and
+        # refund_date before the refund, and how much of the refund it got.
+        # Another refund may have been saved since, so amounts are subtracted,
+        # and dates and statuses only put back where this refund was the last.
+        from .invoicing import update_invoice_fields
+        with transaction.atomic():
+            locked = Payment.objects.select_for_update().values_list('refund_amount', 'refund_date', 'refund_reason')
+            self.refund_amount, self.refund_date, self.refund_reason = locked.get(pk=self.pk)
+            self.refund_amount -= amount
+            if self.refund_date == refund_date:
+                self.refund_date, self.refund_reason = previous_refund
+            self.save()
+
+            invoices = list(Invoice.objects.filter(pk__in=previous_invoices).order_by('pk'))
+            for invoice in invoices:
+                status, previous_refund_date, invoice_refund = previous_invoices[invoice.pk]
+                invoice.refunded_amount -= invoice_refund
+                if invoice.refund_date == refund_date:
+                    invoice.status, invoice.refund_date = status, previous_refund_date
+            update_invoice_fields(invoices, ['status', 'refund_date', 'refunded_amount'])
+
+
+def allocate_refund(invoices, amount, refund_date):
+    # Spread a refund over invoices in order, each up to what's still
+    # refundable on it (paid less anything refunded before) until the amount
+    # runs out. Invoices that get some of it are marked refunded, the rest
+    # are left alone. Only changes the invoices in memory.
+    amount_remaining = amount
+    for invoice in invoices:
+        invoice_refund = min(amount_remaining, invoice.paid_amount - (invoice.refunded_amount or 0))
+        if invoice_refund <= 0:
+            continue
+        amount_remaining -= invoice_refund
+
+        invoice.status = 'refunded'
+        invoice.refund_date = refund_date
+        invoice.refunded_amount = (invoice.refunded_amount or 0) + invoice_refund
+    return invoices
 
 
 USER_CARD_MAX_FAILURES = 3
@@ -872,11 +962,13 @@ class UserStripeCard(models.Model):
         self.card_num_failures = 0
         self.save()
 
-    def charge(self, invoice=None, invoices=[], send_receipt=True):
+    def charge(self, invoice=None, invoices=[], send_receipt=True, idempotency_key=None):
         # Charge the customer for an invoice or a list of invoices.
         # Returns a payment object if the payment is successful.
         # send_receipt can be useful in other cases where we  don't want to send
         # yet another email, such as registration.
+        # idempotency_key is passed to Stripe so a retried charge is never
+        # billed twice.
         if invoice and invoices:
             raise ValueError("You cannot charge both one invoice and multiple invoices at the same time.")
 
@@ -894,7 +986,7 @@ class UserStripeCard(models.Model):
         payment_total = 0  # This is dollars * 100, so technically the number of cents
 
         for invoice in invoices:
-            if invoice.user != self.user:
+            if invoice.user_id != self.user_id:
                 raise ValueError("You cannot charge an invoice to a card that does not belong to you.")
 
             invoice_numbers.append('#{}'.format(invoice.pk))
@@ -917,12 +1009,14 @@ class UserStripeCard(models.Model):
             if not invoice_description:
                 invoice_description = None
 
+            stripe_rate_limit(stripe.api_key)
             try:
                 charge = stripe.Charge.create(
                     amount=payment_total,
                     currency='usd',
                     customer=self.customer_id,
                     description=', '.join(invoice_description),
+                    idempotency_key=idempotency_key,
                 )
             except CardError as e:
                 self.card_last_fail_date = timezone.now()
@@ -933,6 +1027,7 @@ class UserStripeCard(models.Model):
             self.card_last_charge_date = timezone.now()
             self.save()
 
+            stripe_rate_limit(stripe.api_key)
             balance = stripe.BalanceTransaction.retrieve(charge.balance_transaction)
 
             payment = Payment.objects.create(
@@ -971,6 +1066,251 @@ class UserStripeCard(models.Model):
         return payment
 
 
+CAPTURE_ATTEMPT_STATUS_CHOICES = [
+    ('pending', 'Pending'),
+    ('succeeded', 'Succeeded'),
+    ('declined', 'Card Declined'),
+    ('failed', 'Failed'),
+    ('skipped', 'Skipped'),
+]
+
+
+class CaptureAttempt(models.Model):
+    # One row per automatic payment attempt made by billing.tasks.capture_invoices
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+    )
+
+    league = models.ForeignKey(
+        'league.League',
+        on_delete=models.CASCADE,
+    )
+
+    invoices = models.ManyToManyField(
+        'billing.Invoice',
+        blank=True,
+    )
+
+    amount = models.DecimalField(
+        "Amount Attempted",
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+    )
+
+    idempotency_key = models.CharField(
+        "Idempotency Key",
+        max_length=100,
+        db_index=True,
+        blank=True,
+        help_text="Sent to Stripe with the charge, so retrying the same attempt can never charge twice.",
+    )
+
+    status = models.CharField(
+        "Attempt Status",
+        max_length=50,
+        choices=CAPTURE_ATTEMPT_STATUS_CHOICES,
+        default='pending',
+    )
+
+    error_type = models.CharField(
+        "Error Type",
+        max_length=100,
+        blank=True,
+    )
+
+    error_message = models.TextField(
+        "Error Message",
+        blank=True,
+    )
+
+    payment = models.ForeignKey(
+        'billing.Payment',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+
+    attempt_date = models.DateTimeField(
+        "Attempt Date",
+        auto_now_add=True,
+    )
+
+    completed_date = models.DateTimeField(
+        "Completed Date",
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        ordering = ['-attempt_date']
+
+    def __str__(self):
+        return "{} - {} - ${} ({})".format(
+            self.attempt_date,
+            self.user,
+            self.amount,
+            self.status,
+        )
+
+
+REFUND_BATCH_STATUS_CHOICES = [
+    ('pending', 'Pending'),
+    ('running', 'Running'),
+    ('completed', 'Completed'),
+]
+
+
+class RefundBatch(models.Model):
+    # Refunds every paid invoice of an event or billing period in the
+    # background, see billing.tasks.refund_batch. The counts are updated as
+    # each payment is refunded so the admin can follow along.
+    league = models.ForeignKey(
+        'league.League',
+        on_delete=models.CASCADE,
+    )
+
+    event = models.ForeignKey(
+        'registration.RegistrationEvent',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+
+    billing_period = models.ForeignKey(
+        'billing.BillingPeriod',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        help_text="Only refund this billing period, leave empty to refund the whole event.",
+    )
+
+    requested_by = models.ForeignKey(
+        'users.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+
+    refund_reason = models.CharField(
+        "Reason for Refund",
+        max_length=200,
+        blank=True,
+    )
+
+    status = models.CharField(
+        "Batch Status",
+        max_length=50,
+        choices=REFUND_BATCH_STATUS_CHOICES,
+        default='pending',
+    )
+
+    payment_count = models.PositiveIntegerField(default=0)
+
+    refunded_count = models.PositiveIntegerField(default=0)
+
+    failed_count = models.PositiveIntegerField(default=0)
+
+    refunded_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    # One line per payment that couldn't be refunded.
+    errors = models.TextField(blank=True)
+
+    create_date = models.DateTimeField(auto_now_add=True)
+
+    completed_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-create_date']
+
+    def __str__(self):
+        return "{} - {} - {}/{} refunded".format(
+            self.billing_period or self.event,
+            self.status,
+            self.refunded_count,
+            self.payment_count,
+        )
+
+    def get_invoices(self):
+        # Paid invoices this batch refunds.
+        invoices = Invoice.objects.filter(
+            league_id=self.league_id,
+            status='paid',
+            payment__isnull=False,
+            paid_amount__gt=0,
+        )
+        if self.billing_period_id:
+            return invoices.filter(billing_period_id=self.billing_period_id)
+        return invoices.filter(billing_period__event_id=self.event_id)
+
+    @property
+    def processed_count(self):
+        return self.refunded_count + self.failed_count
+
+    @property
+    def percent_complete(self):
+        if self.status == 'completed':
+            return 100
+        if not self.payment_count:
+            return 0
+        return int(100 * self.processed_count / self.payment_count)
+
+
+class InvoiceLedger(models.Model):
+    # Running totals of invoices, kept up to date by billing.ledger so billing
+    # dashboards sum a few hundred rows instead of every invoice. One row per
+    # league, billing period, status and month, due date and paid month are
+    # only set for the statuses they matter to (unpaid and paid/refunded).
+    league = models.ForeignKey(
+        'league.League',
+        on_delete=models.CASCADE,
+    )
+
+    billing_period = models.ForeignKey(
+        'billing.BillingPeriod',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+
+    status = models.CharField(
+        max_length=50,
+        choices=INVOICE_STATUS_CHOICES,
+    )
+
+    # First day of the invoice date's month.
+    month = models.DateField()
+
+    due_date = models.DateField(null=True, blank=True)
+
+    # First day of the paid date's month.
+    paid_month = models.DateField(null=True, blank=True)
+
+    invoice_count = models.IntegerField(default=0)
+
+    invoice_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    refunded_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['league', 'month']),
+            models.Index(fields=['league', 'billing_period']),
+        ]
+
+    def __str__(self):
+        return "{} - {} - {} {} (${})".format(
+            self.league_id,
+            self.month,
+            self.invoice_count,
+            self.status,
+            self.invoice_amount,
+        )
+
+
 @receiver(pre_delete, sender=BillingGroup)
 def delete_default_billing_group_for_league(sender, instance, *args, **kwargs):
     if instance.default_group_for_league and \
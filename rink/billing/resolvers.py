@@ -0,0 +1,153 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from decimal import Decimal
+
+from .models import BillingGroup, BillingGroupMembership, BillingPeriodCustomPaymentAmount
+
+
+INVOICE_AMOUNT_CACHE_KEY = "billing:invoice_amounts:{}"
+INVOICE_AMOUNT_CACHE_TIMEOUT = 60 * 60
+
+
+class InvoiceAmountResolver(object):
+    """
+    Answers BillingPeriod.get_invoice_amount() lookups for a whole league from
+    memory. The group amounts, the group x billing period custom amount matrix
+    and the user -> group membership map are loaded once (three queries).
+
+    Use InvoiceAmountResolver.for_league() to share the loaded data through the
+    cache. It is cleared by the save/delete signals in billing.handlers, once
+    the change is committed.
+    """
+
+    def __init__(self, league, data=None):
+        self.league_id = getattr(league, 'pk', league)
+        if data is None:
+            data = self.load(self.league_id)
+        self.group_amounts, self.default_group_id, self.custom_amounts, self.memberships = data
+
+    @classmethod
+    def for_league(cls, league):
+        league_id = getattr(league, 'pk', league)
+        key = INVOICE_AMOUNT_CACHE_KEY.format(league_id)
+        data = cache.get(key)
+        if data is None:
+            data = cls.load(league_id)
+            cache.set(key, data, INVOICE_AMOUNT_CACHE_TIMEOUT)
+        return cls(league_id, data=data)
+
+    @classmethod
+    def invalidate(cls, league):
+        cache.delete(INVOICE_AMOUNT_CACHE_KEY.format(getattr(league, 'pk', league)))
+
+    @staticmethod
+    def pending_invalidations():
+        # Queued in the current transaction and not run yet.
+        return [
+            entry[1] for entry in transaction.get_connection().run_on_commit
+            if isinstance(entry[1], InvoiceAmountInvalidation)
+        ]
+
+    @classmethod
+    def invalidate_on_commit(cls, league, group_ids=(), period_ids=()):
+        """
+        invalidate() once the current transaction commits. Clearing the cache
+        any earlier lets another request cache the amounts that are about to
+        change again.
+
+        A league is only queued once per transaction. group_ids and period_ids
+        are the groups and billing periods the invalidation covers, see
+        invalidation_pending().
+        """
+        league_id = getattr(league, 'pk', league)
+        for invalidation in cls.pending_invalidations():
+            if invalidation.league_id == league_id:
+                break
+        else:
+            invalidation = InvoiceAmountInvalidation(league_id)
+            transaction.on_commit(invalidation)
+        invalidation.group_ids.update(group_ids)
+        invalidation.period_ids.update(period_ids)
+
+    @classmethod
+    def invalidation_pending(cls, group_id=None, period_id=None):
+        # True if a queued invalidation already covers this group or period,
+        # so the rows deleted along with one don't need to look up their league.
+        return any(
+            group_id in invalidation.group_ids or period_id in invalidation.period_ids
+            for invalidation in cls.pending_invalidations()
+        )
+
+    @staticmethod
+    def load(league_id):
+        group_amounts = {}
+        default_group_id = None
+        for pk, invoice_amount, default in BillingGroup.objects.filter(league_id=league_id).values_list(
+                'pk', 'invoice_amount', 'default_group_for_league'):
+            group_amounts[pk] = invoice_amount
+            if default:
+                default_group_id = pk
+
+        custom_amounts = {
+            (group_id, period_id): invoice_amount
+            for group_id, period_id, invoice_amount in BillingPeriodCustomPaymentAmount.objects.filter(
+                group__league_id=league_id).values_list('group_id', 'period_id', 'invoice_amount')
+        }
+
+        memberships = dict(BillingGroupMembership.objects.filter(
+            league_id=league_id).values_list('user_id', 'group_id'))
+
+        return (group_amounts, default_group_id, custom_amounts, memberships)
+
+    def get_group_id(self, user):
+        return self.memberships.get(getattr(user, 'pk', user))
+
+    def get_invoice_amount(self, billing_period, billing_group=None, user=None):
+        # Same results as BillingPeriod.get_invoice_amount(), without the queries.
+        if user and billing_group:
+            raise ValueError("Do not pass both billing_group and user to get_invoice_amount")
+
+        period_id = getattr(billing_period, 'pk', billing_period)
+
+        group_id = None
+        group_amount = None
+        if billing_group:
+            group_id = billing_group.pk
+            group_amount = billing_group.invoice_amount
+        elif user:
+            group_id = self.get_group_id(user)
+            group_amount = self.group_amounts.get(group_id)
+
+        if group_id is None:
+            # Fall back to the default group for the league
+            group_id = self.default_group_id
+            group_amount = self.group_amounts.get(group_id)
+
+        if group_id is None:
+            # No valid billing group set, free ride.
+            return 0
+
+        if (group_id, period_id) in self.custom_amounts:
+            return self.custom_amounts[(group_id, period_id)]
+        return group_amount
+
+    def get_invoice_amounts(self, billing_period, users):
+        # {user_id: amount} for a batch of users (or user ids).
+        amounts = {}
+        for user in users:
+            amount = self.get_invoice_amount(billing_period, user=user)
+            amounts[getattr(user, 'pk', user)] = Decimal(amount)
+        return amounts
+
+
+class InvoiceAmountInvalidation(object):
+    # The on_commit callback queued by InvoiceAmountResolver.invalidate_on_commit().
+
+    def __init__(self, league_id):
+        self.league_id = league_id
+        self.group_ids = set()
+        self.period_ids = set()
+
+    def __call__(self):
+        InvoiceAmountResolver.invalidate(self.league_id)
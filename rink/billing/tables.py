@@ -6,6 +6,10 @@ from .models import Invoice
 
 
 class InvoiceTable(tables.Table):
+    # Spelled out rather than ordering by the foreign key, keyset pagination
+    # needs the actual columns.
+    user = tables.Column(order_by=('user__last_name', 'user__first_name'))
+
     class Meta:
         model = Invoice
         fields = ['id', 'user', 'status', 'invoice_amount', 'invoice_date', 'due_date', 'payment_date']
@@ -1,10 +1,15 @@
+from django.db.models import F, Value
+from django.db.models.functions import Concat
 from django.utils import timezone
 
-from celery import shared_task
+from celery import group, shared_task
+from stripe.error import CardError
 
-from .models import BillingPeriod, UserStripeCard
+from .invoicing import generate_period_invoices
+from .models import BillingPeriod, CaptureAttempt, RefundBatch, UserStripeCard
 from league.utils import send_email
-from billing.models import Payment, Invoice, BillingSubscription
+from taskapp.metrics import record_items
+from billing.models import Payment, Invoice
 
 
 @shared_task(ignore_result=True)
@@ -31,6 +36,7 @@ def email_payment_receipt(payment_id):
         },
     )
 
+
 @shared_task(ignore_result=True)
 def email_invoice(invoice_id):
     invoice = Invoice.objects.get(pk=invoice_id)
@@ -47,6 +53,27 @@ def email_invoice(invoice_id):
         },
     )
 
+
+@shared_task(ignore_result=True)
+def email_invoices(invoice_ids):
+    # Batch version of email_invoice, queued once per invoice run.
+    invoices = Invoice.objects.filter(pk__in=invoice_ids).select_related('league', 'user')
+    for invoice in invoices:
+        subject = "{} - {} Invoice".format(invoice.league.name, invoice.description)
+
+        send_email(
+            league=invoice.league,
+            to_email=invoice.user.email,
+            template="new_invoice",
+            context={
+                'user': invoice.user,
+                'invoice': invoice,
+                'subject': subject,
+            },
+        )
+        record_items(1)
+
+
 @shared_task(ignore_result=True)
 def alert_admin_to_generate_invoices():
     pass
@@ -72,43 +99,206 @@ def generate_invoices():
     billing_periods = BillingPeriod.objects.filter(
         invoice_date__lte=timezone.now(),
         invoice_date__gt=timezone.now() - timezone.timedelta(days=14)
-    )
+    ).select_related('event')
 
+    invoice_ids = []
     for bp in billing_periods:
-        subscriptions = BillingSubscription.objects.filter(
-            event=bp.event,
-            status='active',
-        )
-        for subscription in subscriptions:
-            if subscription.create_date.date() < bp.invoice_date:
-                # generate_invoice is a shortcut for create or get this Invoice.
-                invoice, created = bp.generate_invoice(subscription, description="Dues")
-                if created:
-                    if invoice.invoice_amount == 0.0:
-                        invoice.pay()  # always mark $0 invoices as paid
-                    else:
-                        email_invoice.delay(invoice.pk)
+        # Creates the missing invoices for every subscription in one go,
+        # $0 invoices are always marked as paid.
+        invoices = generate_period_invoices(bp, description="Dues")
+        invoice_ids.extend(invoice.pk for invoice in invoices)
+    record_items(len(invoice_ids))
+
+    if invoice_ids:
+        email_invoices.delay(invoice_ids)
+
+
+def get_capture_idempotency_key(attempt, usc):
+    # A retry of the same attempt with the same card gets the same key, so if
+    # a worker dies after Stripe charged the card the retry won't bill them
+    # again. Stripe replays declines for a key too, so every new attempt (and
+    # a card update) gets a new one.
+    card_updated = usc.card_last_update_date.strftime('%Y%m%d%H%M%S') if usc.card_last_update_date else "0"
+    return "capture-{}-{}-{}-{}-{}".format(attempt.league_id, attempt.user_id, attempt.pk, usc.pk, card_updated)
+
+
+def get_pending_capture_attempt(user_id, league_id, invoices):
+    # The attempt a worker died in the middle of, if this is a retry of it.
+    invoice_ids = {invoice.pk for invoice in invoices}
+    for attempt in CaptureAttempt.objects.filter(
+            user_id=user_id, league_id=league_id, status='pending').prefetch_related('invoices')[:5]:
+        if {invoice.pk for invoice in attempt.invoices.all()} == invoice_ids:
+            return attempt
+    return None
 
 
 @shared_task(ignore_result=True)
 def capture_invoices():
+    """
+    Find every due unpaid invoice and charge the card on file.
+
+    Invoices are grouped per user and league so each person is charged once
+    for everything they owe. Each group is charged in its own task so the
+    work spreads over the celery workers, Stripe requests are rate limited per
+    API key in UserStripeCard.charge.
+    """
     invoices = Invoice.objects.filter(
         due_date__lte=timezone.now(),
         status='unpaid',
         autopay_disabled=False,
-    )
+    ).values_list('pk', 'user_id', 'league_id')
 
-    for invoice in invoices:
-        # Attempt to charge this invoice using the card on file.
+    batches = {}
+    for invoice_id, user_id, league_id in invoices:
+        batches.setdefault((user_id, league_id), []).append(invoice_id)
+    record_items(len(batches))
+
+    if batches:
+        group(
+            capture_user_invoices.s(user_id, league_id, invoice_ids)
+            for (user_id, league_id), invoice_ids in batches.items()
+        ).apply_async()
+
+
+@shared_task(ignore_result=True)
+def capture_user_invoices(user_id, league_id, invoice_ids):
+    # Attempt to charge a users due invoices using the card on file. Every
+    # attempt is recorded as a CaptureAttempt with the outcome.
+    invoices = list(Invoice.objects.filter(
+        pk__in=invoice_ids,
+        user_id=user_id,
+        league_id=league_id,
+        status='unpaid',
+        autopay_disabled=False,
+    ).select_related('billing_period__event'))
+
+    if not invoices:
+        return None
+    record_items(len(invoices))
+
+    attempt = get_pending_capture_attempt(user_id, league_id, invoices)
+    if attempt is None:
+        attempt = CaptureAttempt.objects.create(
+            user_id=user_id,
+            league_id=league_id,
+            amount=sum(invoice.invoice_amount for invoice in invoices),
+        )
+        attempt.invoices.set(invoices)
+
+    try:
+        usc = UserStripeCard.objects.select_related('league').get(league_id=league_id, user_id=user_id)
+    except UserStripeCard.DoesNotExist:
+        attempt.status = 'skipped'
+        attempt.error_message = "No credit card on file."
+    else:
+        # Saved before the charge, so it's on record if the worker dies.
+        attempt.idempotency_key = get_capture_idempotency_key(attempt, usc)
+        attempt.save(update_fields=['idempotency_key'])
         try:
-            usc = UserStripeCard.objects.get(league=invoice.league, user=invoice.user)
-        except UserStripeCard.DoesNotExist:
+            attempt.payment = usc.charge(invoices=invoices, idempotency_key=attempt.idempotency_key)
+        except CardError as e:
+            attempt.status = 'declined'
+            attempt.error_type = e.__class__.__name__
+            attempt.error_message = str(e)
+        except Exception as e:
+            attempt.status = 'failed'
+            attempt.error_type = e.__class__.__name__
+            attempt.error_message = str(e)
+        else:
+            attempt.status = 'succeeded'
+
+    attempt.completed_date = timezone.now()
+    attempt.save()
+    return attempt.status
+
+
+# Payments are refunded by at most this many tasks at once per batch, Stripe
+# requests are rate limited per API key on top of that.
+REFUND_BATCH_CONCURRENCY = 4
+
+
+def get_batch_refund_idempotency_key(batch_id, payment_id):
+    return "refund-batch-{}-{}".format(batch_id, payment_id)
+
+
+@shared_task(ignore_result=True)
+def refund_batch(batch_id):
+    """
+    Refund every paid invoice in a RefundBatch. Invoices are grouped by the
+    payment that paid them and the payments split between a few
+    refund_batch_payments tasks.
+    """
+    batch = RefundBatch.objects.get(pk=batch_id)
+    if batch.status != 'pending':
+        return
+
+    payments = {}
+    for invoice_id, payment_id in batch.get_invoices().order_by('pk').values_list('pk', 'payment_id'):
+        payments.setdefault(payment_id, []).append(invoice_id)
+
+    # Only the first delivery of this task gets to start the batch.
+    if not RefundBatch.objects.filter(pk=batch_id, status='pending').update(
+            status='running', payment_count=len(payments)):
+        return
+    record_items(len(payments))
+
+    if not payments:
+        finish_refund_batch(batch_id)
+        return
+
+    chunks = [[] for i in range(min(REFUND_BATCH_CONCURRENCY, len(payments)))]
+    for i, payment in enumerate(sorted(payments.items())):
+        chunks[i % len(chunks)].append(payment)
+    group(refund_batch_payments.s(batch_id, chunk) for chunk in chunks).apply_async()
+
+
+@shared_task(ignore_result=True)
+def refund_batch_payments(batch_id, payments):
+    # payments is a list of (payment id, [invoice ids]). Each payment is
+    # refunded for what it paid on those invoices only.
+    batch = RefundBatch.objects.get(pk=batch_id)
+
+    invoices = {}
+    for invoice in Invoice.objects.filter(
+            pk__in=[invoice_id for payment_id, invoice_ids in payments for invoice_id in invoice_ids],
+            status='paid').select_related('payment__league').order_by('pk'):
+        invoices.setdefault(invoice.payment_id, []).append(invoice)
+
+    for payment_id, invoice_ids in payments:
+        payment_invoices = invoices.get(payment_id)
+        if not payment_invoices:
+            # Already refunded, eg. this task is being retried.
+            RefundBatch.objects.filter(pk=batch_id).update(refunded_count=F('refunded_count') + 1)
             continue
 
+        amount = sum(invoice.paid_amount for invoice in payment_invoices)
         try:
-            payment = usc.charge(invoice=invoice)
-        # probably should do more here?
-        except ValueError as e:
-            print("error: ", e)
+            payment_invoices[0].payment.refund(
+                amount=amount,
+                refund_reason=batch.refund_reason,
+                invoices=payment_invoices,
+                idempotency_key=get_batch_refund_idempotency_key(batch_id, payment_id),
+            )
         except Exception as e:
-            print("error: ", e)
+            RefundBatch.objects.filter(pk=batch_id).update(
+                failed_count=F('failed_count') + 1,
+                errors=Concat('errors', Value("Payment #{} (${}): {}: {}\n".format(
+                    payment_id, amount, e.__class__.__name__, e))),
+            )
+        else:
+            RefundBatch.objects.filter(pk=batch_id).update(
+                refunded_count=F('refunded_count') + 1,
+                refunded_amount=F('refunded_amount') + amount,
+            )
+        record_items(1)
+
+    finish_refund_batch(batch_id)
+
+
+def finish_refund_batch(batch_id):
+    # Whichever task handles the last payment marks the batch completed.
+    RefundBatch.objects.filter(
+        pk=batch_id,
+        status='running',
+        payment_count__lte=F('refunded_count') + F('failed_count'),
+    ).update(status='completed', completed_date=timezone.now())
@@ -0,0 +1,143 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import utc
+
+from datetime import date, datetime
+from decimal import Decimal
+from io import StringIO
+
+from .factories import BillingPeriodFactory
+from billing.invoicing import generate_period_invoices
+from billing.ledger import get_ledger_summary, rebuild_invoice_ledger, update_invoices
+from billing.models import BillingSubscription, Invoice, InvoiceLedger
+from league.tests.factories import LeagueFactory
+from users.tests.factories import UserFactory
+
+
+class TestInvoiceLedger(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory()
+        self.user = UserFactory(league=self.league, organization=self.league.organization)
+        self.period = BillingPeriodFactory(
+            league=self.league,
+            event__league=self.league,
+            invoice_date=date(2019, 1, 20),
+            due_date=date(2019, 2, 1),
+        )
+
+    def create_invoice(self, amount=50, **kwargs):
+        return Invoice.objects.create(**{
+            'user': self.user,
+            'league': self.league,
+            'billing_period': self.period,
+            'invoice_amount': amount,
+            'invoice_date': date(2019, 1, 20),
+            'due_date': date(2019, 2, 1),
+            **kwargs,
+        })
+
+    def get_ledger(self):
+        return sorted(InvoiceLedger.objects.filter(league=self.league).exclude(invoice_count=0).values_list(
+            'billing_period_id', 'status', 'month', 'due_date', 'paid_month',
+            'invoice_count', 'invoice_amount', 'paid_amount', 'refunded_amount',
+        ))
+
+    def assertLedgerMatchesRebuild(self):
+        ledger = self.get_ledger()
+        rebuild_invoice_ledger(self.league.pk)
+        self.assertEqual(ledger, self.get_ledger())
+
+    def test_create(self):
+        self.create_invoice(50)
+        self.create_invoice(25)
+
+        self.assertEqual(self.get_ledger(), [(
+            self.period.pk, 'unpaid', date(2019, 1, 1), date(2019, 2, 1), None,
+            2, Decimal('75.00'), Decimal('0.00'), Decimal('0.00'),
+        )])
+
+    def test_pay_and_refund(self):
+        invoice = self.create_invoice(50)
+        self.create_invoice(25)
+
+        payment = invoice.pay(payment_date=datetime(2019, 3, 5, 12, tzinfo=utc))
+        self.assertIn((
+            self.period.pk, 'paid', date(2019, 1, 1), None, date(2019, 3, 1),
+            1, Decimal('50.00'), Decimal('50.00'), Decimal('0.00'),
+        ), self.get_ledger())
+        self.assertLedgerMatchesRebuild()
+
+        payment.refund(Decimal('20'))
+        self.assertIn((
+            self.period.pk, 'refunded', date(2019, 1, 1), None, date(2019, 3, 1),
+            1, Decimal('50.00'), Decimal('50.00'), Decimal('20.00'),
+        ), self.get_ledger())
+        self.assertLedgerMatchesRebuild()
+
+    def test_unchanged_save_skips_ledger(self):
+        invoice = self.create_invoice()
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        invoice.description = "Renamed"
+        with CaptureQueriesContext(connection) as queries:
+            invoice.save()
+        self.assertFalse([query for query in queries if 'billing_invoiceledger' in query['sql']])
+
+    def test_deferred_save_rebuilds(self):
+        invoice = self.create_invoice()
+        invoice = Invoice.objects.only('pk', 'league', 'billing_period', 'status').get(pk=invoice.pk)
+        invoice.status = 'canceled'
+        invoice.save()
+
+        self.assertEqual([row[1] for row in self.get_ledger()], ['canceled'])
+        self.assertLedgerMatchesRebuild()
+
+    def test_delete(self):
+        self.create_invoice(50)
+        self.create_invoice(25).delete()
+
+        self.assertEqual(self.get_ledger()[0][5:7], (1, Decimal('50.00')))
+
+    def test_update_invoices(self):
+        self.create_invoice(50)
+        self.create_invoice(25, status='paid', paid_amount=25)
+
+        self.assertEqual(update_invoices(Invoice.objects.filter(status='unpaid'), status='canceled'), 1)
+        self.assertEqual(sorted(row[1] for row in self.get_ledger()), ['canceled', 'paid'])
+        self.assertLedgerMatchesRebuild()
+
+    def test_generate_period_invoices(self):
+        BillingSubscription.objects.create(
+            user=self.user,
+            league=self.league,
+            event=self.period.event,
+        )
+        BillingSubscription.objects.filter(user=self.user).update(create_date=datetime(2019, 1, 1, tzinfo=utc))
+
+        generate_period_invoices(self.period)
+        self.assertEqual(sum(row[5] for row in self.get_ledger()), 1)
+        self.assertLedgerMatchesRebuild()
+
+    def test_summary(self):
+        self.create_invoice(50)
+        self.create_invoice(30, status='paid', paid_amount=30, paid_date=datetime(2019, 2, 10, 12, tzinfo=utc))
+
+        summary = get_ledger_summary(self.league.pk, today=date(2019, 2, 15))
+        totals = summary['totals']
+        self.assertEqual(totals['count'], 2)
+        self.assertEqual(totals['unpaid'], Decimal('50.00'))
+        self.assertEqual(totals['overdue'], Decimal('50.00'))
+        self.assertEqual(totals['collected_month'], Decimal('30.00'))
+        self.assertEqual([month['month'] for month in summary['months']], [date(2019, 1, 1)])
+        self.assertEqual(summary['periods'][0]['count'], 2)
+        self.assertEqual(summary['events'][0]['billing_period__event_id'], self.period.event_id)
+
+    def test_rebuild_command(self):
+        self.create_invoice(50)
+        InvoiceLedger.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_invoice_ledger', '--league', self.league.slug, stdout=out)
+        self.assertIn("from 1 invoices", out.getvalue())
+        self.assertEqual(self.get_ledger()[0][5:7], (1, Decimal('50.00')))
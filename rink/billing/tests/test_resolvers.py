@@ -0,0 +1,127 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .factories import BillingGroupFactory, BillingGroupMembershipFactory, BillingPeriodFactory
+from billing.models import BillingPeriodCustomPaymentAmount
+from billing.resolvers import InvoiceAmountResolver
+from league.tests.factories import LeagueFactory
+from users.tests.factories import UserFactory
+
+
+class InvoiceAmountResolverTestCase(object):
+    def setUp(self):
+        cache.clear()
+        self.league = LeagueFactory()
+        self.user = UserFactory(league=self.league, organization=self.league.organization)
+        self.billing_period = BillingPeriodFactory(league=self.league)
+
+
+class TestInvoiceAmountResolver(InvoiceAmountResolverTestCase, TestCase):
+
+    def assertMatchesModel(self, billing_group=None, user=None):
+        resolver = InvoiceAmountResolver(self.league)
+        self.assertEqual(
+            resolver.get_invoice_amount(self.billing_period, billing_group=billing_group, user=user),
+            self.billing_period.get_invoice_amount(billing_group=billing_group, user=user),
+        )
+
+    def test_matches_get_invoice_amount(self):
+        # Nothing setup, free ride
+        self.assertMatchesModel()
+        self.assertMatchesModel(user=self.user)
+
+        billing_group1 = BillingGroupFactory(league=self.league, default_group_for_league=True)
+        billing_group2 = BillingGroupFactory(league=self.league, default_group_for_league=False)
+        self.assertMatchesModel()
+        self.assertMatchesModel(user=self.user)
+        self.assertMatchesModel(billing_group=billing_group2)
+
+        BillingPeriodCustomPaymentAmount.objects.create(
+            group=billing_group2,
+            period=self.billing_period,
+            invoice_amount=9999.98,
+        )
+        BillingGroupMembershipFactory(league=self.league, user=self.user, group=billing_group2)
+        self.assertMatchesModel()
+        self.assertMatchesModel(user=self.user)
+        self.assertMatchesModel(user=UserFactory(league=self.league, organization=self.league.organization))
+        self.assertMatchesModel(billing_group=billing_group1)
+        self.assertMatchesModel(billing_group=billing_group2)
+
+        with self.assertRaises(ValueError):
+            InvoiceAmountResolver(self.league).get_invoice_amount(
+                self.billing_period, billing_group=billing_group1, user=self.user)
+
+
+class TestInvoiceAmountInvalidation(InvoiceAmountResolverTestCase, TransactionTestCase):
+    # Invalidation waits for the commit, these tests need real transactions.
+
+    def test_cached_lookups_and_invalidation(self):
+        billing_group1 = BillingGroupFactory(league=self.league, default_group_for_league=True)
+        billing_group2 = BillingGroupFactory(league=self.league, default_group_for_league=False)
+
+        InvoiceAmountResolver.for_league(self.league)
+        with self.assertNumQueries(0):
+            resolver = InvoiceAmountResolver.for_league(self.league)
+            self.assertEqual(
+                resolver.get_invoice_amount(self.billing_period, user=self.user),
+                billing_group1.invoice_amount)
+
+        # Membership changes clear the cached copy
+        membership = BillingGroupMembershipFactory(league=self.league, user=self.user, group=billing_group2)
+        self.assertEqual(
+            InvoiceAmountResolver.for_league(self.league).get_invoice_amount(self.billing_period, user=self.user),
+            billing_group2.invoice_amount)
+
+        # So do custom amounts
+        custom = BillingPeriodCustomPaymentAmount.objects.create(
+            group=billing_group2,
+            period=self.billing_period,
+            invoice_amount=12,
+        )
+        self.assertEqual(
+            InvoiceAmountResolver.for_league(self.league).get_invoice_amount(self.billing_period, user=self.user),
+            12)
+        custom.delete()
+        membership.delete()
+
+        # And billing group amounts
+        billing_group1.invoice_amount = 1234
+        billing_group1.save()
+        self.assertEqual(
+            InvoiceAmountResolver.for_league(self.league).get_invoice_amount(self.billing_period, user=self.user),
+            1234)
+
+    def test_invalidated_on_commit(self):
+        billing_group = BillingGroupFactory(league=self.league, default_group_for_league=True)
+        InvoiceAmountResolver.for_league(self.league)
+
+        with transaction.atomic():
+            billing_group.invoice_amount = 1234
+            billing_group.save()
+            # Anybody reading now caches the old amounts, they're cleared after the commit.
+            self.assertNotEqual(
+                InvoiceAmountResolver.for_league(self.league).get_invoice_amount(self.billing_period), 1234)
+        self.assertEqual(InvoiceAmountResolver.for_league(self.league).get_invoice_amount(self.billing_period), 1234)
+
+    def test_cascade_invalidates_once(self):
+        for i in range(3):
+            BillingPeriodCustomPaymentAmount.objects.create(
+                group=BillingGroupFactory(league=self.league),
+                period=self.billing_period,
+                invoice_amount=12,
+            )
+        InvoiceAmountResolver.for_league(self.league)
+
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as context:
+                self.billing_period.delete()
+            self.assertEqual(len(InvoiceAmountResolver.pending_invalidations()), 1)
+            # No league lookups for the deleted custom amounts.
+            self.assertFalse([
+                query for query in context.captured_queries
+                if query['sql'].startswith('SELECT "billing_billinggroup"')
+            ])
+        self.assertEqual(InvoiceAmountResolver.for_league(self.league).custom_amounts, {})
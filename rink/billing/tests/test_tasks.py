@@ -1,22 +1,39 @@
 from django.conf import settings
-from django.test import TransactionTestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from datetime import date
+from datetime import date, timedelta
+from decimal import Decimal
 from freezegun import freeze_time
+from types import SimpleNamespace
 import pytest
+from stripe.error import InvalidRequestError
 from unittest.mock import patch
 
-from billing.models import Invoice
+from billing.invoicing import generate_period_invoices
+from billing.models import (
+    BillingPeriodCustomPaymentAmount, BillingSubscription, CaptureAttempt, Invoice, Payment, RefundBatch,
+    UserStripeCard,
+)
 from league.models import League
+from users.models import UserLog
 
-from billing.tasks import generate_invoices, capture_invoices
+from billing.tasks import (
+    generate_invoices, capture_invoices, capture_user_invoices, get_batch_refund_idempotency_key, refund_batch,
+    refund_batch_payments,
+)
 
-from billing.tests.factories import BillingGroupFactory
+from billing.tests.factories import (
+    BillingGroupFactory, BillingGroupMembershipFactory, BillingPeriodFactory, UserStripeCardFactory,
+)
+from billing.tests.utils import FakeStripe
 from league.tests.factories import LeagueFactory
 from registration.tests.factories import RegistrationEventFactory, RegistrationDataFactory
 from rink.utils.testing import copy_model_to_dict
-from users.tests.factories import UserFactoryNoPermissions, user_password
+from users.tests.factories import OrgAdminUserFactory, UserFactory, UserFactoryNoPermissions, user_password
 
 #from taskapp.celery import app as celery_app
 
@@ -149,4 +166,364 @@ class TestAutomaticBilling(TransactionTestCase):
         freezer.stop()
         self.assertEqual(invoices.count(), 4)
         self.assertEqual(invoices[3].status, "paid")
-        self.assertEqual(Invoice.objects.all()[3].subscription.status, "complete")
\ No newline at end of file
+        self.assertEqual(Invoice.objects.all()[3].subscription.status, "complete")
+
+
+class TestGeneratePeriodInvoices(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory()
+        self.group = BillingGroupFactory(league=self.league, invoice_amount=50)
+        self.event = RegistrationEventFactory(league=self.league)
+        tomorrow = timezone.now().date() + timedelta(days=1)
+        self.billing_period = BillingPeriodFactory(
+            event=self.event,
+            league=self.league,
+            start_date=tomorrow,
+            end_date=tomorrow + timedelta(days=30),
+            invoice_date=tomorrow,
+            due_date=tomorrow,
+        )
+
+    def subscribe(self, num_users):
+        for i in range(0, num_users):
+            user = UserFactory(league=self.league, organization=self.league.organization)
+            BillingSubscription.objects.create(user=user, league=self.league, event=self.event)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            generate_period_invoices(self.billing_period)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        self.subscribe(2)
+        small = self.count_queries()
+        self.assertEqual(Invoice.objects.count(), 2)
+
+        self.subscribe(8)
+        large = self.count_queries()
+        self.assertEqual(Invoice.objects.count(), 10)
+        self.assertEqual(small, large)
+
+    def test_invoice_amounts_and_free_invoices(self):
+        free_group = BillingGroupFactory(league=self.league, invoice_amount=10)
+        BillingPeriodCustomPaymentAmount.objects.create(
+            group=free_group, period=self.billing_period, invoice_amount=0)
+        self.subscribe(2)
+        free_user = BillingSubscription.objects.all()[0].user
+        BillingGroupMembershipFactory(league=self.league, group=free_group, user=free_user)
+
+        unpaid = generate_period_invoices(self.billing_period)
+        self.assertEqual(len(unpaid), 1)
+        self.assertEqual(unpaid[0].invoice_amount, Decimal('50.00'))
+        self.assertEqual(unpaid[0].description, "{} Dues".format(self.event.name))
+
+        free_invoice = Invoice.objects.get(user=free_user)
+        self.assertEqual(free_invoice.status, 'paid')
+        self.assertEqual(free_invoice.payment.amount, 0)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(UserLog.objects.filter(group='billing').count(), 3)
+
+        # Only subscription in a single billing period, so they are all done.
+        self.assertEqual(BillingSubscription.objects.filter(status='completed').count(), 2)
+
+        # Running it again doesn't create duplicates.
+        self.assertEqual(generate_period_invoices(self.billing_period), [])
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_subscriptions_after_invoice_date_skipped(self):
+        self.subscribe(1)
+        self.billing_period.invoice_date = timezone.now().date()
+        self.billing_period.save()
+        self.assertEqual(generate_period_invoices(self.billing_period), [])
+        self.assertEqual(Invoice.objects.count(), 0)
+
+
+def run_group_inline(signatures):
+    # Stand in for celery.group, runs every task right away in this process
+    signatures = list(signatures)
+    return SimpleNamespace(apply_async=lambda: [signature() for signature in signatures])
+
+
+@patch('billing.tasks.group', run_group_inline)
+@patch('billing.models.celery_app.send_task')
+class TestCaptureInvoices(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory(stripe_private_key="sk_test_fake")
+        self.event = RegistrationEventFactory(league=self.league)
+        self.billing_period = BillingPeriodFactory(event=self.event, league=self.league)
+
+    def create_invoice(self, user, amount=25):
+        return Invoice.objects.create(
+            user=user,
+            league=self.league,
+            billing_period=self.billing_period,
+            invoice_amount=amount,
+            invoice_date=timezone.now() - timedelta(days=7),
+            due_date=timezone.now() - timedelta(days=1),
+        )
+
+    def create_user(self, customer_id=None):
+        user = UserFactory(league=self.league, organization=self.league.organization)
+        if customer_id:
+            UserStripeCardFactory(user=user, league=self.league, customer_id=customer_id)
+        return user
+
+    def test_capture_invoices_grouped_per_user(self, send_task):
+        paying_user = self.create_user("cus_paying")
+        declined_user = self.create_user("cus_declined")
+        no_card_user = self.create_user()
+
+        self.create_invoice(paying_user, 25)
+        self.create_invoice(paying_user, 10)
+        self.create_invoice(declined_user)
+        self.create_invoice(no_card_user)
+
+        with FakeStripe(decline_customers=["cus_declined"]) as stripe:
+            capture_invoices()
+
+        # One charge for everything the paying user owes
+        self.assertEqual(len(stripe.charges), 1)
+        self.assertEqual(stripe.charges[0].amount, 3500)
+        self.assertEqual(Invoice.objects.filter(user=paying_user, status='paid').count(), 2)
+        self.assertEqual(Invoice.objects.filter(status='unpaid').count(), 2)
+
+        attempts = {a.user_id: a for a in CaptureAttempt.objects.all()}
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(attempts[paying_user.pk].status, 'succeeded')
+        self.assertEqual(attempts[paying_user.pk].invoices.count(), 2)
+        self.assertEqual(attempts[paying_user.pk].idempotency_key, stripe.charges[0].idempotency_key)
+        self.assertEqual(attempts[declined_user.pk].status, 'declined')
+        self.assertEqual(attempts[declined_user.pk].error_type, 'CardError')
+        self.assertEqual(attempts[no_card_user.pk].status, 'skipped')
+
+        # Receipt only goes out for the successful charge
+        self.assertEqual(send_task.call_count, 1)
+
+    def test_retried_attempt_uses_same_idempotency_key(self, send_task):
+        user = self.create_user("cus_paying")
+        invoice = self.create_invoice(user)
+
+        with FakeStripe() as stripe:
+            capture_user_invoices(user.pk, self.league.pk, [invoice.pk])
+            # Pretend the worker died after the charge, before anything was saved
+            Invoice.objects.filter(pk=invoice.pk).update(status='unpaid')
+            CaptureAttempt.objects.update(status='pending', completed_date=None)
+            capture_user_invoices(user.pk, self.league.pk, [invoice.pk])
+
+        self.assertEqual(len(stripe.charges), 1)
+        self.assertEqual(CaptureAttempt.objects.get().status, 'succeeded')
+
+    def test_retry_after_decline_charges_again(self, send_task):
+        user = self.create_user("cus_paying")
+        invoice = self.create_invoice(user)
+
+        with FakeStripe(decline_customers=["cus_paying"]) as stripe:
+            capture_user_invoices(user.pk, self.league.pk, [invoice.pk])
+            # The member fixes their card and the invoice is retried the same day
+            stripe.decline_customers = []
+            UserStripeCard.objects.filter(user=user).update(card_last_update_date=timezone.now(), card_num_failures=0)
+            capture_user_invoices(user.pk, self.league.pk, [invoice.pk])
+
+        self.assertEqual(len(stripe.charges), 1)
+        self.assertEqual(
+            list(CaptureAttempt.objects.order_by('pk').values_list('status', flat=True)), ['declined', 'succeeded'])
+        keys = CaptureAttempt.objects.values_list('idempotency_key', flat=True)
+        self.assertEqual(len(set(keys)), 2)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, 'paid')
+
+
+@patch('billing.tasks.group', run_group_inline)
+class TestRefundBatch(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory(stripe_private_key="sk_test_fake")
+        self.event = RegistrationEventFactory(league=self.league)
+        self.billing_period = BillingPeriodFactory(event=self.event, league=self.league)
+        self.other_period = BillingPeriodFactory(event=self.event, league=self.league)
+        self.admin = UserFactory(league=self.league, organization=self.league.organization)
+
+    def pay(self, invoices, processor='stripe'):
+        user = invoices[0].user
+        payment = Payment.objects.create(
+            user=user,
+            league=self.league,
+            processor=processor,
+            transaction_id="ch_{}".format(user.pk) if processor == 'stripe' else "",
+            amount=sum(invoice.invoice_amount for invoice in invoices),
+            payment_date=timezone.now(),
+        )
+        for invoice in invoices:
+            invoice.status = 'paid'
+            invoice.paid_amount = invoice.invoice_amount
+            invoice.payment = payment
+            invoice.paid_date = payment.payment_date
+            invoice.save()
+        return payment
+
+    def create_invoice(self, user, billing_period=None, amount=25):
+        return Invoice.objects.create(
+            user=user,
+            league=self.league,
+            billing_period=billing_period or self.billing_period,
+            invoice_amount=amount,
+            invoice_date=timezone.now(),
+            due_date=timezone.now(),
+        )
+
+    def create_user(self):
+        return UserFactory(league=self.league, organization=self.league.organization)
+
+    def create_batch(self, **kwargs):
+        return RefundBatch.objects.create(
+            league=self.league, requested_by=self.admin, refund_reason="Cancelled", **kwargs)
+
+    def test_refund_billing_period(self):
+        card_user, cash_user, both_user, failing_user = [self.create_user() for i in range(4)]
+        card_payment = self.pay([self.create_invoice(card_user)])
+        cash_payment = self.pay([self.create_invoice(cash_user, amount=40)], processor='cash')
+        # One payment for both periods, only this period's share is refunded.
+        both_payment = self.pay([
+            self.create_invoice(both_user),
+            self.create_invoice(both_user, billing_period=self.other_period, amount=10),
+        ])
+        self.pay([self.create_invoice(failing_user)])
+        self.create_invoice(self.create_user())
+
+        batch = self.create_batch(event=self.event, billing_period=self.billing_period)
+        with FakeStripe(fail_refund_charges=["ch_{}".format(failing_user.pk)]) as stripe:
+            refund_batch(batch.pk)
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, 'completed')
+        self.assertEqual((batch.payment_count, batch.refunded_count, batch.failed_count), (4, 3, 1))
+        self.assertEqual(batch.refunded_amount, Decimal('90.00'))
+        self.assertIn("InvalidRequestError", batch.errors)
+        self.assertTrue(batch.completed_date)
+
+        # Cash payments are only recorded, not sent to Stripe.
+        self.assertEqual(sorted(refund.amount for refund in stripe.refunds), [2500, 2500])
+        self.assertEqual(
+            {refund.idempotency_key for refund in stripe.refunds},
+            {get_batch_refund_idempotency_key(batch.pk, payment.pk) for payment in [card_payment, both_payment]},
+        )
+
+        for payment, refunded in [(card_payment, '25.00'), (cash_payment, '40.00'), (both_payment, '25.00')]:
+            payment.refresh_from_db()
+            self.assertEqual(payment.refund_amount, Decimal(refunded))
+            self.assertEqual(payment.refund_reason, "Cancelled")
+        self.assertEqual(Invoice.objects.get(user=both_user, billing_period=self.other_period).status, 'paid')
+        self.assertEqual(Invoice.objects.get(user=failing_user).status, 'paid')
+        self.assertEqual(Invoice.objects.filter(status='refunded').count(), 3)
+
+    def test_retry_does_not_refund_twice(self):
+        user = self.create_user()
+        payment = self.pay([self.create_invoice(user)])
+        batch = self.create_batch(event=self.event)
+
+        with FakeStripe() as stripe:
+            refund_batch(batch.pk)
+            payments = [[payment.pk, list(Invoice.objects.filter(payment=payment).values_list('pk', flat=True))]]
+            refund_batch_payments(batch.pk, payments)
+
+        self.assertEqual(len(stripe.refunds), 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.refund_amount, Decimal('25.00'))
+
+    def test_refund_is_atomic(self):
+        user = self.create_user()
+        payment = self.pay([self.create_invoice(user), self.create_invoice(user)])
+
+        with FakeStripe(), patch('billing.invoicing.record_invoice_changes', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                payment.refund(Decimal('30'))
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.refund_amount, 0)
+        self.assertEqual(Invoice.objects.filter(status='paid').count(), 2)
+
+    def test_partial_refund_allocation(self):
+        user = self.create_user()
+        payment = self.pay([self.create_invoice(user), self.create_invoice(user)])
+
+        with FakeStripe() as stripe:
+            payment.refund(Decimal('30'))
+
+        self.assertEqual(
+            list(Invoice.objects.filter(payment=payment).order_by('pk').values_list('status', 'refunded_amount')),
+            [('refunded', Decimal('25.00')), ('refunded', Decimal('5.00'))],
+        )
+        self.assertEqual(stripe.refunds[0].amount, 3000)
+
+    def test_second_partial_refund_allocation(self):
+        user = self.create_user()
+        payment = self.pay([self.create_invoice(user), self.create_invoice(user)])
+
+        with FakeStripe() as stripe:
+            payment.refund(Decimal('5'))
+            self.assertEqual(
+                list(Invoice.objects.filter(payment=payment).order_by('pk').values_list('status', 'refunded_amount')),
+                [('refunded', Decimal('5.00')), ('paid', Decimal('0.00'))],
+            )
+            payment.refund(Decimal('25'))
+            payment.refund(Decimal('20'))
+
+        self.assertEqual(
+            list(Invoice.objects.filter(payment=payment).order_by('pk').values_list('status', 'refunded_amount')),
+            [('refunded', Decimal('25.00')), ('refunded', Decimal('25.00'))],
+        )
+        payment.refresh_from_db()
+        self.assertEqual(payment.refund_amount, Decimal('50.00'))
+        self.assertEqual([refund.amount for refund in stripe.refunds], [500, 2500, 2000])
+        with self.assertRaises(ValueError):
+            payment.refund(Decimal('1'))
+
+    def test_refused_refund_taken_back_off(self):
+        user = self.create_user()
+        payment = self.pay([self.create_invoice(user), self.create_invoice(user)])
+
+        with FakeStripe() as stripe:
+            payment.refund(Decimal('5'), refund_reason="Partial")
+        first_refund_date = Payment.objects.get(pk=payment.pk).refund_date
+        invoices_before = list(Invoice.objects.filter(payment=payment).order_by('pk').values_list(
+            'status', 'refund_date', 'refunded_amount'))
+
+        def refuse_refund(**kwargs):
+            # The refund is saved before Stripe is asked for it.
+            self.assertEqual(Payment.objects.get(pk=payment.pk).refund_amount, Decimal('35.00'))
+            stripe.create_refund(**kwargs)
+
+        with FakeStripe(fail_refund_charges=[payment.transaction_id]) as stripe, \
+                patch('stripe.Refund.create', side_effect=refuse_refund):
+            with self.assertRaises(InvalidRequestError):
+                payment.refund(Decimal('30'), refund_reason="Cancelled")
+
+        payment.refresh_from_db()
+        self.assertEqual(
+            (payment.refund_amount, payment.refund_date, payment.refund_reason),
+            (Decimal('5.00'), first_refund_date, "Partial"),
+        )
+        self.assertEqual(
+            list(Invoice.objects.filter(payment=payment).order_by('pk').values_list(
+                'status', 'refund_date', 'refunded_amount')),
+            invoices_before,
+        )
+
+    def test_admin_view_starts_batch(self):
+        admin = OrgAdminUserFactory()
+        self.client.login(email=admin.email, password=user_password)
+        event = RegistrationEventFactory(league=admin.league)
+        billing_period = BillingPeriodFactory(event=event, league=admin.league)
+
+        with patch('billing.views_admin.refund_batch.delay'):
+            response = self.client.post(reverse('billing:billing_admin_refund_batches'), {
+                'billing_period': billing_period.pk,
+                'refund_reason': "Rained out",
+                'confirm': 'on',
+            })
+        batch = RefundBatch.objects.get()
+        self.assertRedirects(response, reverse('billing:billing_admin_refund_batch', kwargs={'pk': batch.pk}))
+        self.assertEqual(batch.event, event)
+        self.assertEqual(batch.requested_by, admin)
+
+        response = self.client.get(reverse('billing:billing_admin_refund_batch', kwargs={'pk': batch.pk}))
+        self.assertContains(response, "Rained out")
@@ -1,3 +1,7 @@
+from stripe.error import CardError, InvalidRequestError
+from types import SimpleNamespace
+from unittest.mock import patch
+
 from .factories import LeagueFactory, UserFactory
 
 
@@ -13,4 +17,72 @@ class BillingAppTestCase(object):
             self.user.delete()
         if self.league:
             self.league.delete()
-                
+
+
+class FakeStripe(object):
+    # Stands in for the Stripe API during tests. Use as a context manager, it
+    # patches the Stripe calls UserStripeCard.charge makes and records them.
+    def __init__(self, decline_customers=[], fail_refund_charges=[]):
+        self.decline_customers = decline_customers
+        self.fail_refund_charges = fail_refund_charges
+        self.charges = []
+        self.declined_keys = []
+        self.refunds = []
+        self.patches = [
+            patch('stripe.Charge.create', side_effect=self.create_charge),
+            patch('stripe.BalanceTransaction.retrieve', side_effect=self.retrieve_balance),
+            patch('stripe.Refund.create', side_effect=self.create_refund),
+        ]
+
+    def __enter__(self):
+        for p in self.patches:
+            p.start()
+        return self
+
+    def __exit__(self, *args):
+        for p in self.patches:
+            p.stop()
+
+    def create_charge(self, amount, currency, customer, description, idempotency_key=None, **kwargs):
+        # Stripe replays the original response for a repeated idempotency key,
+        # declines included.
+        if customer in self.decline_customers or (idempotency_key and idempotency_key in self.declined_keys):
+            if idempotency_key:
+                self.declined_keys.append(idempotency_key)
+            raise CardError("Your card was declined.", None, "card_declined")
+
+        for charge in self.charges:
+            if idempotency_key and charge.idempotency_key == idempotency_key:
+                return charge
+
+        charge = SimpleNamespace(
+            id="ch_fake_{}".format(len(self.charges) + 1),
+            amount=amount,
+            customer=customer,
+            description=description,
+            idempotency_key=idempotency_key,
+            balance_transaction="txn_fake_{}".format(len(self.charges) + 1),
+            source=SimpleNamespace(brand="Visa", last4="4242", exp_month=12, exp_year=2030),
+        )
+        self.charges.append(charge)
+        return charge
+
+    def retrieve_balance(self, balance_id, **kwargs):
+        return SimpleNamespace(id=balance_id, fee=30)
+
+    def create_refund(self, charge, amount, idempotency_key=None, **kwargs):
+        if charge in self.fail_refund_charges:
+            raise InvalidRequestError("Charge {} has already been refunded.".format(charge), None)
+
+        for refund in self.refunds:
+            if idempotency_key and refund.idempotency_key == idempotency_key:
+                return refund
+
+        refund = SimpleNamespace(
+            id="re_fake_{}".format(len(self.refunds) + 1),
+            charge=charge,
+            amount=amount,
+            idempotency_key=idempotency_key,
+        )
+        self.refunds.append(refund)
+        return refund
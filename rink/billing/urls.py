@@ -6,6 +6,10 @@ from . import views_admin
 app_name = 'billing'
 urlpatterns = [
     path('admin', views_admin.BillingAdminView.as_view(), name="billing_admin"),
+    path('admin/dashboard', views_admin.BillingDashboardView.as_view(), name="billing_dashboard"),
+    path('admin/refunds', views_admin.BillingAdminRefundBatchesView.as_view(), name="billing_admin_refund_batches"),
+    path('admin/refunds/<int:pk>', views_admin.BillingAdminRefundBatchView.as_view(),
+         name="billing_admin_refund_batch"),
     path('admin/<int:pk>', views_admin.BillingAdminDetailView.as_view(), name="billing_admin_detail"),
     path('admin/<int:pk>/payment',
         views_admin.BillingAdminAddPaymentView.as_view(), name="billing_admin_add_payment"),
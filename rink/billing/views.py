@@ -6,6 +6,7 @@ from django.views import View
 
 from .forms import UpdateStripeCardForm, PayNowForm
 from .models import UserStripeCard, Invoice, BillingPeriod
+from .resolvers import InvoiceAmountResolver
 from league.models import League
 
 from stripe.error import CardError
@@ -34,8 +35,9 @@ class PayView(LoginRequiredMixin, View):
             invoice_date__gte=timezone.now(),
         )
 
+        amounts = InvoiceAmountResolver.for_league(league)
         for invoice in future_invoices:
-            invoice.invoice_amount = invoice.get_invoice_amount(user=request.user)
+            invoice.invoice_amount = amounts.get_invoice_amount(invoice, user=request.user)
 
         return render(request, self.template_name, {
             'invoices': invoices,
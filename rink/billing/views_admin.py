@@ -1,22 +1,27 @@
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import render, redirect, get_object_or_404, reverse
 from django.utils import timezone
 from django.views import View
-from django.views.generic import DetailView, UpdateView, FormView
+from django.views.generic import DetailView, UpdateView, FormView, TemplateView
 
-from .forms import InvoiceFilterForm, QuickPaymentForm, QuickInvoiceForm, QuickRefundForm
-from .models import Invoice
+from .ledger import get_ledger_summary
+from .forms import InvoiceFilterForm, QuickPaymentForm, QuickInvoiceForm, QuickRefundForm, RefundBatchForm
+from .models import Invoice, RefundBatch
 from .tables import InvoiceTable
+from .tasks import refund_batch
 from league.mixins import RinkLeagueAdminPermissionRequired
+from rink.utils.pagination import KeysetTableMixin
 
 from django_tables2 import SingleTableView
 
 
-class BillingAdminView(RinkLeagueAdminPermissionRequired, SingleTableView):
+class BillingAdminView(RinkLeagueAdminPermissionRequired, KeysetTableMixin, SingleTableView):
     template_name = "billing/billing_admin.html"
     table_class = InvoiceTable
     paginate_by = 50
+    keyset_estimate_count = True
 
     def dispatch(self, request, *args, **kwargs):
         data = None
@@ -58,7 +63,7 @@ class BillingAdminView(RinkLeagueAdminPermissionRequired, SingleTableView):
         elif q_search:
             q_all &= q_search
 
-        return Invoice.objects.filter(q_all).distinct()
+        return Invoice.objects.filter(q_all).select_related('user')
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
@@ -67,6 +72,21 @@ class BillingAdminView(RinkLeagueAdminPermissionRequired, SingleTableView):
         return context
 
 
+class BillingDashboardView(RinkLeagueAdminPermissionRequired, TemplateView):
+    # Receivables at a glance, read from the invoice ledger rather than the invoices.
+    template_name = "billing/billing_dashboard.html"
+    months_shown = 24
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        summary = get_ledger_summary(self.request.session['view_league'])
+        context['totals'] = summary['totals']
+        context['months'] = summary['months'][:self.months_shown]
+        context['events'] = summary['events']
+        context['periods'] = summary['periods']
+        return context
+
+
 class BillingAdminDetailView(RinkLeagueAdminPermissionRequired, DetailView):
     template_name = "billing/billing_admin_detail.html"
     model = Invoice
@@ -146,3 +166,36 @@ class BillingAdminEditInvoiceView(RinkLeagueAdminPermissionRequired, BillingAdmi
         else:
             messages.error(request, form.errors)
         return self.get_invoice_admin_url(kwargs['pk'])
+
+
+class BillingAdminRefundBatchesView(RinkLeagueAdminPermissionRequired, FormView):
+    # Refund everything paid for an event or billing period, eg. when it's
+    # cancelled. The refunds run in the background, see tasks.refund_batch.
+    template_name = "billing/refund_batches.html"
+    form_class = RefundBatchForm
+
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'league': self.league}
+
+    def form_valid(self, form):
+        batch = form.save(commit=False)
+        batch.league = self.league
+        batch.requested_by = self.request.user
+        batch.save()
+        transaction.on_commit(lambda: refund_batch.delay(batch.pk))
+        messages.success(self.request, "Refunds for {} started.".format(batch.billing_period or batch.event))
+        return redirect('billing:billing_admin_refund_batch', pk=batch.pk)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['batches'] = RefundBatch.objects.filter(league=self.league).select_related(
+            'event', 'billing_period', 'requested_by')[:20]
+        return context
+
+
+class BillingAdminRefundBatchView(RinkLeagueAdminPermissionRequired, DetailView):
+    template_name = "billing/refund_batch.html"
+    context_object_name = "batch"
+
+    def get_queryset(self):
+        return RefundBatch.objects.filter(league=self.league).select_related('event', 'billing_period', 'requested_by')
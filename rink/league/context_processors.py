@@ -1,6 +1,6 @@
 from django.conf import settings
 
-from league.models import League
+from league.middleware import get_request_league
 from registration.models import RegistrationEvent
 
 
@@ -22,12 +22,7 @@ def league_processor(request):
         pass
 
     if not league:
-        league_id = request.session.get('view_league', None)
-        if league_id:
-            try:
-                league = League.objects.get(pk=league_id)
-            except League.DoesNotExist:
-                pass
+        league = get_request_league(request)
 
     return {'league_template': league, }
 
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from league.models import LeagueMembership
+from roster.search import refresh_search_entries
+
+
+class Command(BaseCommand):
+    help = "Build the league membership table from guardian's league permissions, fixing any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report changes without saving them.")
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        expected = {
+            key: ",".join(sorted(codenames))
+            for key, codenames in LeagueMembership.get_league_permissions().items()
+        }
+        existing = {
+            (user_id, league_id): (pk, permissions)
+            for pk, user_id, league_id, permissions in LeagueMembership.objects.values_list(
+                'pk', 'user_id', 'league_id', 'permissions')
+        }
+
+        created = [
+            LeagueMembership(user_id=user_id, league_id=league_id, permissions=permissions)
+            for (user_id, league_id), permissions in expected.items()
+            if (user_id, league_id) not in existing
+        ]
+        updated = [
+            (pk, expected[key]) for key, (pk, permissions) in existing.items()
+            if key in expected and expected[key] != permissions
+        ]
+        removed = [pk for key, (pk, permissions) in existing.items() if key not in expected]
+
+        if not options['dry_run']:
+            LeagueMembership.objects.bulk_create(created, batch_size=500)
+            for pk, permissions in updated:
+                LeagueMembership.objects.filter(pk=pk).update(permissions=permissions)
+            LeagueMembership.objects.filter(pk__in=removed).delete()
+
+            # bulk_create skips the signals that add new members to the
+            # roster search index.
+            for league_id in {membership.league_id for membership in created}:
+                refresh_search_entries(league_id)
+
+        self.stdout.write("{} created, {} updated, {} removed.".format(len(created), len(updated), len(removed)))
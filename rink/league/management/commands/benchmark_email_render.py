@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+
+from bs4 import BeautifulSoup
+import time
+
+from league.models import League
+from league.utils import build_email, clear_email_cache, render_email_header_footer
+
+
+class Command(BaseCommand):
+    help = "Compare the per-message cost of rendering league emails, uncached vs cached. Nothing is sent."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', help="League slug, defaults to the first league.")
+        parser.add_argument('--template', default='test_email', help="Email template name.")
+        parser.add_argument('--messages', type=int, default=500, help="Number of messages to render.")
+
+    def handle(self, *args, **options):
+        if options['league']:
+            league = League.objects.filter(slug=options['league']).first()
+        else:
+            league = League.objects.first()
+        if not league:
+            raise CommandError("No league found to render emails for.")
+
+        template = options['template']
+        count = options['messages']
+        to_email = "benchmark@example.com"
+
+        def render_uncached():
+            # What send_email did for every message before templates and the
+            # header/footer were cached.
+            context = {'league': league, 'url_domain': settings.URL_DOMAIN}
+            context['header_html'] = render_to_string('email/header_default.html', context)
+            context['footer_html'] = render_to_string('email/footer_default.html', context)
+            render_to_string('email/{}.subject'.format(template), context)
+            message_html = render_to_string('email/{}.html'.format(template), context)
+            BeautifulSoup(message_html, "html.parser").get_text("\n", strip=True)
+
+        def render_cached():
+            build_email(league, template, to_email, {}, header_footer=render_email_header_footer(league))
+
+        clear_email_cache(league)
+        results = []
+        for name, render in (("uncached", render_uncached), ("cached", render_cached)):
+            start = time.perf_counter()
+            for i in range(0, count):
+                render()
+            elapsed = time.perf_counter() - start
+            results.append(elapsed)
+            self.stdout.write("{:>10}: {:8.3f} ms/message ({} messages in {:.2f}s)".format(
+                name, elapsed / count * 1000, count, elapsed))
+
+        self.stdout.write("Speedup: {:.1f}x".format(results[0] / results[1]))
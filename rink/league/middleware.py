@@ -0,0 +1,44 @@
+from django.utils.functional import SimpleLazyObject
+
+from league.models import Organization
+from league.utils import get_cached_league
+
+
+def get_request_league(request):
+    # The league being viewed, from the session. Looked up once per request
+    # and shared by the permission mixins, views and context processors.
+    if not hasattr(request, '_cached_league'):
+        league_id = request.session.get('view_league', None) if hasattr(request, 'session') else None
+        request._cached_league = get_cached_league(league_id) if league_id else None
+    return request._cached_league
+
+
+def get_request_organization(request):
+    if not hasattr(request, '_cached_organization'):
+        organization = None
+        organization_id = request.session.get('view_organization', None) if hasattr(request, 'session') else None
+        league = get_request_league(request)
+        if league and league.organization_id == organization_id:
+            organization = league.organization
+        elif organization_id:
+            organization = Organization.objects.filter(pk=organization_id).first()
+        request._cached_organization = organization
+    return request._cached_organization
+
+
+def clear_request_league(request):
+    # For when the session's league changes partway through a request.
+    for attr in ('_cached_league', '_cached_organization'):
+        if hasattr(request, attr):
+            delattr(request, attr)
+
+
+class LeagueMiddleware(object):
+    # Adds lazily loaded request.league and request.organization.
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.league = SimpleLazyObject(lambda: get_request_league(request))
+        request.organization = SimpleLazyObject(lambda: get_request_organization(request))
+        return self.get_response(request)
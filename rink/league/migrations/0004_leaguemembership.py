@@ -0,0 +1,29 @@
+# Generated by Django 2.1.5 on 2026-10-18 01:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('league', '0003_auto_20180904_1548'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeagueMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('permissions', models.CharField(blank=True, max_length=255)),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='league.League')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='leaguemembership',
+            unique_together={('user', 'league')},
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def backfill_league_memberships(apps, schema_editor):
+    # Everything that reads league members goes through LeagueMembership, so
+    # fill it from guardian's league permissions before the code that syncs it
+    # takes over. backfill_league_memberships fixes any later drift.
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    League = apps.get_model('league', 'League')
+    LeagueMembership = apps.get_model('league', 'LeagueMembership')
+
+    content_type = ContentType.objects.filter(app_label='league', model='league').first()
+    if content_type is None:
+        # A new database, nobody has permissions yet.
+        return
+
+    # Guardian's object_pk isn't a foreign key, skip permissions left behind
+    # by deleted leagues.
+    league_ids = set(League.objects.values_list('pk', flat=True))
+    memberships = {}
+    permissions = UserObjectPermission.objects.filter(content_type=content_type).values_list(
+        'user_id', 'object_pk', 'permission__codename')
+    for user_id, league_id, codename in permissions:
+        if int(league_id) in league_ids:
+            memberships.setdefault((user_id, int(league_id)), set()).add(codename)
+
+    LeagueMembership.objects.bulk_create([
+        LeagueMembership(user_id=user_id, league_id=league_id, permissions=",".join(sorted(codenames)))
+        for (user_id, league_id), codenames in memberships.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('guardian', '0001_initial'),
+        ('league', '0004_leaguemembership'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_league_memberships, migrations.RunPython.noop),
+    ]
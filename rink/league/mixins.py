@@ -1,7 +1,10 @@
 from django.core.exceptions import PermissionDenied, ImproperlyConfigured
-from django.shortcuts import render, get_object_or_404
+from django.http import Http404
+from django.shortcuts import render
 
-from league.models import Organization, League
+from league.middleware import get_request_league, get_request_organization
+from users.models import set_rink_session_permissions
+from users.permissions import get_permission_versions, get_rink_permissions
 
 
 class RinkOrgAdminPermissionRequired(object):
@@ -11,18 +14,31 @@ class RinkOrgAdminPermissionRequired(object):
     league_permissions = []
 
     def dispatch(self, request, *args, **kwargs):
-        try:
-            self.organization = get_object_or_404(Organization, pk=request.session['view_organization'])
-            self.league = get_object_or_404(League, pk=request.session['view_league'])
-        except KeyError:
+        if 'view_organization' not in request.session or 'view_league' not in request.session:
             raise PermissionDenied
 
+        self.organization = get_request_organization(request)
+        self.league = get_request_league(request)
+        if not self.organization or not self.league:
+            raise Http404
+
+        if not request.user.is_authenticated:
+            raise PermissionDenied
+
+        # Checked against the cached permission snapshot rather than the
+        # session copy, so revoked permissions stop working straight away.
+        permissions = get_rink_permissions(request.user, self.league)
+        if request.session.get('permission_versions') != list(get_permission_versions(request.user)):
+            # Permissions changed since they were put in the session, refresh
+            # the copy the templates use for the nav.
+            set_rink_session_permissions(request.user, request, self.league)
+
         combined_organization_permissions = self._base_organization_permissions + self.organization_permissions
         combined_league_permissions = self._base_league_permissions + self.league_permissions
 
         # https://stackoverflow.com/questions/24270711/checking-if-two-lists-share-at-least-one-element
-        if any(x in combined_organization_permissions for x in request.session['organization_permissions']) \
-                or any(x in combined_league_permissions for x in request.session['league_permissions']):
+        if any(x in combined_organization_permissions for x in permissions['organization_permissions']) \
+                or any(x in combined_league_permissions for x in permissions['league_permissions']):
             return super(RinkOrgAdminPermissionRequired, self).dispatch(request, *args, **kwargs)
 
         raise PermissionDenied
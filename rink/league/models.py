@@ -1,15 +1,19 @@
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models
-from django.db.models.signals import pre_save
+from django.db import models, transaction
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.text import slugify
 
 from fernet_fields import EncryptedCharField
+from guardian.models import UserObjectPermission
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill, ResizeToFit
 from localflavor.us.us_states import STATE_CHOICES
 
+from league.utils import bump_league_version, clear_email_cache
+
 DAY_OF_MONTH_CHOICES = [(i,i) for i in range(1, 31)]
 INVOICE_DAY_CHOICES = [(i, '{} days before due date'.format(i)) for i in range(1, 21)]
 LATE_DAY_CHOICES = [(i, '{} days after due date'.format(i)) for i in range(1, 21)]
@@ -287,9 +291,101 @@ class League(models.Model):
         raise ImproperlyConfigured("Stripe public key not set for {}".format(self.name))
 
 
+class LeagueMembership(models.Model):
+    """
+    Everyone with a permission on a league, and which permissions they have.
+
+    A copy of guardian's object permissions for leagues, kept in sync by the
+    UserObjectPermission handlers below, so "who is in this league" is a plain
+    indexed join instead of a generic permission lookup.
+    """
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+    )
+
+    league = models.ForeignKey(
+        'league.League',
+        on_delete=models.CASCADE,
+    )
+
+    # Comma separated permission codenames, eg. "league_admin,league_member"
+    permissions = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        unique_together = ['user', 'league']
+
+    def __str__(self):
+        return "{} - {}".format(self.league, self.user)
+
+    @property
+    def permission_list(self):
+        return self.permissions.split(",") if self.permissions else []
+
+    @classmethod
+    def get_league_permissions(cls, user_ids=None, league_ids=None):
+        # {(user_id, league_id): set of codenames} from guardian's tables.
+        permissions = UserObjectPermission.objects.filter(
+            content_type=ContentType.objects.get_for_model(League),
+        )
+        if user_ids is not None:
+            permissions = permissions.filter(user_id__in=user_ids)
+        if league_ids is not None:
+            permissions = permissions.filter(object_pk__in=[str(pk) for pk in league_ids])
+
+        memberships = {}
+        for user_id, league_id, codename in permissions.values_list('user_id', 'object_pk', 'permission__codename'):
+            memberships.setdefault((user_id, int(league_id)), set()).add(codename)
+        return memberships
+
+    @classmethod
+    def sync(cls, user_id, league_id, create=True):
+        # create=False only updates or removes an existing membership, for
+        # deletes that may be cascading from the user or league itself.
+        codenames = cls.get_league_permissions([user_id], [league_id]).get((user_id, league_id))
+        memberships = cls.objects.filter(user_id=user_id, league_id=league_id)
+        if not codenames:
+            memberships.delete()
+        elif create:
+            cls.objects.update_or_create(
+                user_id=user_id,
+                league_id=league_id,
+                defaults={'permissions': ",".join(sorted(codenames))},
+            )
+        else:
+            memberships.update(permissions=",".join(sorted(codenames)))
+
+
 @receiver(pre_save, sender=Organization)
 @receiver(pre_save, sender=League)
 def my_callback(sender, instance, *args, **kwargs):
     if not instance.slug:
         instance.slug = slugify(instance.name)
-        
\ No newline at end of file
+
+
+def bump_league_version_on_commit(league_id):
+    # Once the change is committed, a league read before that would put the
+    # old version back in the cache.
+    transaction.on_commit(lambda: bump_league_version(league_id))
+
+
+@receiver(post_save, sender=League)
+def clear_league_email_cache(sender, instance, *args, **kwargs):
+    # Branding or email settings may have changed, render emails fresh.
+    clear_email_cache(instance)
+    bump_league_version_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Organization)
+def clear_organization_league_cache(sender, instance, *args, **kwargs):
+    # Cached leagues carry their organization along.
+    for league_id in League.objects.filter(organization=instance).values_list('pk', flat=True):
+        bump_league_version_on_commit(league_id)
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+def sync_league_membership(sender, instance, **kwargs):
+    # Catches every assign_perm/remove_perm on a league.
+    if instance.content_type_id == ContentType.objects.get_for_model(League).pk:
+        LeagueMembership.sync(instance.user_id, int(instance.object_pk), create=kwargs.get('created', False))
@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from unittest.mock import patch
+
+from .factories import LeagueFactory
+from league.utils import get_cached_league
+from roster.context_processors import roster_billing_badges
+from users.tests.factories import LeagueAdminUserFactory, user_password
+
+
+class TestLeagueCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.league = LeagueFactory()
+
+    def test_cached_until_saved(self):
+        self.assertEqual(get_cached_league(self.league.pk), self.league)
+        with self.assertNumQueries(0):
+            league = get_cached_league(self.league.pk)
+            league.organization
+
+        # Not until the save is committed, a league read before then would be
+        # cached again under the new version.
+        with patch('league.models.transaction.on_commit') as on_commit:
+            self.league.name = "Renamed"
+            self.league.save()
+        self.assertNotEqual(get_cached_league(self.league.pk).name, "Renamed")
+        for call in on_commit.call_args_list:
+            call[0][0]()
+        self.assertEqual(get_cached_league(self.league.pk).name, "Renamed")
+
+        with patch('league.models.transaction.on_commit', side_effect=lambda func: func()):
+            self.league.organization.name = "Renamed Organization"
+            self.league.organization.save()
+        self.assertEqual(get_cached_league(self.league.pk).organization.name, "Renamed Organization")
+
+    def test_missing_league(self):
+        self.assertIsNone(get_cached_league(0))
+
+    def test_admin_page_does_not_load_league(self):
+        user = LeagueAdminUserFactory(league=self.league, organization=self.league.organization)
+        self.client.login(email=user.email, password=user_password)
+        url = reverse('roster:list')
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['league_template'], self.league)
+        self.assertFalse([q for q in queries if 'FROM "league_league"' in q['sql']])
+        self.assertFalse([q for q in queries if 'FROM "league_organization"' in q['sql']])
+
+
+class TestRosterBillingBadges(TestCase):
+    def test_counts_are_lazy(self):
+        request = RequestFactory().get('/')
+        request.session = {'view_league': 1}
+        request.resolver_match = type('ResolverMatch', (), {'namespaces': ['roster'], 'kwargs': {'pk': 1}})
+
+        with self.assertNumQueries(0):
+            badges = roster_billing_badges(request)
+        with self.assertNumQueries(1):
+            self.assertIsNone(badges['unpaid_invoice_count']())
+            self.assertIsNone(badges['unpaid_invoice_count']())
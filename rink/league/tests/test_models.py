@@ -0,0 +1,56 @@
+from django.core.management import call_command
+from django.test import TestCase
+
+from guardian.shortcuts import assign_perm, remove_perm
+from io import StringIO
+
+from .factories import LeagueFactory
+from league.models import LeagueMembership
+from users.tests.factories import UserFactory, UserFactoryNoPermissions
+
+
+class TestLeagueMembership(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory()
+
+    def get_permissions(self, user):
+        return LeagueMembership.objects.get(user=user, league=self.league).permission_list
+
+    def test_synced_with_permissions(self):
+        user = UserFactory(league=self.league, organization=self.league.organization)
+        self.assertEqual(self.get_permissions(user), ['league_member'])
+
+        assign_perm('billing_manager', user, self.league)
+        self.assertEqual(self.get_permissions(user), ['billing_manager', 'league_member'])
+
+        remove_perm('league_member', user, self.league)
+        self.assertEqual(self.get_permissions(user), ['billing_manager'])
+
+        remove_perm('billing_manager', user, self.league)
+        self.assertFalse(LeagueMembership.objects.filter(user=user).exists())
+
+    def test_other_objects_ignored(self):
+        user = UserFactoryNoPermissions(league=self.league, organization=self.league.organization)
+        assign_perm('org_admin', user, self.league.organization)
+        self.assertFalse(LeagueMembership.objects.filter(user=user).exists())
+
+    def test_deleting_user(self):
+        user = UserFactory(league=self.league, organization=self.league.organization)
+        assign_perm('league_admin', user, self.league)
+        user.delete()
+        self.assertFalse(LeagueMembership.objects.exists())
+
+    def test_backfill_command(self):
+        member = UserFactory(league=self.league, organization=self.league.organization)
+        admin = UserFactory(league=self.league, organization=self.league.organization)
+        assign_perm('league_admin', admin, self.league)
+        LeagueMembership.objects.filter(user=member).delete()
+        LeagueMembership.objects.filter(user=admin).update(permissions="league_member")
+        stale = LeagueMembership.objects.create(user=UserFactoryNoPermissions(), league=self.league)
+
+        out = StringIO()
+        call_command('backfill_league_memberships', stdout=out)
+        self.assertIn("1 created, 1 updated, 1 removed.", out.getvalue())
+        self.assertEqual(self.get_permissions(member), ['league_member'])
+        self.assertEqual(self.get_permissions(admin), ['league_admin', 'league_member'])
+        self.assertFalse(LeagueMembership.objects.filter(pk=stale.pk).exists())
@@ -0,0 +1,36 @@
+from django.core import mail
+from django.test import TestCase
+
+from .factories import LeagueFactory
+from league.utils import html_to_text, render_email_header_footer, send_email
+
+
+class TestEmailRendering(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory(email_from_address="league@example.com")
+
+    def test_html_to_text(self):
+        html = """<html><head><style>p { color: red; }</style></head>
+            <body><div>  Hi &amp; welcome,</div>
+            <p>Here's your <a href="#">invite link</a>.</p><!-- comment -->
+            <script>var x = 1;</script></body></html>"""
+        self.assertEqual(html_to_text(html), "Hi & welcome,\nHere's your\ninvite link\n.")
+
+    def test_header_footer_rendered_until_branding_changes(self):
+        render_email_header_footer(self.league)
+        with self.assertNumQueries(0):
+            header, footer = render_email_header_footer(self.league)
+        self.assertIn(self.league.name, header)
+
+        # Changing branding on the league renders fresh ones
+        self.league.style_color_one = '#123456'
+        self.league.save()
+        header, footer = render_email_header_footer(self.league)
+        self.assertIn('#123456', header)
+
+    def test_send_email(self):
+        send_email(self.league, 'test_email', 'someone@example.com')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['someone@example.com'])
+        self.assertIn("Test email sent from Rink.", mail.outbox[0].body)
+        self.assertIn(self.league.name, mail.outbox[0].alternatives[0][0])
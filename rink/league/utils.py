@@ -1,10 +1,173 @@
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives
+from django.core.cache import cache
+from django.core.mail import get_connection, EmailMultiAlternatives
 from django.template.exceptions import TemplateDoesNotExist
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 
+from collections import OrderedDict
+from html.parser import HTMLParser
+import threading
 
-def send_email(league, template, to_email, context={}):
+
+# Compiled email templates keyed by template name.
+_email_template_cache = {}
+
+# Rendered header and footer HTML keyed by league id, along with the league
+# branding they were rendered with.
+_email_header_footer_cache = {}
+
+
+# Leagues (with their organization) keyed by id, least recently used first.
+# Each entry remembers the league's cache version so a save in any process
+# invalidates it everywhere. The same instance is handed to every request,
+# so it's read only: views that change a league load their own.
+LEAGUE_CACHE_SIZE = 64
+LEAGUE_VERSION_KEY = "league:version:{}"
+_league_cache = OrderedDict()
+_league_cache_lock = threading.Lock()
+
+
+def get_league_version(league_id):
+    version = cache.get(LEAGUE_VERSION_KEY.format(league_id))
+    if version is None:
+        version = 1
+        cache.add(LEAGUE_VERSION_KEY.format(league_id), version, None)
+    return version
+
+
+def bump_league_version(league_id):
+    key = LEAGUE_VERSION_KEY.format(league_id)
+    cache.add(key, 1, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+    with _league_cache_lock:
+        _league_cache.pop(league_id, None)
+
+
+def get_cached_league(league_id):
+    # Returns the league, or None if it doesn't exist.
+    from league.models import League
+
+    version = get_league_version(league_id)
+    with _league_cache_lock:
+        cached = _league_cache.get(league_id)
+        if cached and cached[0] == version:
+            _league_cache.move_to_end(league_id)
+            return cached[1]
+
+    try:
+        league = League.objects.select_related('organization').get(pk=league_id)
+    except League.DoesNotExist:
+        return None
+
+    with _league_cache_lock:
+        _league_cache[league_id] = (version, league)
+        _league_cache.move_to_end(league_id)
+        while len(_league_cache) > LEAGUE_CACHE_SIZE:
+            _league_cache.popitem(last=False)
+    return league
+
+
+def get_email_template(name):
+    # Returns the compiled template, or None if it doesn't exist.
+    if name in _email_template_cache:
+        return _email_template_cache[name]
+
+    try:
+        template = get_template('email/{}'.format(name))
+    except TemplateDoesNotExist:
+        template = None
+
+    # Keep picking up template edits while developing.
+    if not settings.DEBUG:
+        _email_template_cache[name] = template
+    return template
+
+
+def render_email_template(name, context):
+    template = get_email_template(name)
+    if template is None:
+        raise TemplateDoesNotExist('email/{}'.format(name))
+    return template.render(context)
+
+
+def get_email_branding(league):
+    # Everything from the league the header and footer templates use. If any
+    # of it changes the cached header and footer are rendered again.
+    return (
+        league.name,
+        league.logo.name if league.logo else '',
+        league.email_signature,
+        league.style_color_one,
+        league.style_color_two,
+        league.style_email_font,
+        settings.URL_DOMAIN,
+    )
+
+
+def render_email_header_footer(league):
+    # The header and footer only depend on the league, so they're rendered once
+    # and reused until the league's branding changes.
+    branding = get_email_branding(league)
+    cached = _email_header_footer_cache.get(league.pk)
+    if cached and cached[0] == branding:
+        return cached[1]
+
+    context = {
+        'league': league,
+        'url_domain': settings.URL_DOMAIN,
+    }
+    header_footer = (
+        render_email_template('header_default.html', context),
+        render_email_template('footer_default.html', context),
+    )
+    _email_header_footer_cache[league.pk] = (branding, header_footer)
+    return header_footer
+
+
+def clear_email_cache(league):
+    # Only drops this process's copy. Other processes compare the branding
+    # they rendered with against get_email_branding() and render again.
+    _email_header_footer_cache.pop(league.pk, None)
+
+
+class HTMLTextExtractor(HTMLParser):
+    # Pulls the text out of an email's HTML as it is fed in, one line per
+    # text node like BeautifulSoup's get_text("\n", strip=True) (minus script
+    # and style contents), without building a document tree for every message.
+    skip_tags = ('script', 'style')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skip_tags:
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.skip_tags and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        data = data.strip()
+        if data:
+            self.lines.append(data)
+
+
+def html_to_text(html):
+    parser = HTMLTextExtractor()
+    parser.feed(html)
+    parser.close()
+    return "\n".join(parser.lines)
+
+
+def build_email(league, template, to_email, context={}, header_footer=None, connection=None):
     context['league'] = league
     context['url_domain'] = settings.URL_DOMAIN
 
@@ -28,28 +191,23 @@ def send_email(league, template, to_email, context={}):
     #context['from_email'] = from_email
     #context['to_email'] = name, etc? 
 
-    # Get header HTML
+    # Get header and footer HTML
     #if league.email_header:
     #    context['header_html'] = league.email_header
     #else:
-    context['header_html'] = render_to_string('email/header_default.html', context)
+    if header_footer is None:
+        header_footer = render_email_header_footer(league)
+    context['header_html'], context['footer_html'] = header_footer
 
-    # Get footer HTML
-    #if league.email_footer:
-    #    context['footer_html'] = league.email_footer
-    #else:
-    context['footer_html'] = render_to_string('email/footer_default.html', context)
-
-    subject = render_to_string('email/{}.subject'.format(template), context)
-    message_html = render_to_string('email/{}.html'.format(template), context)
-    try:
-        message_txt = render_to_string('email/{}.txt'.format(template), context)
-    except TemplateDoesNotExist:
-        # By default we'll use BeautifulSoup for generating the text version
+    subject = render_email_template('{}.subject'.format(template), context)
+    message_html = render_email_template('{}.html'.format(template), context)
+    if get_email_template('{}.txt'.format(template)):
+        message_txt = render_email_template('{}.txt'.format(template), context)
+    else:
+        # By default we'll generate the text version from the HTML.
         # This kinda sucks, but otherwise we'll be creating raw text versions
         # of all the emails. Nobody really needs those anyway.... oh well.
-        from bs4 import BeautifulSoup
-        message_txt = BeautifulSoup(message_html, "html.parser").get_text("\n", strip=True)
+        message_txt = html_to_text(message_html)
 
     cc = None
     if league.email_cc_address:
@@ -62,7 +220,55 @@ def send_email(league, template, to_email, context={}):
         to=[to_email, ],
         reply_to=[from_email, ],
         cc=cc,
+        connection=connection,
     )
     msg.attach_alternative(message_html, "text/html")
-    msg.send(fail_silently=False)
+    return msg
+
+
+def send_email(league, template, to_email, context={}):
+    build_email(league, template, to_email, context).send(fail_silently=False)
 
+
+class EmailBatchError(Exception):
+    """
+    Raised by send_emails() when a message fails part way through a batch.
+    The first `sent` recipients got their email, `error` is what went wrong
+    with the next one.
+    """
+
+    def __init__(self, sent, error):
+        super().__init__(str(error))
+        self.sent = sent
+        self.error = error
+
+
+def send_emails(league, template, recipients):
+    """
+    Send the same email template to many people over one mail connection.
+
+    recipients is a list of (to_email, context) tuples. The league header and
+    footer are only rendered once for the whole batch. Messages go out in
+    order, one at a time, so if one fails an EmailBatchError says how many
+    were already delivered.
+    Returns the number of messages sent.
+    """
+    header_footer = render_email_header_footer(league)
+    connection = get_connection(fail_silently=False)
+    messages = [
+        build_email(league, template, to_email, context, header_footer=header_footer, connection=connection)
+        for to_email, context in recipients
+    ]
+    if not messages:
+        return 0
+
+    connection.open()
+    try:
+        for sent, message in enumerate(messages):
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                raise EmailBatchError(sent, e) from e
+    finally:
+        connection.close()
+    return len(messages)
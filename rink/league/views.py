@@ -15,7 +15,7 @@ from users.models import User
 
 from .forms import (LeagueNameForm, LeagueBillingForm, LeagueRegistrationForm,
     LeagueEmailForm, PermissionsForm, CreateRinkUserForm, LeagueBrandingForm)
-from .models import League, Organization, InsuranceType
+from .models import League, LeagueMembership, Organization, InsuranceType
 from .mixins import RinkOrgAdminPermissionRequired, RinkLeagueAdminPermissionRequired
 from billing.models import BillingGroup
 from league.utils import send_email
@@ -121,11 +121,16 @@ class OrganizationPermissionsView(RinkOrgAdminPermissionRequired, View):
             if permission.codename not in settings.RINK_PERMISSIONS_IGNORE:
                 league_permissions_filtered.append(permission.codename)
 
+        memberships = LeagueMembership.objects.filter(league__in=leagues).select_related('user').order_by(
+            'user__last_name', 'user__first_name')
+        league_users = {}
+        for membership in memberships:
+            permissions = [p for p in membership.permission_list if p in league_permissions_filtered]
+            if permissions:
+                league_users.setdefault(membership.league_id, {})[membership.user] = permissions
+
         for league in leagues:
-            league.users = get_users_with_perms(league, 
-                attach_perms=True,
-                only_with_perms_in=league_permissions_filtered
-            )
+            league.users = league_users.get(league.pk, {})
 
         return render(request, 'league/permissions_list.html', {
             'organization': organization,
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import RegistrationInvite, RegistrationEvent, RegistrationData, Roster
+from .models import RegistrationInvite, RegistrationEvent, RegistrationEventCounter, RegistrationData, Roster
 
 admin.site.register(RegistrationInvite)
 admin.site.register(RegistrationEvent)
 admin.site.register(RegistrationData)
-admin.site.register(Roster)
\ No newline at end of file
+admin.site.register(Roster)
+admin.site.register(RegistrationEventCounter)
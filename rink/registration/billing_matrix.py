@@ -0,0 +1,254 @@
+"""
+The billing periods x billing groups table on the event admin billing
+periods page. The whole matrix is read with two queries (periods, then
+amounts) and saved in one transaction: changed rows and amounts are written
+with one UPDATE each, missing amounts with one bulk INSERT.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import re
+
+from billing.models import BillingPeriod, BillingPeriodCustomPaymentAmount
+from billing.resolvers import InvoiceAmountResolver
+from rink.utils.bulk import bulk_update
+
+
+BILLING_PERIOD_DATE_FORMAT = '%m/%d/%y'
+BILLING_PERIOD_DATE_FIELDS = ('start_date', 'end_date', 'invoice_date', 'due_date')
+BILLING_PERIOD_FIELDS = ('name',) + BILLING_PERIOD_DATE_FIELDS
+
+# Dates that can't be moved once they've passed.
+BILLING_PERIOD_LOCKED_FIELDS = ('invoice_date', 'due_date')
+
+ROW_NAME_REGEX = re.compile(r'^name(_new)?(\d+)$')
+ROW_DELETE_REGEX = re.compile(r'^delete(\d+)$')
+
+
+class BillingPeriodRow(object):
+    """
+    One row of the submitted table. pk is None for new billing periods.
+    Fields that were missing or couldn't be read are None.
+    """
+
+    def __init__(self, suffix, pk=None):
+        self.suffix = suffix
+        self.pk = pk
+        self.values = {}
+        self.amounts = {}
+
+    @property
+    def is_new(self):
+        return self.pk is None
+
+
+class BillingMatrixForm(object):
+    """
+    Parses the posted table once. Problems are collected in errors (bad
+    values) and alerts (fields missing from the form) instead of raising.
+    """
+
+    def __init__(self, data, groups):
+        self.data = data
+        self.groups = list(groups)
+        self.rows = []
+        self.deleted_ids = []
+        self.errors = []
+        self.alerts = []
+        self.parse()
+
+    def parse(self):
+        for key in self.data:
+            name_match = ROW_NAME_REGEX.match(key)
+            delete_match = ROW_DELETE_REGEX.match(key)
+            if name_match:
+                if name_match.group(1):
+                    row = BillingPeriodRow('_new{}'.format(name_match.group(2)))
+                else:
+                    row = BillingPeriodRow(name_match.group(2), pk=int(name_match.group(2)))
+                if self.parse_row(row):
+                    self.rows.append(row)
+            elif delete_match:
+                self.deleted_ids.append(int(delete_match.group(1)))
+
+        # A deleted row is still in the form, don't update it as well.
+        self.rows = [row for row in self.rows if row.pk not in self.deleted_ids]
+
+    def parse_row(self, row):
+        name = self.data['name{}'.format(row.suffix)]
+        if row.is_new and name == "":
+            # Ignore new rows with a blank name.
+            return False
+        row.values['name'] = name
+        label = "'{}'".format(name) if name else "billing period #{}".format(row.pk)
+
+        for field in BILLING_PERIOD_DATE_FIELDS:
+            key = '{}{}'.format(field, row.suffix)
+            row.values[field] = None
+            try:
+                row.values[field] = datetime.strptime(self.data[key], BILLING_PERIOD_DATE_FORMAT).date()
+            except KeyError:
+                self.alerts.append("Field not found for {} when saving billing period. Field was '{}'.".format(
+                    label, key))
+            except ValueError as e:
+                self.errors.append("Invalid date specified for {} for {}. Value was '{}'. Error: {}".format(
+                    field.replace('_', ' '), label, self.data[key], str(e)))
+
+        for group in self.groups:
+            key = 'invoice_amount_group{}_{}'.format(group.pk, row.suffix.lstrip('_'))
+            row.amounts[group.pk] = None
+            try:
+                value = self.data[key].strip()
+                row.amounts[group.pk] = Decimal(value) if value else Decimal('0.00')
+            except KeyError:
+                self.alerts.append(
+                    "Field not found saving invoice amount for group '{}' in billing period {}. "
+                    "Field was supposed to be '{}'.".format(group.name, label, key))
+            except InvalidOperation:
+                self.errors.append(
+                    "Invalid decimal value found when saving invoice amount for group '{}' in "
+                    "billing period {}. Please check it and fix it.".format(group.name, label))
+        return True
+
+
+def load_billing_matrix(event, groups):
+    """
+    The event's billing periods, each with .amounts: its custom payment
+    amount for every group, in the order of groups. Missing amounts are
+    created as $0.00.
+    """
+    periods = list(BillingPeriod.objects.filter(event=event).order_by('start_date', 'pk'))
+    cells = {
+        (cell.period_id, cell.group_id): cell
+        for cell in BillingPeriodCustomPaymentAmount.objects.filter(period__event=event)
+    }
+
+    missing = []
+    for period in periods:
+        period.amounts = []
+        for group in groups:
+            cell = cells.get((period.pk, group.pk))
+            if cell is None:
+                cell = BillingPeriodCustomPaymentAmount(group=group, period=period, invoice_amount=Decimal('0.00'))
+                missing.append(cell)
+            period.amounts.append(cell)
+
+    if missing:
+        BillingPeriodCustomPaymentAmount.objects.bulk_create(missing)
+        InvoiceAmountResolver.invalidate_on_commit(event.league_id)
+    return periods
+
+
+def apply_billing_period_row(period, row, alerts):
+    # Copies the row's values onto period. True if anything changed.
+    changed = False
+    today = timezone.now().date()
+    for field in BILLING_PERIOD_FIELDS:
+        value = row.values.get(field)
+        if value is None or value == getattr(period, field):
+            continue
+        if field in BILLING_PERIOD_LOCKED_FIELDS and getattr(period, field) <= today:
+            alerts.append("You cannot update {} for '{}'. The date has already passed.".format(
+                field.replace('_', ' '), period))
+            continue
+        setattr(period, field, value)
+        changed = True
+    return changed
+
+
+def save_billing_matrix(event, form):
+    """
+    Writes the differences between the submitted table and the database.
+    Returns (new, updated, deleted) lists of billing periods, messages for
+    anything that couldn't be saved are added to the form's errors/alerts.
+    """
+    errors, alerts = form.errors, form.alerts
+    existing_ids = [row.pk for row in form.rows if not row.is_new]
+
+    with transaction.atomic():
+        periods = BillingPeriod.objects.filter(event=event).in_bulk(existing_ids + form.deleted_ids)
+        cells = {
+            (cell.period_id, cell.group_id): cell
+            for cell in BillingPeriodCustomPaymentAmount.objects.filter(period_id__in=existing_ids)
+        }
+
+        new_periods = []
+        changed_periods = []
+        updated_periods = []
+        changed_cells = []
+        new_cells = []
+
+        for row in form.rows:
+            if row.is_new:
+                period = BillingPeriod(event=event, league_id=event.league_id, **row.values)
+                label = "new row"
+            elif row.pk in periods:
+                period = periods[row.pk]
+                label = "billing period '{}'".format(period)
+            else:
+                errors.append("Not able to find Billing Period with ID #{}.".format(row.pk))
+                continue
+
+            period_changed = row.is_new or apply_billing_period_row(period, row, alerts)
+            try:
+                period.full_clean(exclude=['event', 'league'])
+            except ValidationError as e:
+                errors.append("Unable to validate and save {}. Error: {}".format(label, str(e)))
+                continue
+
+            if row.is_new:
+                # Usually a single row, saved on its own for the primary key.
+                period.save()
+                new_periods.append(period)
+            elif period_changed:
+                changed_periods.append(period)
+
+            cells_changed = False
+            for group in form.groups:
+                amount = row.amounts[group.pk]
+                if amount is None:
+                    continue
+                cell = cells.get((period.pk, group.pk))
+                if cell is None:
+                    cell = BillingPeriodCustomPaymentAmount(group=group, period=period)
+                elif cell.invoice_amount == amount:
+                    continue
+                cell.invoice_amount = amount
+
+                try:
+                    cell.clean()
+                except ValidationError as e:
+                    errors.append("Unable to validate and save invoice amount for group '{}' in {}. Error: {}".format(
+                        group.name, label, str(e)))
+                    continue
+
+                if cell.pk is None:
+                    new_cells.append(cell)
+                else:
+                    changed_cells.append(cell)
+                cells_changed = True
+
+            if not row.is_new and (period_changed or cells_changed):
+                updated_periods.append(period)
+
+        deleted_periods = []
+        for pk in form.deleted_ids:
+            if pk in periods:
+                deleted_periods.append(periods[pk])
+            else:
+                errors.append("Not able to find Billing Period with ID #{}.".format(pk))
+
+        bulk_update(changed_periods, BILLING_PERIOD_FIELDS)
+        bulk_update(changed_cells, ['invoice_amount'])
+        BillingPeriodCustomPaymentAmount.objects.bulk_create(new_cells)
+        if deleted_periods:
+            BillingPeriod.objects.filter(pk__in=[period.pk for period in deleted_periods]).delete()
+
+    # The bulk writes skip the signals that clear the cached amounts.
+    if new_cells or changed_cells:
+        InvoiceAmountResolver.invalidate_on_commit(event.league_id)
+
+    return new_periods, updated_periods, deleted_periods
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .medical import bump_medical_pdf_version
+from .models import RegistrationData, RegistrationEvent, RegistrationEventCounter, RegistrationInvite, Roster
+from users.models import User
+
+
+def bump_medical_pdf_version_on_commit(event_id):
+    # Bumped any earlier, a PDF of the data from before the change could be
+    # built and cached under the new version.
+    transaction.on_commit(lambda: bump_medical_pdf_version(event_id))
+
+
+@receiver(post_save, sender=Roster)
+@receiver(post_delete, sender=Roster)
+@receiver(post_save, sender=RegistrationData)
+@receiver(post_delete, sender=RegistrationData)
+def invalidate_medical_pdf(sender, instance, **kwargs):
+    if instance.event_id:
+        bump_medical_pdf_version_on_commit(instance.event_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_medical_pdf_for_user(sender, instance, created, update_fields=None, **kwargs):
+    # Names on the medical sheets come from the user. Logging in only
+    # touches last_login, skip that.
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    for event_id in Roster.objects.filter(user=instance, event__isnull=False).values_list('event_id', flat=True):
+        bump_medical_pdf_version_on_commit(event_id)
+
+
+@receiver(post_save, sender=RegistrationEvent)
+def create_event_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        RegistrationEventCounter.objects.get_or_create(event=instance)
+
+
+# The counters are adjusted by comparing each row against what it looked like
+# when it was loaded, so a save that doesn't move it between events (or
+# complete an invite) costs nothing.
+
+@receiver(post_init, sender=Roster)
+def remember_roster_event(sender, instance, **kwargs):
+    instance._counted_event_id = instance.event_id if instance.pk else None
+
+
+@receiver(post_save, sender=Roster)
+def count_roster_save(sender, instance, raw=False, **kwargs):
+    if raw or instance._counted_event_id == instance.event_id:
+        return
+    RegistrationEventCounter.adjust(instance._counted_event_id, roster_count=-1)
+    RegistrationEventCounter.adjust(instance.event_id, roster_count=1)
+    instance._counted_event_id = instance.event_id
+
+
+@receiver(post_delete, sender=Roster)
+def count_roster_delete(sender, instance, **kwargs):
+    RegistrationEventCounter.adjust(instance._counted_event_id, roster_count=-1)
+
+
+def get_invite_counter_field(completed):
+    return 'invites_completed_count' if completed else 'invites_pending_count'
+
+
+@receiver(post_init, sender=RegistrationInvite)
+def remember_invite_state(sender, instance, **kwargs):
+    if instance.pk:
+        instance._counted_state = (instance.event_id, instance.completed_date is not None)
+    else:
+        instance._counted_state = None
+
+
+@receiver(post_save, sender=RegistrationInvite)
+def count_invite_save(sender, instance, raw=False, **kwargs):
+    state = (instance.event_id, instance.completed_date is not None)
+    if raw or instance._counted_state == state:
+        return
+    if instance._counted_state:
+        event_id, completed = instance._counted_state
+        RegistrationEventCounter.adjust(event_id, **{get_invite_counter_field(completed): -1})
+    RegistrationEventCounter.adjust(state[0], **{get_invite_counter_field(state[1]): 1})
+    instance._counted_state = state
+
+
+@receiver(post_delete, sender=RegistrationInvite)
+def count_invite_delete(sender, instance, **kwargs):
+    if instance._counted_state:
+        event_id, completed = instance._counted_state
+        RegistrationEventCounter.adjust(event_id, **{get_invite_counter_field(completed): -1})
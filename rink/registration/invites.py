@@ -0,0 +1,142 @@
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db.models import CharField, Count, Case, Q, Value, When
+
+from .models import RegistrationEventCounter, RegistrationInvite
+from users.models import User
+
+
+INVITE_RESULT_NEW = "new"
+INVITE_RESULT_LINKED = "linked"
+INVITE_RESULT_RESENT = "resent"
+INVITE_RESULT_REGISTERED = "registered"
+INVITE_RESULT_INVALID = "invalid"
+
+INVITE_RESULT_LABELS = {
+    INVITE_RESULT_NEW: ("New invite", "success"),
+    INVITE_RESULT_LINKED: ("New invite, linked to existing user", "success"),
+    INVITE_RESULT_RESENT: ("Existing invite, resent", "info"),
+    INVITE_RESULT_REGISTERED: ("Already registered, not sent", "secondary"),
+    INVITE_RESULT_INVALID: ("Invalid email address", "danger"),
+}
+
+
+INVITE_STATUS_QUEUED = "Queued"
+INVITE_STATUS_INVITED = "Invited"
+INVITE_STATUS_COMPLETED = "Completed"
+
+INVITE_TEXT_PUBLIC = "Registered via Public Link"
+INVITE_TEXT_INVITE = "Registered via Invite"
+
+# An invite is completed once its completed_date is set, sent or not (public
+# signups never are), the same rule RegistrationEventCounter counts by.
+# Same order as the Case/When below: first match wins.
+INVITE_STATUS_FILTERS = {
+    'completed_public': Q(completed_date__isnull=False, public_registration=True),
+    'completed_invite': Q(completed_date__isnull=False, public_registration=False),
+    'queued': Q(completed_date__isnull=True, sent_date__isnull=True),
+    'invited': Q(completed_date__isnull=True, sent_date__isnull=False),
+}
+
+
+def annotate_invite_status(queryset):
+    # Adds invite_status and invite_text to each invite, worked out by the
+    # database rather than row by row in Python.
+    return queryset.annotate(
+        invite_status=Case(
+            When(completed_date__isnull=False, then=Value(INVITE_STATUS_COMPLETED)),
+            When(INVITE_STATUS_FILTERS['queued'], then=Value(INVITE_STATUS_QUEUED)),
+            default=Value(INVITE_STATUS_INVITED),
+            output_field=CharField(),
+        ),
+        invite_text=Case(
+            When(INVITE_STATUS_FILTERS['completed_public'], then=Value(INVITE_TEXT_PUBLIC)),
+            When(INVITE_STATUS_FILTERS['completed_invite'], then=Value(INVITE_TEXT_INVITE)),
+            default=Value(""),
+            output_field=CharField(),
+        ),
+    )
+
+
+def get_invite_status_counts(queryset):
+    # Number of invites in each status, in one query.
+    return queryset.aggregate(**{
+        status: Count('pk', filter=status_filter) for status, status_filter in INVITE_STATUS_FILTERS.items()
+    })
+
+
+def normalize_email_list(text):
+    # One address per line. Strip whitespace, lowercase the domain and drop
+    # blank lines and duplicates while keeping the original order.
+    emails = []
+    seen = set()
+    for line in text.splitlines():
+        email = User.objects.normalize_email(line.strip())
+        if not email or email.lower() in seen:
+            continue
+        seen.add(email.lower())
+        emails.append(email)
+    return emails
+
+
+def bulk_invite_emails(event, emails, billing_group=None):
+    """
+    Create registration invites for a list of (normalized) email addresses.
+
+    Existing invites and users are looked up with one query each and all new
+    invites are created with a single bulk_create.
+
+    Returns (results, invite_ids). results is a list of (email, result) for
+    every address, invite_ids are the invites that should be emailed.
+    """
+    results = {}
+    valid_emails = []
+    for email in emails:
+        try:
+            validate_email(email)
+        except ValidationError:
+            results[email] = INVITE_RESULT_INVALID
+        else:
+            valid_emails.append(email)
+
+    existing_invites = {
+        invite.email: invite for invite in RegistrationInvite.objects.filter(event=event, email__in=valid_emails)
+    }
+    users = dict(User.objects.filter(email__in=valid_emails).values_list('email', 'pk'))
+
+    # If invite already exists for this email, just resend it. Clearing the
+    # sent date lets the send task email it again.
+    resend_ids = [invite.pk for invite in existing_invites.values() if not invite.completed_date]
+    if resend_ids:
+        RegistrationInvite.objects.filter(pk__in=resend_ids).update(sent_date=None)
+
+    new_invites = []
+    for email in valid_emails:
+        if email in existing_invites:
+            if existing_invites[email].completed_date:
+                results[email] = INVITE_RESULT_REGISTERED
+            else:
+                results[email] = INVITE_RESULT_RESENT
+            continue
+
+        # Attempt to match existing user to the email address
+        new_invites.append(RegistrationInvite(
+            email=email,
+            event=event,
+            billing_group=billing_group,
+            user_id=users.get(email),
+        ))
+        results[email] = INVITE_RESULT_LINKED if email in users else INVITE_RESULT_NEW
+
+    invite_ids = list(resend_ids)
+    if new_invites:
+        RegistrationInvite.objects.bulk_create(new_invites)
+        # bulk_create skips the signals that keep the event counts up to date.
+        RegistrationEventCounter.adjust(event.pk, invites_pending_count=len(new_invites))
+        # Not every database hands back primary keys from bulk_create.
+        invite_ids += RegistrationInvite.objects.filter(
+            event=event,
+            email__in=[invite.email for invite in new_invites],
+        ).values_list('pk', flat=True)
+
+    return [(email, results[email]) for email in emails], invite_ids
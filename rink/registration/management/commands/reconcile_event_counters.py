@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from registration.models import RegistrationEvent, RegistrationEventCounter
+
+
+COUNTER_FIELDS = ('roster_count', 'invites_pending_count', 'invites_completed_count')
+
+
+class Command(BaseCommand):
+    help = "Recount roster and invite totals for registration events and fix any that have drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event', type=int, action='append',
+            help="Event ID, can be given more than once. Defaults to all events.")
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        events = RegistrationEvent.objects.order_by('pk')
+        if options['event']:
+            events = events.filter(pk__in=options['event'])
+
+        fixed = 0
+        for event_id in events.values_list('pk', flat=True):
+            with transaction.atomic():
+                try:
+                    counter = RegistrationEventCounter.objects.select_for_update().get(event_id=event_id)
+                except RegistrationEventCounter.DoesNotExist:
+                    current = {}
+                else:
+                    current = {field: getattr(counter, field) for field in COUNTER_FIELDS}
+
+                counts = RegistrationEventCounter.count(event_id)
+                if current == counts:
+                    continue
+
+                fixed += 1
+                self.stdout.write("Event #{}: {} -> {}".format(event_id, current or "missing", counts))
+                if not options['dry_run']:
+                    RegistrationEventCounter.objects.update_or_create(event_id=event_id, defaults=counts)
+
+        self.stdout.write("{} event(s) {}.".format(fixed, "drifted" if options['dry_run'] else "reconciled"))
@@ -0,0 +1,199 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+import os
+import pickle
+from time import gmtime, strftime
+
+from .models import RegistrationData, Roster
+
+
+MEDICAL_FONT_TTF = os.path.join(str(settings.APPS_DIR), 'fonts', 'DejaVuSansCondensed.ttf')
+MEDICAL_FONT_PKL = os.path.join(str(settings.APPS_DIR), 'fonts', 'DejaVuSansCondensed.pkl')
+
+# Rosters bigger than this are rendered by a celery task instead of in the request.
+MEDICAL_PDF_SYNC_LIMIT = 40
+
+MEDICAL_PDF_CACHE_KEY = "registration:medical_pdf:{}:{}"
+MEDICAL_PDF_PENDING_KEY = "registration:medical_pdf_pending:{}:{}"
+MEDICAL_PDF_VERSION_KEY = "registration:medical_pdf_version:{}"
+MEDICAL_PDF_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Font metrics parsed from DejaVuSansCondensed.pkl, loaded once per process.
+_medical_font = None
+
+
+def get_medical_font():
+    global _medical_font
+    if _medical_font is None:
+        with open(MEDICAL_FONT_PKL, 'rb') as fh:
+            font = pickle.load(fh)
+        # The pickle stores a path relative to wherever it was generated.
+        font['ttffile'] = MEDICAL_FONT_TTF
+        _medical_font = font
+    return _medical_font
+
+
+def add_dejavu_font(pdf):
+    # Same as add_font('DejaVu', '', ..., uni=True), but reuses the font
+    # metrics already loaded by this process instead of reading them again.
+    font = get_medical_font()
+    pdf.fonts['dejavu'] = {
+        'i': len(pdf.fonts) + 1,
+        'type': font['type'],
+        'name': font['name'],
+        'desc': font['desc'],
+        'up': font['up'],
+        'ut': font['ut'],
+        'cw': font['cw'],
+        'ttffile': font['ttffile'],
+        'fontkey': 'dejavu',
+        'subset': list(range(0, 32)),
+        'unifilename': MEDICAL_FONT_PKL,
+    }
+    pdf.font_files['dejavu'] = {
+        'length1': font['originalsize'],
+        'type': "TTF",
+        'ttffile': font['ttffile'],
+    }
+
+
+def get_medical_roster(event):
+    # Roster, user and registration data in two queries total. Each entry's
+    # registration_data is newest first.
+    return Roster.objects.filter(event=event).select_related('user').prefetch_related(
+        Prefetch(
+            'registrationdata_set',
+            queryset=RegistrationData.objects.select_related('user').order_by('-pk'),
+            to_attr='registration_data',
+        )
+    )
+
+
+def build_medical_pdf(event):
+    # Returns the medical sheets for everyone on an event roster as PDF bytes.
+    # fpdf is only needed here, so a missing package only breaks the download.
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    add_dejavu_font(pdf)
+
+    for roster_entry in get_medical_roster(event):
+        if not roster_entry.registration_data:
+            continue
+        registration_data = roster_entry.registration_data[0]
+
+        pdf.add_page()
+        pdf.set_margins(16, 2)
+        pdf.ln(20)
+
+        pdf.set_font('DejaVu','',16)
+        pdf.cell(40,40,'Derby Name:')
+        pdf.set_font('DejaVu','',48)
+        pdf.cell(40,40, roster_entry.user.derby_name)
+        pdf.ln(20)
+
+        pdf.set_font('DejaVu','',16)
+        pdf.cell(40,40,'Real Name:')
+        pdf.set_font('DejaVu','',24)
+        pdf.cell(40,40, roster_entry.user.first_name + " " + roster_entry.user.last_name)
+        pdf.ln(20)
+
+        pdf.set_font('DejaVu','',16)
+        pdf.cell(60,40,'Date of Birth:')
+        pdf.set_font('DejaVu','',24)
+        pdf.cell(0,40, str(registration_data.emergency_date_of_birth))
+        pdf.ln(10)
+
+        pdf.set_font('DejaVu','',16)
+        pdf.cell(60,40,'Emergency Contact:')
+        pdf.set_font('DejaVu','',24)
+        pdf.cell(0,40, registration_data.emergency_contact)
+        pdf.ln(10)
+        pdf.cell(60,40,'')
+        pdf.set_font('DejaVu','',24)
+        pdf.cell(0,40, registration_data.emergency_phone)
+        pdf.ln(10)
+        pdf.cell(60,40,'')
+        pdf.set_font('DejaVu','',24)
+        pdf.cell(0,40, registration_data.emergency_relationship)
+        pdf.ln(15)
+
+        if registration_data.emergency_contact_second:
+            pdf.set_font('DejaVu','',16)
+            pdf.cell(60,40,'Emergency Contact #2:')
+            pdf.set_font('DejaVu','',24)
+            pdf.cell(0,40, registration_data.emergency_contact_second)
+            pdf.ln(10)
+            pdf.cell(60,40,'')
+            pdf.set_font('DejaVu','',24)
+            pdf.cell(0,40, registration_data.emergency_phone_second)
+            pdf.ln(10)
+            pdf.cell(60,40,'')
+            pdf.set_font('DejaVu','',24)
+            pdf.cell(0,40, registration_data.emergency_relationship_second)
+            pdf.ln(15)
+
+        pdf.set_font('DejaVu','',16)
+        pdf.cell(60,40,'Hosptial Preference:')
+        pdf.set_font('DejaVu','',24)
+        pdf.cell(0,40, registration_data.emergency_hospital)
+        pdf.ln(15)
+
+        pdf.set_font('DejaVu','',12)
+        pdf.multi_cell(0,40,'Medical Conditions:')
+        pdf.ln(-15)
+        pdf.set_font('DejaVu','',24)
+        if registration_data.emergency_allergies == "":
+            details = "<none>"
+        else:
+            details = registration_data.emergency_allergies
+
+        pdf.write(12, details)
+        pdf.ln(25)
+
+        wftda = ""
+        try:
+            wftda = int(registration_data.derby_insurance_number)
+        except:
+            pass
+
+        pdf.set_font('Courier','',7)
+        pdf.write(4, 'RINK #' + str(registration_data.user.id) + " | " + str(registration_data.user.email) + " | WFTDA #" + str(wftda) + " | generated on " + strftime("%Y-%m-%d", gmtime()))
+
+    # dest='S' returns the document as a latin-1 string instead of writing a file
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def get_medical_pdf_version(event_id):
+    # Bumped whenever roster or registration data for the event changes, so
+    # cached PDFs are never stale.
+    version = cache.get(MEDICAL_PDF_VERSION_KEY.format(event_id))
+    if version is None:
+        version = 1
+        cache.add(MEDICAL_PDF_VERSION_KEY.format(event_id), version, None)
+    return version
+
+
+def bump_medical_pdf_version(event_id):
+    key = MEDICAL_PDF_VERSION_KEY.format(event_id)
+    cache.add(key, 1, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_cached_medical_pdf(event_id, version):
+    return cache.get(MEDICAL_PDF_CACHE_KEY.format(event_id, version))
+
+
+def cache_medical_pdf(event_id, version, pdf):
+    cache.set(MEDICAL_PDF_CACHE_KEY.format(event_id, version), pdf, MEDICAL_PDF_CACHE_TIMEOUT)
+    cache.delete(MEDICAL_PDF_PENDING_KEY.format(event_id, version))
+
+
+def mark_medical_pdf_pending(event_id, version):
+    # Returns True if nobody else has already queued this version.
+    return cache.add(MEDICAL_PDF_PENDING_KEY.format(event_id, version), True, 60 * 10)
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.5 on 2026-10-18 01:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0009_registrationdata_marketing_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationEventCounter',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='registration.RegistrationEvent')),
+                ('roster_count', models.PositiveIntegerField(default=0)),
+                ('invites_pending_count', models.PositiveIntegerField(default=0)),
+                ('invites_completed_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.5 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0010_registrationeventcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registrationinvite',
+            index=models.Index(fields=['event', 'completed_date'], name='registratio_event_i_29920a_idx'),
+        ),
+    ]
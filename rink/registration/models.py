@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.urls import reverse
@@ -222,6 +224,70 @@ def set_registration_event_slug(sender, instance, *args, **kwargs):
         instance.slug = slugify(instance.name)
 
 
+class RegistrationEventCounter(models.Model):
+    # Running totals for an event so menus and capacity checks don't have to
+    # count the roster and invites on every request. Kept in step by the
+    # handlers in registration.handlers; `reconcile_event_counters` fixes drift.
+    event = models.OneToOneField(
+        "registration.RegistrationEvent",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="counter",
+    )
+
+    roster_count = models.PositiveIntegerField(default=0)
+    invites_pending_count = models.PositiveIntegerField(default=0)
+    invites_completed_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "{} counts".format(self.event)
+
+    @classmethod
+    def get_for_event(cls, event_id, lock=False):
+        queryset = cls.objects.all()
+        if lock:
+            queryset = queryset.select_for_update()
+        try:
+            return queryset.get(event_id=event_id)
+        except cls.DoesNotExist:
+            counter = cls.reconcile(event_id)
+            return queryset.get(event_id=event_id) if lock else counter
+
+    @classmethod
+    def adjust(cls, event_id, **deltas):
+        # Applies +/- changes in the database with F() so concurrent writers
+        # don't lose updates.
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not event_id or not deltas:
+            return
+        changes = {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()}
+        if cls.objects.filter(event_id=event_id).update(**changes):
+            return
+
+        # No row yet. Counted from scratch it already includes this change,
+        # unless somebody else created the row first.
+        counter, created = cls.objects.get_or_create(event_id=event_id, defaults=cls.count(event_id))
+        if not created:
+            cls.objects.filter(event_id=event_id).update(**changes)
+
+    @classmethod
+    def count(cls, event_id):
+        invites = RegistrationInvite.objects.filter(event_id=event_id).aggregate(
+            pending=Count('pk', filter=Q(completed_date__isnull=True)),
+            completed=Count('pk', filter=Q(completed_date__isnull=False)),
+        )
+        return {
+            'roster_count': Roster.objects.filter(event_id=event_id).count(),
+            'invites_pending_count': invites['pending'],
+            'invites_completed_count': invites['completed'],
+        }
+
+    @classmethod
+    def reconcile(cls, event_id):
+        counter, created = cls.objects.update_or_create(event_id=event_id, defaults=cls.count(event_id))
+        return counter
+
+
 class RegistrationInvite(models.Model):
     user = models.ForeignKey(
         "users.User",
@@ -269,6 +335,12 @@ class RegistrationInvite(models.Model):
         default=False,
     )
 
+    class Meta:
+        indexes = [
+            # Pending (null) and completed invites per event.
+            models.Index(fields=['event', 'completed_date']),
+        ]
+
     def __str__(self):
         return "{}".format(self.email)
 
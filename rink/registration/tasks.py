@@ -1,39 +1,75 @@
 from celery import shared_task
 from django.utils import timezone
 
+from smtplib import SMTPException
+
 from billing.models import Payment
-from league.utils import send_email
-from registration.models import RegistrationInvite, RegistrationData
+from league.utils import EmailBatchError, send_email, send_emails
+from registration.medical import build_medical_pdf, cache_medical_pdf
+from registration.models import RegistrationEvent, RegistrationInvite, RegistrationData
 
 from markdownx.utils import markdownify
+from rink.utils.chunks import chunked
+from taskapp.metrics import record_items
 
 
-@shared_task
-def send_registration_invite_email(invite_ids=[]):
-    for invite_id in invite_ids:
-        try:
-            invite = RegistrationInvite.objects.get(pk=invite_id)
-        except RegistrationInvite.DoesNotExist:
-            continue
+# Invite lists larger than this are split into subtasks that each send (and
+# retry) on their own.
+INVITE_EMAIL_CHUNK_SIZE = 50
 
-        # Don't send invites if they have completed registration
-        # or the sent date is set (already sent invite).
-        # To resend an invite, we need to set sent_date to null
-        # before calling this task.
-        if invite.completed_date or invite.sent_date:
-            continue
+# Retry transient mail server problems a few times before giving up.
+INVITE_EMAIL_RETRY_EXCEPTIONS = (SMTPException, OSError)
+
+
+def group_invites_by_league(invites):
+    # Invites almost always belong to one event, but send_emails works per league.
+    leagues = {}
+    for invite in invites:
+        leagues.setdefault(invite.event.league_id, (invite.event.league, []))[1].append(invite)
+    return leagues.values()
+
+
+def mark_invites_sent(invites):
+    if invites:
+        RegistrationInvite.objects.filter(pk__in=[invite.pk for invite in invites]).update(sent_date=timezone.now())
+        record_items(len(invites))
 
-        send_email(
-            league=invite.event.league,
-            to_email=invite.email,
-            template="registration_invite",
-            context={
-                'invite': invite,
-            },
-        )
 
-        invite.sent_date = timezone.now()
-        invite.save()
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_registration_invite_email(self, invite_ids=[]):
+    invite_ids = list(invite_ids)
+    if len(invite_ids) > INVITE_EMAIL_CHUNK_SIZE:
+        for chunk in chunked(invite_ids, INVITE_EMAIL_CHUNK_SIZE):
+            send_registration_invite_email.delay(invite_ids=chunk)
+        return
+
+    # Don't send invites if they have completed registration
+    # or the sent date is set (already sent invite).
+    # To resend an invite, we need to set sent_date to null
+    # before calling this task.
+    invites = RegistrationInvite.objects.filter(
+        pk__in=invite_ids,
+        completed_date__isnull=True,
+        sent_date__isnull=True,
+    ).select_related('event__league', 'user')
+
+    for league, league_invites in group_invites_by_league(invites):
+        try:
+            send_emails(
+                league=league,
+                template="registration_invite",
+                recipients=[(invite.email, {'invite': invite}) for invite in league_invites],
+            )
+        except EmailBatchError as e:
+            # The retry skips the ones that went out, they have a sent_date.
+            mark_invites_sent(league_invites[:e.sent])
+            if isinstance(e.error, INVITE_EMAIL_RETRY_EXCEPTIONS):
+                raise self.retry(exc=e.error)
+            raise
+        except INVITE_EMAIL_RETRY_EXCEPTIONS as e:
+            raise self.retry(exc=e)
+
+        mark_invites_sent(league_invites)
 
 
 @shared_task
@@ -60,23 +96,58 @@ def send_registration_confirmation(registration_data_id, payment_data_id=None):
     return True
 
 
-@shared_task
-def send_registration_invite_reminder(event_id, invite_ids=[], custom_message=''):
-    for invite_id in invite_ids:
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_registration_invite_reminder(self, event_id, invite_ids=[], custom_message=''):
+    invite_ids = list(invite_ids)
+    if len(invite_ids) > INVITE_EMAIL_CHUNK_SIZE:
+        for chunk in chunked(invite_ids, INVITE_EMAIL_CHUNK_SIZE):
+            send_registration_invite_reminder.delay(event_id=event_id, invite_ids=chunk, custom_message=custom_message)
+        return
+
+    invites = RegistrationInvite.objects.filter(
+        pk__in=invite_ids,
+        event__pk=event_id,
+    ).select_related('event__league', 'user')
+
+    reminder_subject = "*REMINDER* "
+    custom_message_html = markdownify(custom_message)
+    sent_ids = set()
+    for league, league_invites in group_invites_by_league(invites):
         try:
-            invite = RegistrationInvite.objects.get(pk=invite_id, event__pk=event_id)
-        except RegistrationInvite.DoesNotExist:
+            send_emails(
+                league=league,
+                template="registration_invite",
+                recipients=[(invite.email, {
+                    'invite': invite,
+                    'reminder_subject': reminder_subject,
+                    'custom_message': custom_message_html,
+                }) for invite in league_invites],
+            )
+        except EmailBatchError as e:
+            sent_ids.update(invite.pk for invite in league_invites[:e.sent])
+            record_items(e.sent)
+            if not isinstance(e.error, INVITE_EMAIL_RETRY_EXCEPTIONS):
+                raise
+            error = e.error
+        except INVITE_EMAIL_RETRY_EXCEPTIONS as e:
+            error = e
+        else:
+            sent_ids.update(invite.pk for invite in league_invites)
+            record_items(len(league_invites))
             continue
 
-        reminder_subject = "*REMINDER* "
-        custom_message_html = markdownify(custom_message)
-        send_email(
-            league=invite.event.league,
-            to_email=invite.email,
-            template="registration_invite",
-            context={
-                'invite': invite,
-                'reminder_subject': reminder_subject,
-                'custom_message': custom_message_html,
-            },
-        )
+        # Reminders don't leave a mark on the invite, retry with the ones
+        # that haven't gone out yet.
+        raise self.retry(exc=error, kwargs={
+            'event_id': event_id,
+            'invite_ids': [pk for pk in invite_ids if pk not in sent_ids],
+            'custom_message': custom_message,
+        })
+
+
+@shared_task(ignore_result=True)
+def generate_medical_pdf(event_id, version):
+    # Medical sheets for big rosters are built here instead of in the request.
+    # EventAdminMedicalCSV serves the cached copy once it's ready.
+    event = RegistrationEvent.objects.get(pk=event_id)
+    cache_medical_pdf(event_id, version, build_medical_pdf(event))
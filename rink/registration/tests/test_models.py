@@ -1,4 +1,5 @@
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.db.utils import IntegrityError
 from django.test import TestCase
 from django.urls import resolve, Resolver404
@@ -8,10 +9,12 @@ from .factories import RegistrationEventFactory, RegistrationInviteFactory
 from billing.models import BillingPeriod
 from league.tests.factories import LeagueFactory
 from legal.tests.factories import LegalDocumentFactory
-from registration.models import RegistrationEvent, RegistrationInvite
+from registration.invites import bulk_invite_emails
+from registration.models import RegistrationEvent, RegistrationEventCounter, RegistrationInvite, Roster
 from users.tests.factories import UserFactory
 
 from datetime import date
+from io import StringIO
 from dateutil.relativedelta import relativedelta
 from rink.utils.date import get_aware_datetime
 from unittest import skip
@@ -239,3 +242,79 @@ class TestRegistrationInvite(TestCase):
             resolve(invite.get_invite_url())
         except Resolver404 as e:
             self.fail("get_invite_url() did not resolve to a valid URL")
+
+
+class TestRegistrationEventCounter(TestCase):
+    def setUp(self):
+        self.event = RegistrationEventFactory()
+        self.other_event = RegistrationEventFactory(league=self.event.league)
+
+    def get_counts(self, event):
+        counter = RegistrationEventCounter.objects.get(event=event)
+        return (counter.roster_count, counter.invites_pending_count, counter.invites_completed_count)
+
+    def add_roster(self, event):
+        user = UserFactory()
+        return Roster.objects.create(user=user, event=event, email=user.email)
+
+    def test_roster_counts(self):
+        roster = self.add_roster(self.event)
+        self.add_roster(self.event)
+        self.assertEqual(self.get_counts(self.event), (2, 0, 0))
+
+        # Plain saves don't touch the counter
+        with self.assertNumQueries(1):
+            roster.save()
+
+        roster.event = self.other_event
+        roster.save()
+        self.assertEqual(self.get_counts(self.event), (1, 0, 0))
+        self.assertEqual(self.get_counts(self.other_event), (1, 0, 0))
+
+        Roster.objects.get(pk=roster.pk).delete()
+        self.assertEqual(self.get_counts(self.other_event), (0, 0, 0))
+
+    def test_invite_counts(self):
+        invite = RegistrationInviteFactory(event=self.event)
+        RegistrationInviteFactory(event=self.event)
+        self.assertEqual(self.get_counts(self.event), (0, 2, 0))
+
+        invite = RegistrationInvite.objects.get(pk=invite.pk)
+        invite.completed_date = timezone.now()
+        invite.save()
+        self.assertEqual(self.get_counts(self.event), (0, 1, 1))
+
+        invite.delete()
+        self.assertEqual(self.get_counts(self.event), (0, 1, 0))
+
+        bulk_invite_emails(self.event, ['bulk-1@example.com', 'bulk-2@example.com'])
+        self.assertEqual(self.get_counts(self.event), (0, 3, 0))
+
+    def test_missing_counter_counted_on_read(self):
+        self.add_roster(self.event)
+        RegistrationInviteFactory(event=self.event)
+        RegistrationEventCounter.objects.filter(event=self.event).delete()
+
+        counter = RegistrationEventCounter.get_for_event(self.event.pk)
+        self.assertEqual((counter.roster_count, counter.invites_pending_count), (1, 1))
+
+    def test_missing_counter_created_on_change(self):
+        self.add_roster(self.event)
+        RegistrationEventCounter.objects.filter(event=self.event).delete()
+
+        self.add_roster(self.event)
+        self.assertEqual(self.get_counts(self.event), (2, 0, 0))
+        self.add_roster(self.event)
+        self.assertEqual(self.get_counts(self.event), (3, 0, 0))
+
+    def test_reconcile_command(self):
+        self.add_roster(self.event)
+        RegistrationEventCounter.objects.filter(event=self.event).update(roster_count=7, invites_pending_count=3)
+
+        out = StringIO()
+        call_command('reconcile_event_counters', '--dry-run', stdout=out)
+        self.assertIn("1 event(s) drifted.", out.getvalue())
+        self.assertEqual(self.get_counts(self.event), (7, 3, 0))
+
+        call_command('reconcile_event_counters', stdout=StringIO())
+        self.assertEqual(self.get_counts(self.event), (1, 0, 0))
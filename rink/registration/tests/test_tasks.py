@@ -0,0 +1,102 @@
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase
+from django.utils import timezone
+
+from celery.exceptions import Retry
+from smtplib import SMTPServerDisconnected
+from unittest.mock import patch
+
+from .factories import RegistrationEventFactory, RegistrationInviteFactory
+from league.tests.factories import LeagueFactory
+from registration.models import RegistrationInvite
+from registration.tasks import (
+    send_registration_invite_email, send_registration_invite_reminder, INVITE_EMAIL_CHUNK_SIZE,
+)
+
+
+class TestSendRegistrationInviteEmail(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory()
+        self.event = RegistrationEventFactory(league=self.league)
+
+    def test_sends_batch_over_one_connection(self):
+        invites = [RegistrationInviteFactory(event=self.event) for i in range(0, 3)]
+        RegistrationInviteFactory(event=self.event, sent_date=timezone.now())
+        RegistrationInviteFactory(event=self.event, completed_date=timezone.now())
+
+        invite_ids = list(RegistrationInvite.objects.values_list('pk', flat=True))
+        with self.assertNumQueries(2):
+            send_registration_invite_email(invite_ids=invite_ids)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(invite.email for invite in invites))
+        self.assertFalse(
+            RegistrationInvite.objects.filter(sent_date__isnull=True, completed_date__isnull=True).exists())
+
+        # Already sent, nothing goes out again
+        send_registration_invite_email(invite_ids=[invites[0].pk])
+        self.assertEqual(len(mail.outbox), 3)
+
+    @patch('registration.tasks.send_registration_invite_email.delay')
+    def test_large_lists_split_into_subtasks(self, delay):
+        invite_ids = list(range(1, INVITE_EMAIL_CHUNK_SIZE * 2 + 2))
+        send_registration_invite_email(invite_ids=invite_ids)
+        self.assertEqual(delay.call_count, 3)
+        self.assertEqual(delay.call_args_list[0][1]['invite_ids'], invite_ids[:INVITE_EMAIL_CHUNK_SIZE])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def fail_on_message(self, number):
+        # Patches the test mail backend to fail on the given message (1 based).
+        send_messages = EmailBackend.send_messages
+
+        def send_or_fail(backend, messages):
+            if len(mail.outbox) + 1 == number:
+                raise SMTPServerDisconnected("Connection unexpectedly closed")
+            return send_messages(backend, messages)
+        return patch.object(EmailBackend, 'send_messages', send_or_fail)
+
+    def test_partial_failure_retries_the_rest(self):
+        invites = [RegistrationInviteFactory(event=self.event) for i in range(0, 3)]
+        invite_ids = [invite.pk for invite in invites]
+
+        with self.fail_on_message(2), self.assertRaises(SMTPServerDisconnected):
+            send_registration_invite_email(invite_ids=invite_ids)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            list(RegistrationInvite.objects.filter(sent_date__isnull=False).values_list('pk', flat=True)),
+            [invites[0].pk])
+
+        # The retry only sends the ones that didn't go out.
+        send_registration_invite_email(invite_ids=invite_ids)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(invite.email for invite in invites))
+
+    def test_reminder_partial_failure_retries_the_rest(self):
+        invites = [RegistrationInviteFactory(event=self.event) for i in range(0, 3)]
+        invite_ids = [invite.pk for invite in invites]
+
+        with self.fail_on_message(3), \
+                patch.object(send_registration_invite_reminder, 'retry', return_value=Retry()) as retry, \
+                self.assertRaises(Retry):
+            send_registration_invite_reminder(event_id=self.event.pk, invite_ids=invite_ids, custom_message="Hi")
+        self.assertEqual(len(mail.outbox), 2)
+        sent_emails = [message.to[0] for message in mail.outbox]
+        self.assertEqual(retry.call_args[1]['kwargs'], {
+            'event_id': self.event.pk,
+            'invite_ids': [invite.pk for invite in invites if invite.email not in sent_emails],
+            'custom_message': "Hi",
+        })
+
+    def test_reminder(self):
+        invites = [RegistrationInviteFactory(event=self.event) for i in range(0, 2)]
+        send_registration_invite_reminder(
+            event_id=self.event.pk,
+            invite_ids=[invite.pk for invite in invites],
+            custom_message="Don't forget!",
+        )
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertTrue(mail.outbox[0].subject.startswith("*REMINDER*"))
@@ -1,12 +1,13 @@
 from datetime import timedelta
 
+from django.contrib.auth.models import AnonymousUser
 from django.core import mail
 from django.test import LiveServerTestCase
 from django.urls import reverse
 from django.utils import timezone
 
 import pytest
-from django.test import TestCase, TransactionTestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase
 
 from .factories import (
     RegistrationInviteFactory, RegistrationEventFactory,
@@ -17,11 +18,12 @@ from billing.tests.factories import BillingGroupFactory, BillingPeriodFactory
 from league.tests.factories import InsuranceTypeFactory
 from legal.tests.factories import LegalDocumentFactory
 from rink.utils.testing import RinkViewTest, RinkViewLiveTest, copy_model_to_dict
-from users.tests.factories import user_password
+from users.tests.factories import UserFactory, user_password
 
-from registration.models import RegistrationEvent, RegistrationData, RegistrationInvite
+from registration.models import RegistrationEvent, RegistrationData, RegistrationInvite, Roster
 from registration.tasks import send_registration_confirmation
 from registration.forms import RegistrationDataForm
+from registration.views import check_event_at_capacity
 from users.models import User
 
 
@@ -166,6 +168,24 @@ class TestRegisterBeginPublicURL(RegistrationEventTest, RinkViewTest, Transactio
         self.assertTemplateUsed(response, "registration/register_error.html")
 
 
+class TestCheckEventAtCapacity(TestCase):
+    def test_registration_at_capacity(self):
+        event = RegistrationEventFactory(max_capacity=1)
+        request = RequestFactory().get('/')
+        request.session = {}
+        request.user = AnonymousUser()
+        self.assertFalse(check_event_at_capacity(request, event))
+
+        user = UserFactory()
+        Roster.objects.create(user=user, event=event, email=user.email)
+        response = check_event_at_capacity(request, event, lock=True)
+        self.assertContains(response, "Registration at Capacity!")
+
+        # Unlimited events never fill up
+        event.max_capacity = None
+        self.assertFalse(check_event_at_capacity(request, event))
+
+
 class TestRegisterCreateAccount(RegistrationEventTest, RinkViewLiveTest, LiveServerTestCase):
     is_public = True
     template = "registration/register_create_account.html"
@@ -1,5 +1,27 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from .factories import RegistrationDataFactory, RegistrationInviteFactory
 from .utils import RegistrationEventTest
+from billing.models import BillingPeriod, BillingPeriodCustomPaymentAmount
+from billing.resolvers import InvoiceAmountResolver
+from billing.tests.factories import BillingGroupFactory
+from registration.invites import (
+    INVITE_RESULT_INVALID, INVITE_RESULT_LABELS, INVITE_RESULT_LINKED, INVITE_RESULT_NEW,
+    INVITE_RESULT_REGISTERED, INVITE_RESULT_RESENT,
+)
+from registration.medical import cache_medical_pdf, get_medical_pdf_version, get_medical_roster
+from registration.models import RegistrationData, RegistrationInvite, Roster
+from registration.resources import RosterResource
+from roster.resources import RosterResource as RegistrationDataResource
+from rink.utils.export import streaming_csv_response
 from rink.utils.testing import RinkViewTest
+from users.tests.factories import OrgAdminUserFactory, UserFactory, user_password
 
 from test_plus.test import TestCase
 
@@ -27,6 +49,49 @@ class TestEventAdminInvites(RegistrationEventTest, RinkViewTest, TestCase):
     template = 'registration/event_admin_invites.html'
     url = 'registration:event_admin_invites'
 
+    def test_invite_status_and_counts(self):
+        now = timezone.now()
+        queued = RegistrationInviteFactory(event=self.event, user=UserFactory())
+        invited = RegistrationInviteFactory(event=self.event, sent_date=now)
+        # Public signups complete without ever being sent an invite.
+        public = RegistrationInviteFactory(event=self.event, completed_date=now, public_registration=True)
+        completed = RegistrationInviteFactory(event=self.event, sent_date=now, completed_date=now)
+
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+        response = self.client.get(self.get_url())
+
+        statuses = {invite.pk: (invite.invite_status, invite.invite_text) for invite in response.context['invites']}
+        self.assertEqual(statuses, {
+            queued.pk: ("Queued", ""),
+            invited.pk: ("Invited", ""),
+            public.pk: ("Completed", "Registered via Public Link"),
+            completed.pk: ("Completed", "Registered via Invite"),
+        })
+        self.assertEqual(response.context['invites_waiting'], 2)
+        self.assertEqual(response.context['invites_completed'], 2)
+        self.assertContains(response, queued.user.derby_name)
+
+    def test_query_count_does_not_grow_with_invites(self):
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+        for i in range(0, 3):
+            RegistrationInviteFactory(event=self.event, user=UserFactory())
+        # Warm the league and permission caches
+        self.client.get(self.get_url())
+
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.get_url())
+
+        for i in range(0, 30):
+            RegistrationInviteFactory(event=self.event, user=UserFactory())
+        self.client.get(self.get_url())
+
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.get_url(), {'page': 2})
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(response.context['invites_page'].number, 1)
+
 
 class TestEventAdminInviteUsers(RegistrationEventTest, RinkViewTest, TestCase):
     league_permissions_required = ['league_admin']
@@ -39,6 +104,62 @@ class TestEventAdminInviteEmails(RegistrationEventTest, RinkViewTest, TestCase):
     template = 'registration/event_admin_invites.html'
     url = 'registration:event_admin_invite_emails'
 
+    def test_post_bulk_invites(self):
+        billing_group = BillingGroupFactory(league=self.league)
+        existing_user = self.user_factory()
+        RegistrationInviteFactory(event=self.event, email="resend@example.com")
+        RegistrationInviteFactory(event=self.event, email="done@example.com", completed_date=timezone.now())
+
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+        response = self.client.post(self.get_url(), {
+            'emails': "\n".join([
+                " new@example.com ",
+                "new@EXAMPLE.com",
+                "",
+                existing_user.email,
+                "resend@example.com",
+                "done@example.com",
+                "not-an-email",
+            ]),
+            'billing_group': billing_group.pk,
+        }, follow=True)
+        self.assertRedirects(response, self.get_url())
+        self.assertEqual(
+            [(email, label) for email, (label, css) in response.context['invite_results']],
+            [
+                ("new@example.com", INVITE_RESULT_LABELS[INVITE_RESULT_NEW][0]),
+                (existing_user.email, INVITE_RESULT_LABELS[INVITE_RESULT_LINKED][0]),
+                ("resend@example.com", INVITE_RESULT_LABELS[INVITE_RESULT_RESENT][0]),
+                ("done@example.com", INVITE_RESULT_LABELS[INVITE_RESULT_REGISTERED][0]),
+                ("not-an-email", INVITE_RESULT_LABELS[INVITE_RESULT_INVALID][0]),
+            ]
+        )
+
+        self.assertEqual(RegistrationInvite.objects.filter(event=self.event).count(), 4)
+        linked = RegistrationInvite.objects.get(event=self.event, email=existing_user.email)
+        self.assertEqual(linked.user, existing_user)
+        self.assertEqual(linked.billing_group, billing_group)
+
+        # The results are shown once, reloading the page doesn't post again.
+        response = self.client.get(self.get_url())
+        self.assertIsNone(response.context['invite_results'])
+        self.assertEqual(RegistrationInvite.objects.filter(event=self.event).count(), 4)
+
+    def test_nothing_queued_without_invites(self):
+        billing_group = BillingGroupFactory(league=self.league)
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+        with patch('registration.views_admin.transaction.on_commit', side_effect=lambda func: func()), \
+                patch('registration.views_admin.send_registration_invite_email') as send_invites:
+            self.client.post(self.get_url(), {'emails': "not-an-email", 'billing_group': billing_group.pk})
+        send_invites.delay.assert_not_called()
+
+        with patch('registration.views_admin.transaction.on_commit', side_effect=lambda func: func()), \
+                patch('registration.views_admin.send_registration_invite_email') as send_invites:
+            self.client.post(self.get_url(), {'emails': "new@example.com", 'billing_group': billing_group.pk})
+        send_invites.delay.assert_called_once()
+
 
 class TestEventAdminRoster(RegistrationEventTest, RinkViewTest, TestCase):
     league_permissions_required = ['league_admin']
@@ -46,7 +167,253 @@ class TestEventAdminRoster(RegistrationEventTest, RinkViewTest, TestCase):
     url = 'registration:event_admin_roster'
 
 
+class TestEventAdminRosterCSV(RegistrationEventTest, RinkViewTest, TestCase):
+    league_permissions_required = ['league_admin']
+    url = 'registration:event_admin_roster_csv'
+
+    def test_league_permissions_and_template(self):
+        # CSV download, no template to check
+        pass
+
+    def test_streamed_csv_matches_export(self):
+        for i in range(0, 3):
+            user = UserFactory(league=self.league, organization=self.organization)
+            Roster.objects.create(
+                user=user,
+                event=self.event,
+                email=user.email,
+                first_name="First, \"Quoted\" {}".format(i),
+                last_name="Last",
+                derby_name="Derby {}".format(i),
+            )
+
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+        response = self.client.get(self.get_url())
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode('utf-8'),
+            RosterResource().export(queryset=Roster.objects.filter(event=self.event)).csv,
+        )
+
+    def test_streamed_registration_data_matches_export(self):
+        for i in range(0, 3):
+            RegistrationDataFactory(event=self.event, organization=self.organization)
+
+        queryset = RegistrationData.objects.all()
+        response = streaming_csv_response(RegistrationDataResource(), queryset, 'roster.csv')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode('utf-8'),
+            RegistrationDataResource().export(queryset=queryset).csv,
+        )
+
+
+class TestEventAdminMedicalCSV(RegistrationEventTest, RinkViewTest, TestCase):
+    league_permissions_required = ['league_admin']
+    url = 'registration:event_admin_medical_csv'
+
+    def test_league_permissions_and_template(self):
+        # PDF download, no template to check
+        pass
+
+    def add_roster(self, count):
+        for i in range(0, count):
+            data = RegistrationDataFactory(event=self.event, invite__event=self.event, organization=self.organization)
+            roster = Roster.objects.create(user=data.user, event=self.event, email=data.user.email)
+            data.roster = roster
+            data.save()
+
+    def login(self):
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+
+    def test_small_roster_built_in_request(self):
+        self.add_roster(2)
+        self.login()
+        response = self.client.get(self.get_url())
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+    def test_latest_registration_data(self):
+        self.add_roster(1)
+        roster = Roster.objects.get(event=self.event)
+        latest = RegistrationDataFactory(
+            event=self.event, invite__event=self.event, organization=self.organization, user=roster.user, roster=roster)
+        self.assertEqual(get_medical_roster(self.event)[0].registration_data[0], latest)
+
+    @patch('registration.views_admin.MEDICAL_PDF_SYNC_LIMIT', 1)
+    @patch('registration.views_admin.generate_medical_pdf.delay')
+    def test_large_roster_built_by_task(self, delay):
+        self.add_roster(2)
+        self.login()
+        version = get_medical_pdf_version(self.event.pk)
+
+        response = self.client.get(self.get_url())
+        self.assertTemplateUsed(response, 'registration/event_admin_medical_pending.html')
+        delay.assert_called_once_with(self.event.pk, version)
+
+        # Already queued, not queued again
+        self.client.get(self.get_url())
+        self.assertEqual(delay.call_count, 1)
+
+        cache_medical_pdf(self.event.pk, version, b'%PDF-cached')
+        response = self.client.get(self.get_url())
+        self.assertEqual(response.content, b'%PDF-cached')
+
+        # Roster changes invalidate the cached copy, once they're committed
+        with patch('registration.handlers.transaction.on_commit') as on_commit:
+            Roster.objects.filter(event=self.event).first().save()
+        self.assertEqual(get_medical_pdf_version(self.event.pk), version)
+        on_commit.call_args[0][0]()
+        self.assertNotEqual(get_medical_pdf_version(self.event.pk), version)
+        response = self.client.get(self.get_url())
+        self.assertTemplateUsed(response, 'registration/event_admin_medical_pending.html')
+        self.assertEqual(delay.call_count, 2)
+
+
 class TestEventAdminBillingPeriods(RegistrationEventTest, RinkViewTest, TestCase):
     league_permissions_required = ['league_admin']
     template = 'registration/event_admin_billing_periods.html'
     url = 'registration:event_admin_billing_periods'
+
+    def login(self):
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+
+    def add_periods(self, count, groups):
+        start = timezone.now().date() + timedelta(days=30)
+        periods = []
+        for i in range(count):
+            period = BillingPeriod.objects.create(
+                event=self.event,
+                league=self.league,
+                name="Month {}".format(i),
+                start_date=start + timedelta(days=30 * i),
+                end_date=start + timedelta(days=30 * i + 29),
+                invoice_date=start + timedelta(days=30 * i - 7),
+                due_date=start + timedelta(days=30 * i),
+            )
+            for group in groups:
+                BillingPeriodCustomPaymentAmount.objects.create(group=group, period=period, invoice_amount=10)
+            periods.append(period)
+        return periods
+
+    def get_form_data(self, periods, groups):
+        data = {}
+        for period in periods:
+            data['name{}'.format(period.pk)] = period.name
+            for field in ('start_date', 'end_date', 'invoice_date', 'due_date'):
+                data['{}{}'.format(field, period.pk)] = getattr(period, field).strftime('%m/%d/%y')
+            for group in groups:
+                data['invoice_amount_group{}_{}'.format(group.pk, period.pk)] = '10.00'
+        return data
+
+    def get_amounts(self):
+        return {
+            (cell.period_id, cell.group_id): cell.invoice_amount
+            for cell in BillingPeriodCustomPaymentAmount.objects.filter(period__event=self.event)
+        }
+
+    def test_get_fills_missing_amounts(self):
+        self.login()
+        groups = [BillingGroupFactory(league=self.league) for i in range(3)]
+        periods = self.add_periods(2, groups[:2])
+
+        response = self.client.get(self.get_url())
+        self.assertEqual(len(self.get_amounts()), 6)
+        for period in response.context['billing_periods']:
+            self.assertEqual([cell.group_id for cell in period.amounts], [group.pk for group in groups])
+        self.assertContains(response, 'name="invoice_amount_group{}_{}"'.format(groups[2].pk, periods[1].pk))
+
+    def test_save_changes(self):
+        self.login()
+        groups = [BillingGroupFactory(league=self.league) for i in range(2)]
+        periods = self.add_periods(3, groups)
+        data = self.get_form_data(periods, groups)
+        data['name{}'.format(periods[0].pk)] = "Renamed"
+        data['invoice_amount_group{}_{}'.format(groups[1].pk, periods[1].pk)] = '25.50'
+        data['delete{}'.format(periods[2].pk)] = 'delete'
+        del data['name{}'.format(periods[2].pk)]
+        data.update({
+            'name_new1': "New Month",
+            'start_date_new1': '01/01/40',
+            'end_date_new1': '01/31/40',
+            'invoice_date_new1': '12/25/39',
+            'due_date_new1': '01/01/40',
+            'invoice_amount_group{}_new1'.format(groups[0].pk): '5',
+            'invoice_amount_group{}_new1'.format(groups[1].pk): '',
+        })
+        self.client.post(self.get_url(), data)
+
+        saved = {period.name: period for period in BillingPeriod.objects.filter(event=self.event)}
+        self.assertEqual(set(saved), {"Renamed", "Month 1", "New Month"})
+        amounts = self.get_amounts()
+        self.assertEqual(amounts[(periods[1].pk, groups[1].pk)], Decimal('25.50'))
+        self.assertEqual(amounts[(periods[1].pk, groups[0].pk)], Decimal('10.00'))
+        self.assertEqual(amounts[(saved["New Month"].pk, groups[0].pk)], Decimal('5.00'))
+        self.assertEqual(amounts[(saved["New Month"].pk, groups[1].pk)], Decimal('0.00'))
+
+    def test_amounts_invalidated_once_on_commit(self):
+        self.login()
+        groups = [BillingGroupFactory(league=self.league) for i in range(2)]
+        periods = self.add_periods(2, groups)
+        data = self.get_form_data(periods, groups)
+        data['invoice_amount_group{}_{}'.format(groups[0].pk, periods[0].pk)] = '25.00'
+        data['delete{}'.format(periods[1].pk)] = 'delete'
+
+        with patch.object(InvoiceAmountResolver, 'invalidate') as invalidate:
+            self.client.post(self.get_url(), data)
+        invalidate.assert_not_called()
+
+        # One for the league, covering the deleted period's amounts as well.
+        pending = InvoiceAmountResolver.pending_invalidations()
+        self.assertEqual([invalidation.league_id for invalidation in pending], [self.league.pk])
+        self.assertIn(periods[1].pk, pending[0].period_ids)
+
+    def test_invalid_values_are_not_saved(self):
+        self.login()
+        groups = [BillingGroupFactory(league=self.league)]
+        periods = self.add_periods(1, groups)
+        past = timezone.now().date() - timedelta(days=1)
+        BillingPeriod.objects.filter(pk=periods[0].pk).update(due_date=past, invoice_date=past)
+
+        data = self.get_form_data(periods, groups)
+        data['due_date{}'.format(periods[0].pk)] = '01/01/40'
+        data['invoice_amount_group{}_{}'.format(groups[0].pk, periods[0].pk)] = '-5'
+        response = self.client.post(self.get_url(), data, follow=True)
+
+        period = BillingPeriod.objects.get(pk=periods[0].pk)
+        self.assertEqual(period.due_date, past)
+        self.assertEqual(self.get_amounts()[(period.pk, groups[0].pk)], Decimal('10.00'))
+        self.assertContains(response, "The date has already passed")
+        self.assertContains(response, "Invoice amount must be a positive number")
+
+    def test_constant_queries(self):
+        self.login()
+        groups = [BillingGroupFactory(league=self.league) for i in range(3)]
+
+        def count_post_queries(periods):
+            data = self.get_form_data(periods, groups)
+            for key in data:
+                if key.startswith('invoice_amount_group'):
+                    data[key] = '20.00'
+            data['name{}'.format(periods[0].pk)] = "Renamed"
+            with CaptureQueriesContext(connection) as context:
+                self.client.post(self.get_url(), data)
+            self.assertEqual(set(self.get_amounts().values()), {Decimal('20.00')})
+            return len(context.captured_queries)
+
+        def count_get_queries():
+            BillingPeriodCustomPaymentAmount.objects.filter(period__event=self.event, group=groups[0]).delete()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(self.get_url())
+            return len(context.captured_queries)
+
+        small = self.add_periods(2, groups)
+        self.client.get(self.get_url())
+        small_post, small_get = count_post_queries(small), count_get_queries()
+        BillingPeriod.objects.filter(event=self.event).delete()
+        large = self.add_periods(12, groups)
+        self.assertEqual(count_post_queries(large), small_post)
+        self.assertEqual(count_get_queries(), small_get)
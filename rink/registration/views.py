@@ -13,10 +13,11 @@ from stripe.error import CardError
 from .forms import (
     RegistrationSignupForm, RegistrationDataForm, LegalDocumentAgreeForm,
     LegalDocumentInitialsForm)
-from .models import RegistrationEvent, RegistrationInvite, RegistrationData, Roster
+from .models import RegistrationEvent, RegistrationEventCounter, RegistrationInvite, RegistrationData
 from billing.models import (
     BillingPeriod, UserStripeCard, Invoice, BillingSubscription, BillingGroupMembership
 )
+from billing.resolvers import InvoiceAmountResolver
 from legal.models import LegalSignature
 
 from registration.tasks import send_registration_confirmation
@@ -29,9 +30,12 @@ def registration_error(request, event, error_code):
     })
 
 
-def check_event_at_capacity(request, event):
+def check_event_at_capacity(request, event, lock=False):
+    # With lock=True the event's counter row stays locked until the request's
+    # transaction (ATOMIC_REQUESTS) ends, so two people can't both take the
+    # last spot.
     if (event.max_capacity and event.max_capacity > 0 and
-            Roster.objects.filter(event=event).count() >= event.max_capacity):
+            RegistrationEventCounter.get_for_event(event.pk, lock=lock).roster_count >= event.max_capacity):
         return registration_error(request, event, "registration_capacity")
     else:
         return False
@@ -201,7 +205,8 @@ class RegisterShowForm(LoginRequiredMixin, RegistrationView):
         billing_period = self.get_billing_period()
 
         if billing_period:
-            billing_amount = billing_period.get_invoice_amount(self.get_invite_billing_group(request))
+            billing_amount = InvoiceAmountResolver.for_league(self.event.league_id).get_invoice_amount(
+                billing_period, self.get_invite_billing_group(request))
         else:
             billing_amount = 0
 
@@ -283,7 +288,7 @@ class RegisterShowForm(LoginRequiredMixin, RegistrationView):
         })
 
     def post(self, request, event_slug, league_slug):
-        at_capacity = check_event_at_capacity(request, self.event)
+        at_capacity = check_event_at_capacity(request, self.event, lock=True)
         if at_capacity:
             return at_capacity
 
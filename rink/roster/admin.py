@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import RosterSearchEntry
+
+
+@admin.register(RosterSearchEntry)
+class RosterSearchEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'league', 'unpaid_invoice_count', 'unpaid_due_date')
+    list_filter = ('league',)
+    search_fields = ('search_text',)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RosterConfig(AppConfig):
     name = 'roster'
+
+    def ready(self):
+        import roster.handlers  # noqa
@@ -1,6 +1,20 @@
 from billing.models import Invoice, BillingSubscription
 
 
+class LazyBadgeCount(object):
+    # Templates call this when they use the badge, so the count query only
+    # runs on pages that actually show it (and only once per request).
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.count = None
+
+    def __call__(self):
+        if self.count is None:
+            self.count = self.queryset.count()
+        # Zero shows no badge.
+        return self.count or None
+
+
 def roster_billing_badges(request):
     try:
         if 'roster' in request.resolver_match.namespaces:
@@ -18,23 +32,17 @@ def roster_billing_badges(request):
             user__pk=user_id,
             league__pk=league_id,
             status='unpaid'
-        ).count()
+        )
 
         active_subscriptions = BillingSubscription.objects.filter(
             user__pk=user_id,
             league__pk=league_id,
             status='active',
-        ).count()
-
-        if unpaid_invoices == 0:
-            unpaid_invoices = None
-        if active_subscriptions == 0:
-            active_subscriptions = None
+        )
 
         return {
-            'unpaid_invoice_count': unpaid_invoices,
-            'active_subscription_count': active_subscriptions,
+            'unpaid_invoice_count': LazyBadgeCount(unpaid_invoices),
+            'active_subscription_count': LazyBadgeCount(active_subscriptions),
         }
     else:
         return {}
-
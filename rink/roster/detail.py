@@ -0,0 +1,76 @@
+"""
+Everything the roster admin pages show about one member of a league, loaded
+in a fixed number of queries however many events, invoices or signatures
+they have. Used by the event roster detail page and the roster admin tabs.
+"""
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from billing.models import BillingPeriod, BillingSubscription, Invoice, UserStripeCard
+from billing.resolvers import InvoiceAmountResolver
+from legal.models import LegalSignature
+from registration.models import RegistrationData
+
+
+ROSTER_DETAIL_SECTIONS = ('registrations', 'invoices', 'subscription', 'future_invoices', 'card')
+
+
+def get_roster_detail(league, user, event=None, sections=ROSTER_DETAIL_SECTIONS):
+    """
+    Context for a member's roster pages. With an event only that event's
+    registration and invoices are included. sections picks what to load,
+    each one costs one query (two for registrations, with their signatures).
+    """
+    detail = {'user': user}
+
+    if 'registrations' in sections:
+        registrations = RegistrationData.objects.filter(
+            user=user,
+            event__league=league,
+        ).select_related(
+            'event', 'invite', 'derby_insurance_type',
+        ).prefetch_related(
+            Prefetch('legalsignature_set', queryset=LegalSignature.objects.select_related(
+                'document', 'document__league').order_by('pk')),
+        ).order_by('-registration_date')
+        if event is not None:
+            registrations = registrations.filter(event=event)
+        registrations = list(registrations)
+
+        detail['registrations'] = registrations
+        detail['registration_data'] = registrations[0] if registrations else None
+        detail['signatures'] = [
+            signature for registration in registrations for signature in registration.legalsignature_set.all()
+        ]
+
+    if 'invoices' in sections:
+        invoices = Invoice.objects.filter(
+            league=league,
+            user=user,
+        ).select_related('payment').order_by('-invoice_date', '-pk')
+        if event is not None:
+            invoices = invoices.filter(billing_period__event=event)
+        invoices = list(invoices)
+
+        detail['invoices'] = invoices
+        detail['invoices_unpaid_count'] = sum(1 for invoice in invoices if invoice.status == 'unpaid')
+
+    if 'subscription' in sections and event is not None:
+        detail['billing_subscription'] = BillingSubscription.objects.filter(
+            event=event, user=user).order_by('-pk').first()
+
+    if 'future_invoices' in sections and event is not None:
+        billing_periods_future = list(BillingPeriod.objects.filter(
+            event=event,
+            invoice_date__gt=timezone.now(),
+        ).order_by('invoice_date'))
+        if billing_periods_future:
+            amounts = InvoiceAmountResolver.for_league(league)
+            for billing_period in billing_periods_future:
+                billing_period.invoice_amount = amounts.get_invoice_amount(billing_period, user=user)
+        detail['billing_periods_future'] = billing_periods_future
+
+    if 'card' in sections:
+        detail['card_on_file'] = UserStripeCard.objects.filter(league=league, user=user).first()
+
+    return detail
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from billing.models import BillingGroupMembership, Invoice
+from league.models import LeagueMembership
+from users.models import User, UserTag
+
+from .models import RosterSearchEntry
+from .search import refresh_search_entries
+
+
+@receiver(post_save, sender=User)
+def refresh_search_for_user(sender, instance, created, update_fields=None, **kwargs):
+    # Logging in only touches last_login, nothing searchable.
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    for league_id in RosterSearchEntry.objects.filter(user=instance).values_list('league_id', flat=True):
+        refresh_search_entries(league_id, [instance.pk])
+
+
+# Deletes can cascade from the user or league itself, so they only ever
+# update entries that are already there.
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=BillingGroupMembership)
+def refresh_search_for_league_user(sender, instance, **kwargs):
+    refresh_search_entries(instance.league_id, [instance.user_id])
+
+
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=BillingGroupMembership)
+def refresh_search_for_league_user_delete(sender, instance, **kwargs):
+    refresh_search_entries(instance.league_id, [instance.user_id], create=False)
+
+
+@receiver(post_save, sender=UserTag)
+def refresh_search_for_user_tag(sender, instance, **kwargs):
+    refresh_search_entries(instance.tag.league_id, [instance.user_id])
+
+
+@receiver(post_delete, sender=UserTag)
+def refresh_search_for_user_tag_delete(sender, instance, **kwargs):
+    refresh_search_entries(instance.tag.league_id, [instance.user_id], create=False)
+
+
+@receiver(post_save, sender=LeagueMembership)
+def refresh_search_for_league_membership(sender, instance, created, **kwargs):
+    # Joining a league adds the member's entry.
+    if created:
+        refresh_search_entries(instance.league_id, [instance.user_id])
+
+
+@receiver(post_delete, sender=LeagueMembership)
+def refresh_search_for_league_membership_delete(sender, instance, **kwargs):
+    refresh_search_entries(instance.league_id, [instance.user_id], create=False)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from league.models import League
+from roster.search import refresh_search_entries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the roster search index from users, invoices, tags and billing groups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', help="League slug, defaults to all leagues.")
+
+    def handle(self, *args, **options):
+        leagues = League.objects.order_by('pk')
+        if options['league']:
+            leagues = leagues.filter(slug=options['league'])
+            if not leagues.exists():
+                raise CommandError("No league with slug '{}'.".format(options['league']))
+
+        for league in leagues:
+            with transaction.atomic():
+                refresh_search_entries(league.pk)
+            self.stdout.write("Rebuilt roster search for {}.".format(league))
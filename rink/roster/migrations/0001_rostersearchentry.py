@@ -0,0 +1,66 @@
+# Generated by Django 2.1.5 on 2026-10-18 01:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Trigram indexes let Postgres use an index for the LIKE '%...%' searches on
+# the roster. Other databases just get the plain table.
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in ('search_text', 'invoice_ids', 'tag_ids'):
+        schema_editor.execute(
+            "CREATE INDEX roster_search_{0}_trgm ON roster_rostersearchentry "
+            "USING gin ({0} gin_trgm_ops)".format(column)
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in ('search_text', 'invoice_ids', 'tag_ids'):
+        schema_editor.execute("DROP INDEX IF EXISTS roster_search_{}_trgm".format(column))
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing', '0009_captureattempt'),
+        ('league', '0003_auto_20180904_1548'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RosterSearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('search_text', models.TextField(blank=True)),
+                ('invoice_ids', models.TextField(blank=True)),
+                ('tag_ids', models.TextField(blank=True)),
+                ('unpaid_invoice_count', models.PositiveIntegerField(default=0)),
+                ('unpaid_due_date', models.DateField(blank=True, null=True)),
+                ('billing_group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='billing.BillingGroup')),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='league.League')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='rostersearchentry',
+            index=models.Index(fields=['league', 'unpaid_due_date'], name='roster_rost_league__ba5d2e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rostersearchentry',
+            index=models.Index(fields=['league', 'billing_group'], name='roster_rost_league__d3dd56_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='rostersearchentry',
+            unique_together={('league', 'user')},
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
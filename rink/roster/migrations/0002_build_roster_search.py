@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def build_roster_search(apps, schema_editor):
+    # The roster list only reads the search index, fill it for existing
+    # leagues. This uses the live index builder, it only reads columns that
+    # existed when the index was added. A new database has no leagues.
+    from roster.search import refresh_search_entries
+
+    League = apps.get_model('league', 'League')
+    for league_id in League.objects.values_list('pk', flat=True):
+        refresh_search_entries(league_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('league', '0005_backfill_leaguemembership'),
+        ('roster', '0001_rostersearchentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_roster_search, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,47 @@
 from django.db import models
 
-# Create your models here.
+
+class RosterSearchEntry(models.Model):
+    # One row per league member, denormalized from the user, their invoices,
+    # tags and billing group so the roster list can search and filter a
+    # single indexed table. Kept up to date by roster.handlers.
+    league = models.ForeignKey(
+        'league.League',
+        on_delete=models.CASCADE,
+    )
+
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+    )
+
+    # Lowercased names, email and invoice descriptions, one per line.
+    search_text = models.TextField(blank=True)
+
+    # Pipe delimited IDs, eg. "|4|17|", so a single id can be matched with
+    # contains="|4|".
+    invoice_ids = models.TextField(blank=True)
+    tag_ids = models.TextField(blank=True)
+
+    # Null means the league's default group.
+    billing_group = models.ForeignKey(
+        'billing.BillingGroup',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+
+    unpaid_invoice_count = models.PositiveIntegerField(default=0)
+
+    # Earliest due date of the member's unpaid invoices in this league.
+    unpaid_due_date = models.DateField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['league', 'user']
+        indexes = [
+            models.Index(fields=['league', 'unpaid_due_date']),
+            models.Index(fields=['league', 'billing_group']),
+        ]
+
+    def __str__(self):
+        return "{} - {}".format(self.league, self.user)
@@ -0,0 +1,170 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+
+from billing.models import BillingGroupMembership, Invoice
+from league.models import LeagueMembership
+from users.models import User, UserTag
+
+from .models import RosterSearchEntry
+
+
+SEARCH_ENTRY_FIELDS = (
+    'search_text', 'invoice_ids', 'tag_ids', 'billing_group_id', 'unpaid_invoice_count', 'unpaid_due_date',
+)
+
+
+def join_ids(ids):
+    if not ids:
+        return ""
+    return "|{}|".format("|".join(str(pk) for pk in sorted(ids)))
+
+
+def get_league_member_ids(league_id, user_ids=None):
+    # Users with any permission on the league.
+    memberships = LeagueMembership.objects.filter(league_id=league_id)
+    if user_ids is not None:
+        memberships = memberships.filter(user_id__in=user_ids)
+    return set(memberships.values_list('user_id', flat=True))
+
+
+def refresh_search_entries(league_id, user_ids=None, create=True):
+    """
+    Rebuild the roster search entries for some (or all) users in a league.
+
+    Reads everything in the same handful of queries however many users are
+    passed, and writes it back with one update plus one insert for new
+    entries. Users who are no longer league members have their entries
+    removed. With create=False only existing entries are rebuilt, for delete
+    handlers that may be running while the user or league itself is being
+    deleted.
+    """
+    member_ids = get_league_member_ids(league_id, user_ids)
+
+    existing = RosterSearchEntry.objects.filter(league_id=league_id)
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+    existing.exclude(user_id__in=member_ids).delete()
+    if not create:
+        member_ids &= set(existing.values_list('user_id', flat=True))
+
+    if not member_ids:
+        return
+
+    entries = {
+        user.pk: {
+            'text': [user.first_name, user.last_name, user.derby_name, user.email],
+            'invoice_ids': set(),
+            'tag_ids': set(),
+            'billing_group_id': None,
+            'unpaid_invoice_count': 0,
+            'unpaid_due_date': None,
+        }
+        for user in User.objects.filter(pk__in=member_ids).only('first_name', 'last_name', 'derby_name', 'email')
+    }
+
+    invoices = Invoice.objects.filter(league_id=league_id, user_id__in=member_ids).values_list(
+        'user_id', 'pk', 'description', 'status', 'due_date')
+    for user_id, invoice_id, description, status, due_date in invoices:
+        entry = entries[user_id]
+        entry['invoice_ids'].add(invoice_id)
+        entry['text'].append(description)
+        if status == 'unpaid':
+            entry['unpaid_invoice_count'] += 1
+            if not entry['unpaid_due_date'] or due_date < entry['unpaid_due_date']:
+                entry['unpaid_due_date'] = due_date
+
+    tags = UserTag.objects.filter(tag__league_id=league_id, user_id__in=member_ids).values_list('user_id', 'tag_id')
+    for user_id, tag_id in tags:
+        entries[user_id]['tag_ids'].add(tag_id)
+
+    memberships = BillingGroupMembership.objects.filter(league_id=league_id, user_id__in=member_ids).values_list(
+        'user_id', 'group_id')
+    for user_id, group_id in memberships:
+        entries[user_id]['billing_group_id'] = group_id
+
+    values = {
+        user_id: {
+            'search_text': "\n".join(text for text in entry['text'] if text).lower(),
+            'invoice_ids': join_ids(entry['invoice_ids']),
+            'tag_ids': join_ids(entry['tag_ids']),
+            'billing_group_id': entry['billing_group_id'],
+            'unpaid_invoice_count': entry['unpaid_invoice_count'],
+            'unpaid_due_date': entry['unpaid_due_date'],
+        }
+        for user_id, entry in entries.items()
+    }
+
+    # Updated in place rather than deleted and re-inserted: this runs on
+    # every invoice save, and two requests re-inserting the same member would
+    # collide on the (league, user) unique constraint. Unchanged rows are left
+    # alone.
+    current = {
+        row.pop('user_id'): row
+        for row in existing.filter(user_id__in=member_ids).values('user_id', *SEARCH_ENTRY_FIELDS)
+    }
+    changed = {
+        user_id: entry_values for user_id, entry_values in values.items()
+        if user_id in current and current[user_id] != entry_values
+    }
+    if changed:
+        # One UPDATE for all of them, each column a CASE on the user.
+        existing.filter(user_id__in=changed).update(**{
+            field: Case(
+                *[When(user_id=user_id, then=Value(entry_values[field])) for user_id, entry_values in changed.items()],
+                output_field=RosterSearchEntry._meta.get_field(field),
+            )
+            for field in SEARCH_ENTRY_FIELDS
+        })
+
+    # Deletes that may be cascading from the user or league only update.
+    missing = [user_id for user_id in values if user_id not in current]
+    if not create or not missing:
+        return
+    try:
+        with transaction.atomic():
+            RosterSearchEntry.objects.bulk_create([
+                RosterSearchEntry(league_id=league_id, user_id=user_id, **values[user_id]) for user_id in missing
+            ])
+    except IntegrityError:
+        # Another request added some of them first.
+        for user_id in missing:
+            RosterSearchEntry.objects.update_or_create(league_id=league_id, user_id=user_id, defaults=values[user_id])
+
+
+def search_roster(league, search=None, unpaid=False, overdue=False, tag_ids=None, billing_groups=None):
+    """
+    Filter the roster search entries for a league. Returns a queryset of
+    entries, matches from different filters are AND'ed, selected tags and
+    billing groups are OR'ed within their own filter.
+    """
+    entries = RosterSearchEntry.objects.filter(league=league)
+
+    if search:
+        q_search = Q(search_text__contains=search.lower())
+        if search.isdigit():
+            q_search |= Q(invoice_ids__contains="|{}|".format(search))
+        entries = entries.filter(q_search)
+
+    if unpaid:
+        entries = entries.filter(unpaid_invoice_count__gt=0)
+
+    if overdue:
+        entries = entries.filter(unpaid_due_date__lte=timezone.now().date())
+
+    if tag_ids:
+        q_tags = Q()
+        for tag_id in tag_ids:
+            q_tags |= Q(tag_ids__contains="|{}|".format(tag_id))
+        entries = entries.filter(q_tags)
+
+    if billing_groups:
+        q_bg = Q()
+        for billing_group in billing_groups:
+            # Members without a billing group are in the default group.
+            if billing_group.default_group_for_league:
+                q_bg |= Q(billing_group__isnull=True)
+            q_bg |= Q(billing_group=billing_group)
+        entries = entries.filter(q_bg)
+
+    return entries
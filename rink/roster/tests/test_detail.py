@@ -0,0 +1,136 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from datetime import timedelta
+
+from billing.models import BillingSubscription
+from billing.tests.factories import BillingPeriodFactory, InvoiceFactory
+from legal.models import LegalSignature
+from legal.tests.factories import LegalDocumentFactory
+from registration.models import Roster
+from registration.tests.factories import RegistrationDataFactory, RegistrationEventFactory
+from roster.detail import get_roster_detail
+from users.tests.factories import OrgAdminUserFactory, UserFactory, user_password
+
+
+class TestRosterDetail(TestCase):
+    def setUp(self):
+        self.admin = OrgAdminUserFactory()
+        self.league = self.admin.league
+        self.organization = self.league.organization
+        self.member = UserFactory(league=self.league, organization=self.organization)
+        self.events = [RegistrationEventFactory(league=self.league) for i in range(2)]
+        self.rosters = [self.add_event(event) for event in self.events]
+        cache.clear()
+
+    def add_event(self, event, invoices=1, signatures=1):
+        roster = Roster.objects.create(
+            user=self.member,
+            event=event,
+            email=self.member.email,
+            first_name=self.member.first_name,
+            last_name=self.member.last_name,
+        )
+        registration = RegistrationDataFactory(
+            user=self.member,
+            event=event,
+            roster=roster,
+            organization=self.organization,
+            invite__event=event,
+        )
+        BillingSubscription.objects.create(user=self.member, league=self.league, event=event, roster=roster)
+        self.add_invoices(event, invoices)
+        self.add_signatures(registration, signatures)
+        BillingPeriodFactory(
+            league=self.league,
+            event=event,
+            invoice_date=timezone.now().date() + timedelta(days=30),
+            due_date=timezone.now().date() + timedelta(days=37),
+        )
+        return roster
+
+    def add_invoices(self, event, count):
+        for i in range(count):
+            InvoiceFactory(
+                user=self.member,
+                billing_period=BillingPeriodFactory(
+                    league=self.league,
+                    event=event,
+                    start_date=timezone.now().date() - timedelta(days=60),
+                ),
+            )
+
+    def add_signatures(self, registration, count):
+        for i in range(count):
+            LegalSignature.objects.create(
+                user=self.member,
+                league=self.league,
+                event=registration.event,
+                registration=registration,
+                document=LegalDocumentFactory(league=self.league),
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return len(context.captured_queries)
+
+    def test_event_detail_is_scoped_to_member_and_event(self):
+        other = UserFactory(league=self.league, organization=self.organization)
+        InvoiceFactory(user=other, billing_period=BillingPeriodFactory(
+            league=self.league, event=self.events[0], start_date=timezone.now().date() - timedelta(days=60)))
+
+        detail = get_roster_detail(self.league, self.member, event=self.events[0])
+        self.assertEqual(len(detail['invoices']), 1)
+        self.assertEqual({invoice.user_id for invoice in detail['invoices']}, {self.member.pk})
+        self.assertEqual(detail['registration_data'].event, self.events[0])
+        self.assertEqual(len(detail['signatures']), 1)
+        self.assertEqual(detail['billing_subscription'].roster, self.rosters[0])
+        self.assertEqual(len(detail['billing_periods_future']), 1)
+
+        detail = get_roster_detail(self.league, self.member)
+        self.assertEqual(len(detail['invoices']), 2)
+        self.assertEqual(len(detail['registrations']), 2)
+
+    def test_constant_queries(self):
+        # Warm the invoice amount cache, it's shared between requests.
+        get_roster_detail(self.league, self.member, event=self.events[0])
+        with self.assertNumQueries(6):
+            get_roster_detail(self.league, self.member, event=self.events[0])
+
+        registration = self.rosters[0].registrationdata_set.get()
+        self.add_invoices(self.events[0], 5)
+        self.add_signatures(registration, 5)
+        cache.clear()
+        get_roster_detail(self.league, self.member, event=self.events[0])
+        with self.assertNumQueries(6):
+            detail = get_roster_detail(self.league, self.member, event=self.events[0])
+        self.assertEqual(len(detail['invoices']), 6)
+        self.assertEqual(len(detail['signatures']), 6)
+
+    def test_views_constant_queries(self):
+        self.client.login(email=self.admin.email, password=user_password)
+        urls = [
+            reverse(
+                'registration:event_admin_roster_detail',
+                kwargs={'event_slug': self.events[0].slug, 'roster_id': self.rosters[0].pk},
+            ),
+            reverse('roster:admin_billing', kwargs={'pk': self.member.pk}),
+            reverse('roster:admin_events', kwargs={'pk': self.member.pk}),
+            reverse('roster:admin_legal', kwargs={'pk': self.member.pk}),
+        ]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        before = [self.count_queries(url) for url in urls]
+
+        for event in self.events:
+            self.add_invoices(event, 3)
+            self.add_signatures(self.member.registrationdata_set.get(event=event), 3)
+        self.add_event(RegistrationEventFactory(league=self.league), invoices=3, signatures=3)
+        for url in urls:
+            self.client.get(url)
+        self.assertEqual([self.count_queries(url) for url in urls], before)
@@ -0,0 +1,125 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from datetime import timedelta
+from guardian.shortcuts import remove_perm
+from io import StringIO
+from unittest.mock import patch
+
+from billing.models import Invoice
+from billing.tests.factories import BillingGroupFactory, BillingGroupMembershipFactory
+from league.tests.factories import LeagueFactory
+from roster.models import RosterSearchEntry
+from roster.search import refresh_search_entries, search_roster
+from users.models import Tag, UserTag
+from users.tests.factories import OrgAdminUserFactory, UserFactory, UserFactoryNoPermissions, user_password
+
+
+class TestRosterSearch(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory()
+        self.organization = self.league.organization
+        self.jammer = UserFactory(
+            league=self.league, organization=self.organization,
+            first_name="Jane", last_name="Jammer", derby_name="Hip Check Hannah",
+        )
+        self.blocker = UserFactory(
+            league=self.league, organization=self.organization,
+            first_name="Bea", last_name="Blocker", derby_name="Wall Street",
+        )
+
+    def add_invoice(self, user, description, status='unpaid', due_in_days=7, **kwargs):
+        return Invoice.objects.create(
+            user=user,
+            league=self.league,
+            description=description,
+            invoice_amount=10,
+            invoice_date=timezone.now().date(),
+            due_date=timezone.now().date() + timedelta(days=due_in_days),
+            status=status,
+            **kwargs
+        )
+
+    def search(self, **kwargs):
+        return set(search_roster(self.league, **kwargs).values_list('user_id', flat=True))
+
+    def test_only_league_members_indexed(self):
+        UserFactoryNoPermissions(league=self.league, organization=self.organization)
+        UserFactory()
+        self.assertEqual(self.search(), {self.jammer.pk, self.blocker.pk})
+
+        remove_perm('league_member', self.blocker, self.league)
+        self.assertEqual(self.search(), {self.jammer.pk})
+
+    def test_search_text_and_invoice_numbers(self):
+        # A number that can't also turn up in anybody's email address.
+        invoice = self.add_invoice(self.blocker, "Summer Skating Dues", pk=987654)
+        self.assertEqual(self.search(search="hannah"), {self.jammer.pk})
+        self.assertEqual(self.search(search="SKATING"), {self.blocker.pk})
+        self.assertEqual(self.search(search=str(invoice.pk)), {self.blocker.pk})
+
+        # User changes are picked up
+        self.jammer.derby_name = "Skating Sally"
+        self.jammer.save()
+        self.assertEqual(self.search(search="skating"), {self.jammer.pk, self.blocker.pk})
+
+    def test_unpaid_and_overdue(self):
+        self.add_invoice(self.jammer, "Upcoming", due_in_days=7)
+        overdue = self.add_invoice(self.blocker, "Late", due_in_days=-7)
+        self.assertEqual(self.search(unpaid=True), {self.jammer.pk, self.blocker.pk})
+        self.assertEqual(self.search(overdue=True), {self.blocker.pk})
+
+        overdue.status = 'paid'
+        overdue.save()
+        self.assertEqual(self.search(unpaid=True), {self.jammer.pk})
+        self.assertEqual(self.search(overdue=True), set())
+
+    def test_tags_and_billing_groups(self):
+        tag = Tag.objects.create(league=self.league, text="Ref")
+        other_tag = Tag.objects.create(league=self.league, text="NSO")
+        user_tag = UserTag.objects.create(user=self.jammer, tag=tag)
+        self.assertEqual(self.search(tag_ids=[tag.pk]), {self.jammer.pk})
+        self.assertEqual(self.search(tag_ids=[other_tag.pk]), set())
+        user_tag.delete()
+        self.assertEqual(self.search(tag_ids=[tag.pk]), set())
+
+        default_group = BillingGroupFactory(league=self.league, default_group_for_league=True)
+        group = BillingGroupFactory(league=self.league)
+        BillingGroupMembershipFactory(league=self.league, group=group, user=self.blocker)
+        self.assertEqual(self.search(billing_groups=[group]), {self.blocker.pk})
+        self.assertEqual(self.search(billing_groups=[default_group]), {self.jammer.pk})
+
+    def test_entries_updated_in_place(self):
+        entry = RosterSearchEntry.objects.get(league=self.league, user=self.blocker)
+        self.add_invoice(self.blocker, "Summer Skating Dues")
+        self.assertEqual(RosterSearchEntry.objects.get(pk=entry.pk).unpaid_invoice_count, 1)
+
+        # An entry another request added after this one looked.
+        RosterSearchEntry.objects.filter(pk=entry.pk).update(search_text="")
+        with patch.object(RosterSearchEntry.objects, 'filter', return_value=RosterSearchEntry.objects.none()):
+            refresh_search_entries(self.league.pk, [self.blocker.pk])
+        self.assertIn("wall street", RosterSearchEntry.objects.get(pk=entry.pk).search_text)
+
+    def test_rebuild_command(self):
+        RosterSearchEntry.objects.all().delete()
+        call_command('rebuild_roster_search', stdout=StringIO())
+        self.assertEqual(self.search(search="wall street"), {self.blocker.pk})
+
+    def test_deactivated_member_not_unpaid(self):
+        # No billing group, nothing else refreshes the entry.
+        self.add_invoice(self.blocker, "Summer Skating Dues")
+        self.assertEqual(self.search(unpaid=True), {self.blocker.pk})
+
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+        self.client.post(reverse('roster:admin_membership_make_inactive', kwargs={'pk': self.blocker.pk}))
+        self.assertEqual(Invoice.objects.get(user=self.blocker).status, 'canceled')
+        self.assertEqual(self.search(unpaid=True), set())
+
+    def test_roster_list_view(self):
+        admin = OrgAdminUserFactory(organization=self.organization, league=self.league)
+        self.client.login(email=admin.email, password=user_password)
+        response = self.client.get(reverse('roster:list'), {'filtered': 1, 'search': 'hannah'})
+        self.assertEqual([user.pk for user in response.context['object_list']], [self.jammer.pk])
@@ -1,7 +1,7 @@
 
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import Http404, HttpResponse
+from django.db.models import Count
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 from django.utils import timezone
@@ -10,39 +10,42 @@ from django.views.generic import DetailView, UpdateView, ListView, FormView
 
 from django_tables2 import SingleTableView
 from django_filters.views import FilterView
-from guardian.shortcuts import get_users_with_perms, remove_perm, get_perms
+from guardian.shortcuts import remove_perm, get_perms
 
 from billing.forms import QuickPaymentForm, QuickInvoiceForm, QuickRefundForm
+from billing.ledger import update_invoices
 from billing.models import (
     Invoice, BillingGroupMembership, BillingGroup, BillingSubscription, Payment,
     UserStripeCard)
 from league.mixins import RinkLeagueAdminPermissionRequired
 from legal.models import LegalSignature
 from registration.models import RegistrationData, Roster, RegistrationInvite
+from rink.utils.export import streaming_csv_response
+from rink.utils.pagination import KeysetTableMixin
 from taskapp.celery import app as celery_app
 from users.models import User, Tag, UserTag, UserLog
 
+from .detail import get_roster_detail
 from .forms import (RosterProfileForm, BillingGroupForm,
     RosterFilterForm, RosterAddNoteForm, RosterCreateInvoiceForm,
     RosterMembershipRemoveMembership)
 from .resources import RosterResource
+from .search import refresh_search_entries, search_roster
 from .tables import RosterTable
 
 
-class RosterList(RinkLeagueAdminPermissionRequired, SingleTableView, FilterView):
+class RosterList(RinkLeagueAdminPermissionRequired, KeysetTableMixin, SingleTableView, FilterView):
     template_name = 'roster/list.html'
     paginate_by = 50
+    keyset_estimate_count = True
     table_class = RosterTable
     filter_form = None
 
     def get(self, request, *args, **kwargs):
         if request.GET.get('csv', None):
             roster = RegistrationData.objects.filter(organization__league=self.league)
-            roster_resource = RosterResource()
-            dataset = roster_resource.export(queryset=roster)
-            response = HttpResponse(dataset.csv, content_type='text/csv')
-            response['Content-Disposition'] = 'attachment;filename=Roster-{}-{}.csv'.format(self.league.name, timezone.now().date())
-            return response
+            return streaming_csv_response(
+                RosterResource(), roster, 'Roster-{}-{}.csv'.format(self.league.name, timezone.now().date()))
 
         return super().get(request, *args, **kwargs)
 
@@ -63,77 +66,37 @@ class RosterList(RinkLeagueAdminPermissionRequired, SingleTableView, FilterView)
         return self.filter_form
 
     def get_queryset(self):
-        # https://stackoverflow.com/a/29149972
+        # Searching and filtering run against the roster search index, see
+        # roster.search.
         filter_form = self.get_filter_form()
-        q_all = Q()
+        filters = {}
 
         if filter_form.is_valid():
             # SEARCH BOX
-            # match names, emails, maybe other things
-            search = filter_form.cleaned_data['search']
-            if search:
-                q_search = Q()
-                q_search.add(Q(first_name__icontains=search), Q.OR)
-                q_search.add(Q(last_name__icontains=search), Q.OR)
-                q_search.add(Q(derby_name__icontains=search), Q.OR)
-                q_search.add(Q(email__icontains=search), Q.OR)
-                q_search.add(Q(invoice__description__icontains=search), Q.OR)
-                if search.isdigit():
-                    q_search.add(Q(invoice__pk=search), Q.OR)
-                q_all.add(q_search, Q.AND)
+            # match names, emails, invoice descriptions and invoice numbers
+            filters['search'] = filter_form.cleaned_data['search']
 
             # BILLING FILTERS
             # invoice due, invoice overdue
-            unpaid = filter_form.cleaned_data['unpaid_invoice']
-            invoice_overdue = filter_form.cleaned_data['invoice_overdue']
-
-            if unpaid:
-                q_all.add(Q(invoice__status='unpaid'), Q.AND)
-
-            if invoice_overdue:
-                q_overdue = Q()
-                q_overdue.add(Q(invoice__status='unpaid'), Q.AND)
-                q_overdue.add(Q(invoice__due_date__lte=timezone.now()), Q.AND)
-                q_all.add(q_overdue, Q.AND)
+            filters['unpaid'] = filter_form.cleaned_data['unpaid_invoice']
+            filters['overdue'] = filter_form.cleaned_data['invoice_overdue']
 
             # USER TAGS
             # match users tagged with admin-defined tags names
-            q_tags = None
-            for tag in Tag.objects.filter(league=self.league):
-                if filter_form.cleaned_data.get('tag{}'.format(tag.pk), None):
-                    if not q_tags:
-                        q_tags = Q()
-                    q_tags.add(Q(tags__pk=tag.pk), Q.OR)
-            if q_tags:
-                q_all.add(q_tags, Q.AND)
+            filters['tag_ids'] = [
+                tag.pk for tag in Tag.objects.filter(league=self.league)
+                if filter_form.cleaned_data.get('tag{}'.format(tag.pk), None)
+            ]
 
             # BILLING GROUPS
             # Billing Group filters the are league-wide for determining billing amount
-            q_bg = None
-            for bg in BillingGroup.objects.filter(league=self.league):
-                if filter_form.cleaned_data.get('billing_group{}'.format(bg.pk), None):
-                    if not q_bg:
-                        q_bg = Q()
-
-                    # Default group, search for:
-                    # - billing group membership is null
-                    # - OR the billing group membership is there
-                    if bg.default_group_for_league:
-                        q_bg.add(
-                            Q(billinggroupmembership__isnull=True) | Q(billinggroupmembership__group__pk=bg.pk),
-                            Q.OR)
-                    # Not the default group, just search for it by group PK:
-                    else:
-                        q_bg.add(Q(billinggroupmembership__group__pk=bg.pk), Q.OR)
-
-            if q_bg:
-                q_all.add(q_bg, Q.AND)
-
-        queryset = get_users_with_perms(self.league)
-        if q_all != Q():
-            return queryset.filter(q_all)
-        else:
-            return queryset
+            filters['billing_groups'] = [
+                bg for bg in BillingGroup.objects.filter(league=self.league)
+                if filter_form.cleaned_data.get('billing_group{}'.format(bg.pk), None)
+            ]
+
+        entries = search_roster(self.league, **filters)
+        return User.objects.filter(pk__in=entries.values('user_id'))
 
     def get_context_data(self, **kwargs):
         additional_context = {
@@ -157,11 +120,9 @@ class RosterAdminEvents(RinkLeagueAdminPermissionRequired, DetailView):
     model = User
 
     def get_context_data(self, **kwargs):
+        detail = get_roster_detail(self.league, self.object, sections=['registrations'])
         additional_context = {
-            'event_signups': RegistrationData.objects.filter(
-                user=self.object,
-                event__league=self.league,
-            ),
+            'event_signups': detail['registrations'],
         }
         return {**super().get_context_data(**kwargs), **additional_context}
 
@@ -171,36 +132,33 @@ class RosterAdminBilling(RinkLeagueAdminPermissionRequired, DetailView):
     model = Invoice
 
     def get_object(self, queryset=None):
+        # The selected invoice comes out of the member's invoice list, the
+        # newest one if none was picked.
         user = get_object_or_404(User, pk=self.kwargs['pk'])
+        self.detail = get_roster_detail(self.league, user, sections=['invoices'])
+        invoices = self.detail['invoices']
+
         invoice_id = self.kwargs.get('invoice_id', None)
         if not invoice_id:
-            try:
-                return Invoice.objects.filter(
-                    league=self.league,
-                    user=user,
-                ).order_by('-invoice_date').first()
-            except Invoice.ObjectDoesNotExist:
-                return None
+            return invoices[0] if invoices else None
 
-        invoice = get_object_or_404(Invoice, pk=invoice_id, user=user)
-        return invoice
+        for invoice in invoices:
+            if invoice.pk == int(invoice_id):
+                return invoice
+        raise Http404("Invoice not found.")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = get_object_or_404(User, pk=self.kwargs['pk'])
 
         if self.object:
-            try:
-                context['payment'] = self.object.payment
-            except AttributeError:
-                context['payment'] = None
-
+            context['payment'] = self.object.payment
             context['payment_form'] = QuickPaymentForm(initial={'amount': self.object.invoice_amount})
             context['invoice_form'] = QuickInvoiceForm(instance=self.object)
             context['refund_form'] = QuickRefundForm(initial={'refund_amount': self.object.invoice_amount})
 
+        user = self.detail['user']
         context['user'] = user
-        context['invoices'] = Invoice.objects.filter(league=self.league, user=user).order_by('-invoice_date')
+        context['invoices'] = self.detail['invoices']
         context['billing_group_form'] = BillingGroupForm(league=self.league, user=user)
         context['create_invoice_form'] = RosterCreateInvoiceForm(initial={
             'invoice_amount': 0,
@@ -333,11 +291,9 @@ class RosterAdminLegal(RinkLeagueAdminPermissionRequired, DetailView):
     model = User
 
     def get_context_data(self, **kwargs):
+        detail = get_roster_detail(self.league, self.object, sections=['registrations'])
         additional_context = {
-            'registration_data': RegistrationData.objects.filter(
-                user=self.object,
-                event__league=self.league,
-            ),
+            'registration_data': detail['registrations'],
         }
         return {**super().get_context_data(**kwargs), **additional_context}
 
@@ -488,11 +444,14 @@ class RosterAdminDeactivateUser(RinkLeagueAdminPermissionRequired, View):
         user = get_object_or_404(User, pk=kwargs['pk'])
 
         # Cancel all unpaid invoices
-        Invoice.objects.filter(
+        update_invoices(Invoice.objects.filter(
             user=user,
             league=self.league,
             status='unpaid',
-        ).update(status='canceled')
+        ), status='canceled')
+        # The update skips the invoice handlers that keep the roster search
+        # current, and only members in a billing group get refreshed below.
+        refresh_search_entries(self.league.pk, [user.pk])
 
         # Remove from all active event rosters
         Roster.objects.filter(
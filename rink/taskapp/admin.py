@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import TaskRun
+
+
+@admin.register(TaskRun)
+class TaskRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'task_name', 'status', 'started_date', 'runtime_ms', 'queue_wait_ms', 'items', 'retries', 'exception_class',
+    )
+    list_filter = ('status', 'task_name')
+    date_hierarchy = 'started_date'
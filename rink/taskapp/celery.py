@@ -42,6 +42,9 @@ class CeleryConfig(AppConfig):
         installed_apps = [app_config.name for app_config in apps.get_app_configs()]
         app.autodiscover_tasks(lambda: installed_apps, force=True)
 
+        # Records a TaskRun for every task execution
+        from taskapp import metrics  # noqa F401
+
 
 @app.task(bind=True)
 def debug_task(self):
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.utils import timezone
+
+from taskapp.models import TaskRun
+
+
+class Command(BaseCommand):
+    help = "Print runs, failures, items handled and queue wait per celery task over a time window."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help="Size of the window, ending now. Defaults to 24.")
+        parser.add_argument(
+            '--task', action='append', help="Task name, can be given more than once. Defaults to all tasks.")
+
+    def handle(self, *args, **options):
+        hours = options['hours']
+        runs = TaskRun.objects.filter(started_date__gte=timezone.now() - timezone.timedelta(hours=hours))
+        if options['task']:
+            runs = runs.filter(task_name__in=options['task'])
+
+        stats = runs.values('task_name').annotate(
+            runs=Count('pk'),
+            failed=Count('pk', filter=Q(status='failed')),
+            retried=Count('pk', filter=Q(status='retried')),
+            item_count=Sum('items'),
+            runtime=Sum('runtime_ms'),
+            item_runtime=Sum('runtime_ms', filter=Q(items__gt=0)),
+            avg_wait=Avg('queue_wait_ms'),
+            max_wait=Max('queue_wait_ms'),
+        ).order_by('task_name')
+
+        failures = {}
+        for task_name, exception_class, count in runs.exclude(exception_class="").values_list(
+                'task_name', 'exception_class').annotate(count=Count('pk')).order_by('task_name', '-count'):
+            failures.setdefault(task_name, []).append("{} x{}".format(exception_class, count))
+
+        row = "{:<55} {:>6} {:>6} {:>6} {:>8} {:>9} {:>9} {:>9} {:>10} {:>10}"
+        self.stdout.write("Task throughput for the last {:g} hour(s)".format(hours))
+        self.stdout.write(row.format(
+            "task", "runs", "failed", "retry", "items", "items/h", "avg ms", "ms/item", "avg wait", "max wait"))
+
+        for stat in stats:
+            items = stat['item_count'] or 0
+            self.stdout.write(row.format(
+                stat['task_name'],
+                stat['runs'],
+                stat['failed'],
+                stat['retried'],
+                items,
+                "{:.1f}".format(items / hours),
+                "{:.1f}".format(stat['runtime'] / stat['runs']),
+                "{:.1f}".format(stat['item_runtime'] / items) if items and stat['item_runtime'] else "-",
+                "{:.0f}".format(stat['avg_wait']) if stat['avg_wait'] is not None else "-",
+                "{:.0f}".format(stat['max_wait']) if stat['max_wait'] is not None else "-",
+            ))
+            if stat['task_name'] in failures:
+                self.stdout.write("    errors: {}".format(", ".join(failures[stat['task_name']])))
+
+        if not stats:
+            self.stdout.write("No task runs recorded.")
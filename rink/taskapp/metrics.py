@@ -0,0 +1,122 @@
+"""
+Records a TaskRun for every celery task execution: how long it ran, how long
+it waited in the queue, how many items it handled, retries and failures by
+exception class. Hooked up through celery's signals so tasks don't need to do
+anything except call record_items() if they process a batch.
+"""
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from celery import current_task
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun, task_retry
+import logging
+import threading
+from time import perf_counter, time
+
+from .models import TaskRun
+
+
+logger = logging.getLogger(__name__)
+
+# Message header holding the time the task was queued.
+SENT_AT_HEADER = 'rink_sent_at'
+
+TASK_RUN_STATUSES = {
+    'SUCCESS': 'succeeded',
+    'FAILURE': 'failed',
+    'RETRY': 'retried',
+}
+
+# Runs in progress in this thread, by task id. Eager tasks can run inside
+# other tasks, and an eager retry runs inside the attempt it retries with the
+# same task id, so each id has a stack of runs.
+_local = threading.local()
+
+
+def get_runs():
+    if not hasattr(_local, 'runs'):
+        _local.runs = {}
+    return _local.runs
+
+
+def get_current_run(task_id):
+    runs = get_runs().get(task_id)
+    return runs[-1] if runs else None
+
+
+def record_items(count):
+    # Adds to the number of items the current task has handled.
+    task = current_task
+    run = get_current_run(task.request.id) if task else None
+    if run is not None:
+        run['items'] = (run['items'] or 0) + count
+
+
+def get_sent_at(request):
+    sent_at = getattr(request, SENT_AT_HEADER, None)
+    if sent_at is None:
+        sent_at = (getattr(request, 'headers', None) or {}).get(SENT_AT_HEADER)
+    return sent_at
+
+
+@before_task_publish.connect
+def stamp_sent_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(SENT_AT_HEADER, time())
+
+
+@task_prerun.connect
+def start_task_run(task_id=None, task=None, **kwargs):
+    sent_at = get_sent_at(task.request)
+    get_runs().setdefault(task_id, []).append({
+        'started_date': timezone.now(),
+        'start': perf_counter(),
+        'queue_wait_ms': max(time() - sent_at, 0) * 1000 if sent_at else None,
+        'items': None,
+        'exception_class': "",
+    })
+
+
+@task_failure.connect
+def record_task_failure(task_id=None, exception=None, **kwargs):
+    run = get_current_run(task_id)
+    if run is not None:
+        run['exception_class'] = exception.__class__.__name__
+
+
+@task_retry.connect
+def record_task_retry(request=None, reason=None, **kwargs):
+    # reason is celery's Retry, wrapping the exception that caused it if any.
+    run = get_current_run(request.id) if request else None
+    if run is not None:
+        exception = getattr(reason, 'exc', None) or reason
+        run['exception_class'] = exception.__class__.__name__
+
+
+@task_postrun.connect
+def finish_task_run(task_id=None, task=None, state=None, **kwargs):
+    runs = get_runs().get(task_id)
+    if not runs:
+        return
+    run = runs.pop()
+    if not runs:
+        del get_runs()[task_id]
+    if state not in TASK_RUN_STATUSES:
+        return
+
+    try:
+        with transaction.atomic():
+            TaskRun.objects.create(
+                task_name=task.name,
+                task_id=task_id or "",
+                status=TASK_RUN_STATUSES[state],
+                started_date=run['started_date'],
+                runtime_ms=(perf_counter() - run['start']) * 1000,
+                queue_wait_ms=run['queue_wait_ms'],
+                items=run['items'],
+                retries=task.request.retries or 0,
+                exception_class=run['exception_class'],
+            )
+    except DatabaseError:
+        # Metrics are never worth failing a task over.
+        logger.exception("Could not record task run for %s", task.name)
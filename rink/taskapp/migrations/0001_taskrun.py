@@ -0,0 +1,33 @@
+# Generated by Django 2.1.5 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=255)),
+                ('task_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('succeeded', 'Succeeded'), ('failed', 'Failed'), ('retried', 'Retried')], max_length=20)),
+                ('started_date', models.DateTimeField()),
+                ('runtime_ms', models.FloatField()),
+                ('queue_wait_ms', models.FloatField(blank=True, null=True)),
+                ('items', models.PositiveIntegerField(blank=True, null=True)),
+                ('retries', models.PositiveIntegerField(default=0)),
+                ('exception_class', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taskrun',
+            index=models.Index(fields=['started_date', 'task_name'], name='taskapp_tas_started_49ddae_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import models
+
+
+TASK_RUN_STATUS_CHOICES = [
+    ('succeeded', 'Succeeded'),
+    ('failed', 'Failed'),
+    ('retried', 'Retried'),
+]
+
+
+class TaskRun(models.Model):
+    # One row per celery task execution, written by taskapp.metrics.
+    task_name = models.CharField(max_length=255)
+
+    task_id = models.CharField(max_length=255, blank=True)
+
+    status = models.CharField(
+        max_length=20,
+        choices=TASK_RUN_STATUS_CHOICES,
+    )
+
+    started_date = models.DateTimeField()
+
+    runtime_ms = models.FloatField()
+
+    # Time between the task being queued and a worker starting it. Null for
+    # tasks queued by something that doesn't stamp the send time.
+    queue_wait_ms = models.FloatField(null=True, blank=True)
+
+    # Invoices, emails etc. handled by this run, as reported by the task with
+    # taskapp.metrics.record_items. Null if the task doesn't report any.
+    items = models.PositiveIntegerField(null=True, blank=True)
+
+    # How many times this task had been retried before this run.
+    retries = models.PositiveIntegerField(default=0)
+
+    exception_class = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['started_date', 'task_name']),
+        ]
+
+    def __str__(self):
+        return "{} {} {}".format(self.task_name, self.status, self.started_date)
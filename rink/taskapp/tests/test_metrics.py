@@ -0,0 +1,90 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from celery import shared_task
+from celery.backends.base import DisabledBackend
+from io import StringIO
+from time import time
+
+from taskapp.metrics import SENT_AT_HEADER, record_items, stamp_sent_at
+from taskapp.models import TaskRun
+
+
+class MetricsTestError(Exception):
+    pass
+
+
+@shared_task(bind=True, max_retries=1, default_retry_delay=0)
+def metrics_test_task(self, items=0, fail=False, retry=False):
+    if items:
+        record_items(items)
+    if retry and not self.request.retries:
+        raise self.retry(exc=MetricsTestError())
+    if fail:
+        raise MetricsTestError()
+
+
+# Nothing here needs the results, and it keeps apply() from loading the
+# configured result backend.
+metrics_test_task.backend = DisabledBackend(metrics_test_task.app)
+
+
+class TestTaskMetrics(TestCase):
+    def test_success(self):
+        metrics_test_task.apply(kwargs={'items': 3}, headers={SENT_AT_HEADER: time() - 5})
+
+        run = TaskRun.objects.get()
+        self.assertEqual(run.task_name, metrics_test_task.name)
+        self.assertEqual(run.status, 'succeeded')
+        self.assertEqual(run.items, 3)
+        self.assertEqual(run.exception_class, "")
+        self.assertGreaterEqual(run.queue_wait_ms, 5000)
+        self.assertGreaterEqual(run.runtime_ms, 0)
+
+    def test_failure(self):
+        metrics_test_task.apply(kwargs={'fail': True})
+
+        run = TaskRun.objects.get()
+        self.assertEqual(run.status, 'failed')
+        self.assertEqual(run.exception_class, 'MetricsTestError')
+        self.assertIsNone(run.items)
+        self.assertIsNone(run.queue_wait_ms)
+
+    def test_retry(self):
+        metrics_test_task.apply(kwargs={'retry': True})
+
+        runs = {run.status: run for run in TaskRun.objects.all()}
+        self.assertEqual(runs['retried'].exception_class, 'MetricsTestError')
+        self.assertEqual(runs['succeeded'].retries, 1)
+
+    def test_record_items_outside_task(self):
+        record_items(5)
+        self.assertFalse(TaskRun.objects.exists())
+
+    def test_publish_stamps_sent_at(self):
+        headers = {}
+        stamp_sent_at(headers=headers)
+        self.assertAlmostEqual(headers[SENT_AT_HEADER], time(), delta=5)
+
+
+class TestTaskThroughputCommand(TestCase):
+    def test_report(self):
+        now = timezone.now()
+        runs = [(10, 'succeeded', ""), (30, 'succeeded', ""), (None, 'failed', "CardError")]
+        for items, status, exception_class in runs:
+            TaskRun.objects.create(
+                task_name='billing.tasks.email_invoices', status=status, started_date=now, runtime_ms=100,
+                queue_wait_ms=50, items=items, exception_class=exception_class)
+        TaskRun.objects.create(
+            task_name='voting.tasks.send_voting_invite', status='succeeded',
+            started_date=now - timezone.timedelta(hours=3), runtime_ms=100)
+
+        out = StringIO()
+        call_command('task_throughput', '--hours', '2', stdout=out)
+        report = out.getvalue()
+
+        line = [line for line in report.splitlines() if line.startswith('billing.tasks.email_invoices')][0]
+        self.assertEqual(line.split()[1:], ['3', '1', '0', '40', '20.0', '100.0', '5.0', '50', '50'])
+        self.assertIn("errors: CardError x1", report)
+        self.assertNotIn('voting.tasks.send_voting_invite', report)
@@ -9,10 +9,8 @@ from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
 from markdownx.utils import markdownify
 
-from league.models import League
-
-from guardian.shortcuts import (
-    assign_perm, get_perms, get_perms_for_model, get_objects_for_user)
+from league.middleware import clear_request_league
+from users.permissions import get_permission_versions, get_rink_permissions
 
 
 class RinkUserManager(BaseUserManager):
@@ -274,7 +272,8 @@ class UserLog(models.Model):
 def set_rink_session_data(sender, user, request, **kwargs):
     # Assist in figuring out which sections of the nav to show for admins
     # This pretty much just makes the permissions pretty and caches them for
-    # future use.
+    # future use. The permissions themselves come from the user's cached
+    # permission snapshot, see users.permissions.
 
     try:
         view_league = kwargs.get('league', user.league)
@@ -283,43 +282,22 @@ def set_rink_session_data(sender, user, request, **kwargs):
 
     view_organization = view_league.organization
 
-    user_member_leagues = get_objects_for_user(user, 'league_member', League)
-    #if view_league not in user_member_leagues:
-    #    raise PermissionDenied("You do not appear to have access to this league. Please contact your league admin for assistance. Sorry.")
-
     # Organization
     request.session['view_organization'] = view_organization.pk
     request.session['view_organization_slug'] = view_organization.slug
-    request.session['organization_permissions'] = get_perms(user, view_organization)
 
     # League
     request.session['view_league'] = view_league.pk
     request.session['view_league_slug'] = view_league.slug
-    request.session['league_permissions'] = get_perms(user, view_league)
-
-    # Is user an admin?
-    request.session['organization_admin'] = False
-    request.session['league_admin'] = False
-
-    # League switcher menu cache
-    request.session['league_switcher_menu'] = []
-    for league in user_member_leagues:
-        if league != view_league:
-            request.session['league_switcher_menu'].append(
-                [league.pk, league.slug, league.name]
-            )
-
-    if "org_admin" in request.session['organization_permissions']:
-        # Org admin gets to be tagged as one here.
-        request.session['organization_admin'] = True
-
-    if request.session['organization_admin'] or "league_admin" in request.session['league_permissions']:
-        # If we are an org or league admin, set all league permissions.
-        request.session['league_admin'] = True
-        request.session['league_permissions'] = []
-        if user.league:
-            for perm in get_perms_for_model(view_league):
-                request.session['league_permissions'].append(perm.codename)
+
+    set_rink_session_permissions(user, request, view_league)
+    clear_request_league(request)
+
+
+def set_rink_session_permissions(user, request, league):
+    # Permissions, admin flags and the league switcher menu.
+    request.session.update(get_rink_permissions(user, league))
+    request.session['permission_versions'] = list(get_permission_versions(user))
 
 
 # Attach the signal
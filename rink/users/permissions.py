@@ -0,0 +1,138 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+
+from guardian.models import GroupObjectPermission, UserObjectPermission
+from guardian.shortcuts import get_perms_for_model
+
+from league.models import League, LeagueMembership, Organization
+
+
+PERMISSION_SNAPSHOT_KEY = "users:permissions:{}:{}:{}:{}"
+PERMISSION_VERSION_KEY = "users:permissions_version:{}"
+PERMISSION_SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+def get_permission_version(user_id=None):
+    # user_id=None is the version shared by everybody, bumped when league or
+    # organization names change since they are part of every snapshot.
+    key = PERMISSION_VERSION_KEY.format(user_id or "all")
+    version = cache.get(key)
+    if version is None:
+        version = 1
+        cache.add(key, version, None)
+    return version
+
+
+def bump_permission_version(user_id=None):
+    key = PERMISSION_VERSION_KEY.format(user_id or "all")
+    cache.add(key, 1, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_permission_versions(user):
+    return get_permission_version(user.pk), get_permission_version()
+
+
+def get_group_permissions(user, model):
+    """
+    Object permissions a user has on instances of model through their groups,
+    as a dict of object pk to a list of codenames.
+    """
+    group_permissions = {}
+    permissions = GroupObjectPermission.objects.filter(
+        group__user=user,
+        content_type=ContentType.objects.get_for_model(model),
+    ).values_list('object_pk', 'permission__codename')
+    for object_pk, codename in permissions:
+        group_permissions.setdefault(int(object_pk), []).append(codename)
+    return group_permissions
+
+
+def merge_permissions(permissions, extra_permissions):
+    for object_pk, codenames in extra_permissions.items():
+        object_permissions = permissions.setdefault(object_pk, [])
+        object_permissions.extend(codename for codename in codenames if codename not in object_permissions)
+
+
+def build_permission_snapshot(user):
+    """
+    Everything set_rink_session_data needs about a user's permissions, for
+    every league and organization at once, so switching leagues doesn't need
+    to look anything up again.
+    """
+    organization_permissions = {}
+    permissions = UserObjectPermission.objects.filter(
+        user=user,
+        content_type=ContentType.objects.get_for_model(Organization),
+    ).values_list('object_pk', 'permission__codename')
+    for organization_id, codename in permissions:
+        organization_permissions.setdefault(int(organization_id), []).append(codename)
+    merge_permissions(organization_permissions, get_group_permissions(user, Organization))
+
+    league_permissions = {}
+    for membership in LeagueMembership.objects.filter(user=user):
+        league_permissions[membership.league_id] = membership.permission_list
+    merge_permissions(league_permissions, get_group_permissions(user, League))
+
+    if user.is_active and user.is_superuser:
+        # Superusers are members of every league without any permission rows.
+        leagues = League.objects.all()
+    else:
+        leagues = League.objects.filter(pk__in=[
+            league_id for league_id, codenames in league_permissions.items() if 'league_member' in codenames
+        ])
+    member_leagues = [list(league) for league in leagues.order_by('name').values_list('pk', 'slug', 'name')]
+
+    return {
+        'organization_permissions': organization_permissions,
+        'league_permissions': league_permissions,
+        'member_leagues': member_leagues,
+        'all_league_permissions': [perm.codename for perm in get_perms_for_model(League)],
+        'all_organization_permissions': [perm.codename for perm in get_perms_for_model(Organization)],
+    }
+
+
+def get_permission_snapshot(user):
+    superuser = int(user.is_active and user.is_superuser)
+    key = PERMISSION_SNAPSHOT_KEY.format(user.pk, superuser, *get_permission_versions(user))
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_permission_snapshot(user)
+        cache.set(key, snapshot, PERMISSION_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def get_rink_permissions(user, league):
+    """
+    Returns the session permission data for a user viewing a league: the
+    same keys set_rink_session_data has always stored.
+    """
+    snapshot = get_permission_snapshot(user)
+
+    if user.is_active and user.is_superuser:
+        organization_permissions = list(snapshot['all_organization_permissions'])
+        league_permissions = list(snapshot['all_league_permissions'])
+    else:
+        organization_permissions = list(snapshot['organization_permissions'].get(league.organization_id, []))
+        league_permissions = list(snapshot['league_permissions'].get(league.pk, []))
+
+    organization_admin = "org_admin" in organization_permissions
+    league_admin = organization_admin or "league_admin" in league_permissions
+    if league_admin:
+        # If we are an org or league admin, set all league permissions.
+        league_permissions = []
+        if user.league_id:
+            league_permissions = list(snapshot['all_league_permissions'])
+
+    return {
+        'organization_permissions': organization_permissions,
+        'league_permissions': league_permissions,
+        'organization_admin': organization_admin,
+        'league_admin': league_admin,
+        'league_switcher_menu': [
+            league_switch for league_switch in snapshot['member_leagues'] if league_switch[0] != league.pk
+        ],
+    }
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from league.models import League, Organization
+from users.models import User
+from users.permissions import bump_permission_version
+
+
+def bump_permission_version_on_commit(user_id=None):
+    # Bumped straight away so the rest of this request sees the change, and
+    # again once it's committed: a snapshot another request built in between
+    # read the old permissions but was cached under the new version.
+    bump_permission_version(user_id)
+    transaction.on_commit(lambda: bump_permission_version(user_id))
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+def bump_user_permission_version(sender, instance, **kwargs):
+    bump_permission_version_on_commit(instance.user_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def bump_group_member_permission_versions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # A group's members changed; rare enough to start everyone over.
+        bump_permission_version_on_commit()
+    else:
+        bump_permission_version_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=League)
+@receiver(post_delete, sender=League)
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+def bump_all_permission_versions(sender, instance, **kwargs):
+    # League names and slugs are part of everyone's league switcher menu, and
+    # a group's permissions are part of the snapshot of each of its members.
+    bump_permission_version_on_commit()
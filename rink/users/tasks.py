@@ -3,6 +3,8 @@ from celery import shared_task
 from league.utils import send_email
 
 from league.models import League
+from taskapp.metrics import record_items
+
 
 @shared_task(ignore_result=True)
 def notify_admin_of_user_changes(league_id, initial, updated):
@@ -17,4 +19,5 @@ def notify_admin_of_user_changes(league_id, initial, updated):
                 'updated': updated,
             },
         )
+        record_items(1)
 
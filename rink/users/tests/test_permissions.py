@@ -0,0 +1,90 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from guardian.shortcuts import assign_perm, remove_perm
+from unittest.mock import patch
+
+from league.tests.factories import LeagueFactory
+from users.permissions import get_permission_version, get_rink_permissions
+
+from .factories import LeagueAdminUserFactory, UserFactory, user_password
+
+
+class TestPermissionSnapshot(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = LeagueAdminUserFactory()
+        self.league = self.user.league
+        self.other_league = LeagueFactory(organization=self.league.organization, name="Other League")
+        assign_perm('league_member', self.user, self.league)
+        assign_perm('league_member', self.user, self.other_league)
+
+    def test_switching_leagues_uses_cached_snapshot(self):
+        permissions = get_rink_permissions(self.user, self.league)
+        self.assertTrue(permissions['league_admin'])
+        self.assertEqual(
+            permissions['league_switcher_menu'],
+            [[self.other_league.pk, self.other_league.slug, self.other_league.name]],
+        )
+
+        with self.assertNumQueries(0):
+            permissions = get_rink_permissions(self.user, self.other_league)
+        self.assertFalse(permissions['league_admin'])
+        self.assertEqual(permissions['league_permissions'], ['league_member'])
+
+    def test_permission_changes_picked_up(self):
+        get_rink_permissions(self.user, self.other_league)
+        assign_perm('billing_manager', self.user, self.other_league)
+        self.assertIn('billing_manager', get_rink_permissions(self.user, self.other_league)['league_permissions'])
+
+        self.other_league.name = "Renamed League"
+        self.other_league.save()
+        self.assertEqual(get_rink_permissions(self.user, self.league)['league_switcher_menu'][0][2], "Renamed League")
+
+    def test_revoked_permissions_denied_on_next_request(self):
+        self.client.login(email=self.user.email, password=user_password)
+        url = reverse('roster:list')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(self.client.session['league_admin'])
+
+        remove_perm('league_admin', self.user, self.league)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        # Other users' snapshots aren't affected
+        other = UserFactory(league=self.league, organization=self.league.organization)
+        self.assertEqual(get_rink_permissions(other, self.league)['league_permissions'], ['league_member'])
+
+    def test_version_bumped_again_on_commit(self):
+        with patch('users.signals.transaction.on_commit') as on_commit:
+            remove_perm('league_admin', self.user, self.league)
+        # Anything cached under this version may have read the permissions
+        # before they were committed.
+        version = get_permission_version(self.user.pk)
+        on_commit.call_args[0][0]()
+        self.assertEqual(get_permission_version(self.user.pk), version + 1)
+
+    def test_superuser_switcher_lists_every_league(self):
+        superuser = UserFactory(league=self.league, organization=self.league.organization, is_superuser=True)
+        unrelated_league = LeagueFactory(name="Unrelated League")
+        permissions = get_rink_permissions(superuser, self.league)
+        self.assertEqual(
+            [league_switch[0] for league_switch in permissions['league_switcher_menu']],
+            [self.other_league.pk, unrelated_league.pk],
+        )
+        self.assertIn('league_admin', permissions['league_permissions'])
+
+    def test_group_permissions_included(self):
+        other = UserFactory(league=self.league, organization=self.league.organization)
+        group = Group.objects.create(name="Other League Members")
+        assign_perm('league_member', group, self.other_league)
+        self.assertEqual(get_rink_permissions(other, self.league)['league_switcher_menu'], [])
+
+        other.groups.add(group)
+        permissions = get_rink_permissions(other, self.league)
+        self.assertEqual(
+            permissions['league_switcher_menu'],
+            [[self.other_league.pk, self.other_league.slug, self.other_league.name]],
+        )
+        self.assertEqual(get_rink_permissions(other, self.other_league)['league_permissions'], ['league_member'])
@@ -0,0 +1,21 @@
+from django.db.models import Case, Value, When
+
+
+def bulk_update(objs, fields):
+    """
+    Write fields of model instances already changed in memory with one
+    UPDATE, the way QuerySet.bulk_update() does in newer Djangos. No signals
+    are sent. All objs must be saved instances of the same model.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    model = type(objs[0])
+    model_fields = [model._meta.get_field(field) for field in fields]
+    return model._default_manager.filter(pk__in=[obj.pk for obj in objs]).update(**{
+        field.name: Case(
+            *[When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field)) for obj in objs],
+            output_field=field,
+        )
+        for field in model_fields
+    })
@@ -0,0 +1,4 @@
+def chunked(items, size):
+    # Split a list into lists of at most `size` items.
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,42 @@
+from django.http import StreamingHttpResponse
+
+import csv
+
+
+# Rows fetched from the database at a time while streaming an export.
+EXPORT_CHUNK_SIZE = 500
+
+
+class Echo(object):
+    # File-like object for csv.writer that hands back each line instead of
+    # storing it, so rows can be streamed out as they are written.
+    def write(self, value):
+        return value
+
+
+def export_rows(resource, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    # Same rows as resource.export(queryset).csv, one at a time.
+    # Foreign keys the resource exports are joined in up front so each row
+    # doesn't need its own query.
+    fields = resource.get_export_fields()
+    attributes = {field.attribute for field in fields}
+    related = [
+        field.name for field in queryset.model._meta.concrete_fields
+        if field.is_relation and field.name in attributes
+    ]
+    if related:
+        queryset = queryset.select_related(*related)
+
+    yield resource.get_export_headers()
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield resource.export_resource(obj)
+
+
+def streaming_csv_response(resource, queryset, filename, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in export_rows(resource, queryset, chunk_size)),
+        content_type='text/csv',
+    )
+    response['Content-Disposition'] = 'attachment;filename={}'.format(filename)
+    return response
@@ -0,0 +1,245 @@
+"""
+Keyset (seek) pagination for django-tables2 tables.
+
+Instead of OFFSET page numbers each page link carries a signed cursor holding
+the sort values of the first or last row on the current page, and the next
+page is fetched with WHERE (sort columns) > (cursor values). Deep pages cost
+the same as the first one and no COUNT(*) is needed to render them.
+
+Ordering fields must not be nullable, the primary key is always added as the
+final tie breaker.
+"""
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+
+import json
+
+from django_tables2.rows import BoundRows
+
+
+CURSOR_SALT = 'rink.utils.pagination'
+
+# Below this many rows (by the planner's estimate) a real count is cheap
+# enough, above it the estimate is shown instead.
+ESTIMATE_COUNT_THRESHOLD = 1000
+
+
+class CursorSerializer(object):
+    # signing's JSONSerializer, but able to write dates and decimals.
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), cls=DjangoJSONEncoder).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+def estimate_count(queryset, threshold=ESTIMATE_COUNT_THRESHOLD):
+    """
+    (count, is_estimate) for a queryset. On PostgreSQL large results use the
+    query planner's row estimate instead of running COUNT(*), everything else
+    gets an exact count.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        rows = int(plan[0]['Plan']['Plan Rows'])
+        if rows >= threshold:
+            return rows, True
+    return queryset.count(), False
+
+
+def get_keyset_ordering(queryset):
+    # The queryset's ordering as field names, ending with the primary key.
+    query = queryset.query
+    ordering = list(query.order_by or (query.default_ordering and queryset.model._meta.ordering) or [])
+    ordering = [field if isinstance(field, str) else None for field in ordering]
+    if None in ordering or any(field.lstrip('-') == '?' for field in ordering):
+        raise ValueError("Keyset pagination needs plain field names to order by.")
+    if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+        ordering.append('-pk' if ordering and ordering[-1].startswith('-') else 'pk')
+    return ordering
+
+
+def get_record_value(record, field):
+    value = record
+    for attr in field.split('__'):
+        value = getattr(value, attr)
+    return value
+
+
+def seek(queryset, ordering, values, forward=True):
+    # Rows after values in ordering (or before them when forward is False).
+    q_seek = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        ascending = not field.startswith('-')
+        lookup = 'gt' if ascending == forward else 'lt'
+        q_field = Q(**{'{}__{}'.format(name, lookup): values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            q_field &= Q(**{previous.lstrip('-'): value})
+        q_seek |= q_field
+    return queryset.filter(q_seek)
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+
+class KeysetPage(object):
+    # Just enough of django.core.paginator.Page for the table templates.
+    # The "page numbers" are cursors.
+    number = 1
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        # An empty page still has a link back.
+        return True
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.next_cursor
+
+    def previous_page_number(self):
+        return self.previous_cursor
+
+
+class KeysetPaginator(object):
+    """
+    Paginator for Table.paginate(). rows are the table's BoundRows over an
+    ordered queryset, cursor is the page parameter from the request.
+    """
+
+    def __init__(self, rows, per_page, cursor=None, estimate_count=False):
+        self.rows = rows
+        self.per_page = int(per_page)
+        self.cursor = cursor
+        self.estimate_count = estimate_count
+        self.ordering = get_keyset_ordering(rows.data.data)
+        self.queryset = rows.data.data.order_by(*self.ordering)
+        self._count = None
+        self.current_page = None
+
+    @property
+    def num_pages(self):
+        # Only used by the table templates to decide whether to show the
+        # pagination links, the real number isn't known.
+        return 2 if self.current_page and self.current_page.has_other_pages() else 1
+
+    def make_cursor(self, record, forward):
+        return signing.dumps({
+            'o': self.ordering,
+            'v': [get_record_value(record, field.lstrip('-')) for field in self.ordering],
+            'f': forward,
+        }, salt=CURSOR_SALT, serializer=CursorSerializer, compress=True)
+
+    def read_cursor(self, cursor):
+        # (values, forward), or None for the first page. Cursors for another
+        # ordering (the sort changed) start over from the first page.
+        if not cursor:
+            return None
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT, serializer=CursorSerializer)
+        except signing.BadSignature:
+            return None
+        if data.get('o') != self.ordering or len(data.get('v', [])) != len(self.ordering):
+            return None
+        return data['v'], bool(data.get('f', True))
+
+    def page(self, number=None):
+        position = self.read_cursor(self.cursor)
+        queryset = self.queryset
+
+        if position is None:
+            records = list(queryset[:self.per_page + 1])
+            more, forward = len(records) > self.per_page, True
+        else:
+            values, forward = position
+            if forward:
+                records = list(seek(queryset, self.ordering, values)[:self.per_page + 1])
+            else:
+                records = list(seek(queryset, self.ordering, values, forward=False).order_by(
+                    *reverse_ordering(self.ordering))[:self.per_page + 1])
+            more = len(records) > self.per_page
+
+        records = records[:self.per_page]
+        if not forward:
+            records.reverse()
+
+        next_cursor = previous_cursor = None
+        if records:
+            if more or not forward:
+                next_cursor = self.make_cursor(records[-1], True)
+            if (more and not forward) or (forward and position is not None):
+                previous_cursor = self.make_cursor(records[0], False)
+        elif position is not None:
+            # Walked off either end, eg. the rows were deleted. Link back.
+            previous_cursor = ""
+
+        self.current_page = KeysetPage(BoundRows(records, self.rows.table), self, next_cursor, previous_cursor)
+        return self.current_page
+
+    def get_count(self):
+        if self._count is None:
+            if self.estimate_count:
+                self._count = estimate_count(self.queryset)
+            else:
+                self._count = (self.queryset.count(), False)
+        return self._count
+
+    @property
+    def count(self):
+        return self.get_count()[0]
+
+    @property
+    def count_is_estimate(self):
+        return self.get_count()[1]
+
+
+class KeysetTableMixin(object):
+    """
+    For SingleTableView subclasses: paginate the table with KeysetPaginator,
+    paginate_by rows at a time. Set keyset_estimate_count for tables that can
+    run to many thousands of rows.
+    """
+    keyset_estimate_count = False
+    keyset_template_name = 'utils/keyset_table.html'
+
+    def get_paginate_by(self, queryset):
+        # The table does the paginating, stop ListView counting and slicing
+        # the queryset a second time.
+        return None
+
+    def get_table_pagination(self, table):
+        return {
+            'klass': KeysetPaginator,
+            'per_page': self.paginate_by,
+            'cursor': self.request.GET.get(table.prefixed_page_field),
+            'estimate_count': self.keyset_estimate_count,
+        }
+
+    def get_table_kwargs(self):
+        return {**super().get_table_kwargs(), 'template_name': self.keyset_template_name}
@@ -0,0 +1,248 @@
+"""
+Opt-in request profiling for production.
+
+ProfilingMiddleware samples a fraction of requests (RINK_PROFILING_SAMPLE_RATE,
+0 turns it off) and records the view, total time, SQL grouped by normalized
+statement, template render time and the celery tasks queued. Records go to a
+ring buffer in the cache, shared by every worker using the same cache, and
+optionally to the "rink.profiling" logger. profiling_summary is the admin page
+listing the slowest views per league.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import connection
+from django.shortcuts import render
+from django.template.backends.django import Template as DjangoTemplate
+
+from celery.signals import before_task_publish
+import json
+import logging
+import random
+import re
+import threading
+from time import perf_counter, time
+
+
+logger = logging.getLogger('rink.profiling')
+
+PROFILING_SLOT_KEY = "utils:profiling:slot"
+PROFILING_RECORD_KEY = "utils:profiling:record:{}"
+PROFILING_RECORD_TIMEOUT = 60 * 60 * 24
+
+# Statements kept per record, the slowest first.
+PROFILING_STATEMENTS_PER_RECORD = 10
+
+_active = threading.local()
+
+
+def get_sample_rate():
+    return getattr(settings, 'RINK_PROFILING_SAMPLE_RATE', 0)
+
+
+def get_buffer_size():
+    return getattr(settings, 'RINK_PROFILING_BUFFER_SIZE', 1000)
+
+
+def normalize_sql(sql):
+    # Same shape of statement, same group: literals and IN lists of any
+    # length are collapsed.
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    sql = re.sub(r"%s", "?", sql)
+    sql = re.sub(r"\(\s*\?(\s*,\s*\?)*\s*\)", "(...)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+class RequestProfile(object):
+    def __init__(self):
+        self.statements = {}
+        self.sql_count = 0
+        self.sql_ms = 0
+        self.template_ms = 0
+        # Widgets and tables render templates from inside templates, only
+        # the outermost render is timed.
+        self.template_depth = 0
+        self.tasks = []
+
+    def add_query(self, sql, ms):
+        self.sql_count += 1
+        self.sql_ms += ms
+        statement = self.statements.setdefault(normalize_sql(sql), [0, 0])
+        statement[0] += 1
+        statement[1] += ms
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query(sql, (perf_counter() - start) * 1000)
+
+    def as_record(self, request, response, total_ms):
+        resolver_match = getattr(request, 'resolver_match', None)
+        league = getattr(request, '_cached_league', None)
+        if league:
+            league_id = league.pk
+        elif hasattr(request, 'session'):
+            league_id = request.session.get('view_league', None)
+        else:
+            league_id = None
+
+        statements = sorted(self.statements.items(), key=lambda s: s[1][1], reverse=True)
+        return {
+            'time': time(),
+            'view': resolver_match.view_name if resolver_match else request.path,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'league_id': league_id,
+            'total_ms': round(total_ms, 2),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_ms, 2),
+            'template_ms': round(self.template_ms, 2),
+            'tasks': self.tasks,
+            'statements': [
+                [sql, count, round(ms, 2)] for sql, (count, ms) in statements[:PROFILING_STATEMENTS_PER_RECORD]
+            ],
+        }
+
+
+def get_active_profile():
+    return getattr(_active, 'profile', None)
+
+
+def store_record(record):
+    cache.add(PROFILING_SLOT_KEY, 0, None)
+    try:
+        slot = cache.incr(PROFILING_SLOT_KEY)
+    except ValueError:
+        slot = 0
+    cache.set(PROFILING_RECORD_KEY.format(slot % get_buffer_size()), record, PROFILING_RECORD_TIMEOUT)
+
+    if getattr(settings, 'RINK_PROFILING_LOG', False):
+        logger.info(json.dumps(record))
+
+
+def get_records():
+    keys = [PROFILING_RECORD_KEY.format(slot) for slot in range(0, get_buffer_size())]
+    return sorted(cache.get_many(keys).values(), key=lambda r: r['time'], reverse=True)
+
+
+def clear_records():
+    cache.delete_many([PROFILING_RECORD_KEY.format(slot) for slot in range(0, get_buffer_size())])
+
+
+def _profiled_template_render(original):
+    def render(self, context=None, request=None):
+        profile = get_active_profile()
+        if profile is None or profile.template_depth:
+            return original(self, context, request)
+        profile.template_depth += 1
+        start = perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            profile.template_ms += (perf_counter() - start) * 1000
+            profile.template_depth -= 1
+    render.profiled = True
+    return render
+
+
+@before_task_publish.connect
+def record_task_publish(sender=None, **kwargs):
+    profile = get_active_profile()
+    if profile is not None:
+        profile.tasks.append(sender)
+
+
+class ProfilingMiddleware(object):
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if not getattr(DjangoTemplate.render, 'profiled', False):
+            DjangoTemplate.render = _profiled_template_render(DjangoTemplate.render)
+
+    def __call__(self, request):
+        rate = get_sample_rate()
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+
+        profile = _active.profile = RequestProfile()
+        start = perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            _active.profile = None
+
+        store_record(profile.as_record(request, response, (perf_counter() - start) * 1000))
+        return response
+
+
+def summarize_records(records):
+    """
+    Groups records by league and view, slowest average first. Each group has
+    the averages and worst request, plus its statements merged across
+    requests.
+    """
+    groups = {}
+    for record in records:
+        group = groups.setdefault((record['league_id'], record['view']), {
+            'league_id': record['league_id'],
+            'view': record['view'],
+            'requests': 0,
+            'total_ms': 0,
+            'max_ms': 0,
+            'sql_count': 0,
+            'sql_ms': 0,
+            'template_ms': 0,
+            'tasks': 0,
+            'statements': {},
+        })
+        group['requests'] += 1
+        group['total_ms'] += record['total_ms']
+        group['max_ms'] = max(group['max_ms'], record['total_ms'])
+        group['sql_count'] += record['sql_count']
+        group['sql_ms'] += record['sql_ms']
+        group['template_ms'] += record['template_ms']
+        group['tasks'] += len(record['tasks'])
+        for sql, count, ms in record['statements']:
+            statement = group['statements'].setdefault(sql, [0, 0])
+            statement[0] += count
+            statement[1] += ms
+
+    summary = []
+    for group in groups.values():
+        requests = group['requests']
+        for field in ('total_ms', 'sql_count', 'sql_ms', 'template_ms', 'tasks'):
+            group['avg_' + field] = group.pop(field) / requests
+        group['statements'] = [
+            {'sql': sql, 'count': count / requests, 'ms': ms / requests}
+            for sql, (count, ms) in sorted(group['statements'].items(), key=lambda s: s[1][1], reverse=True)[:5]
+        ]
+        summary.append(group)
+
+    return sorted(summary, key=lambda group: group['avg_total_ms'], reverse=True)
+
+
+def profiling_summary(request):
+    from league.models import League
+
+    if request.method == 'POST' and 'clear' in request.POST:
+        clear_records()
+
+    records = get_records()
+    leagues = dict(League.objects.values_list('pk', 'name'))
+    summary = summarize_records(records)
+    for group in summary:
+        group['league'] = leagues.get(group['league_id'], "")
+
+    return render(request, 'utils/profiling_summary.html', {
+        **admin.site.each_context(request),
+        'title': "Request profiling",
+        'summary': summary,
+        'record_count': len(records),
+        'sample_rate': get_sample_rate(),
+    })
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.cache import cache
+
+import hashlib
+import time
+
+
+# Stripe allows 100 requests/second in live mode and 25 in test mode per
+# account. Stay well under that since the web views share the same keys.
+STRIPE_REQUESTS_PER_SECOND = 20
+
+
+def stripe_rate_limit(api_key, per_second=None):
+    # Block until we're allowed to make another request with this API key.
+    # The counter lives in the cache so every celery worker shares it.
+    if per_second is None:
+        per_second = getattr(settings, 'STRIPE_REQUESTS_PER_SECOND', STRIPE_REQUESTS_PER_SECOND)
+
+    # Don't put secret keys in cache key names
+    key_name = hashlib.sha1(str(api_key).encode('utf-8')).hexdigest()[:16]
+
+    while True:
+        now = time.time()
+        window = int(now)
+        cache_key = "stripe:ratelimit:{}:{}".format(key_name, window)
+        cache.add(cache_key, 0, 2)
+        try:
+            count = cache.incr(cache_key)
+        except ValueError:
+            # Expired between add() and incr(), start over
+            continue
+
+        if count <= per_second:
+            return
+
+        time.sleep(window + 1 - now)
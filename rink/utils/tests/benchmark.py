@@ -0,0 +1,362 @@
+"""
+Query count and wall time budgets for the busiest admin and registration views.
+
+seed_benchmark_league() builds a league roughly the size of a real one (a few
+thousand members, several events, months of invoices, an election) from the
+existing test factories, bulk inserting where the factories would be too slow.
+BenchmarkTest.assertWithinBudget() requests a page against it and compares the
+queries and time taken to the budgets checked in to benchmark_budgets.json.
+
+Query counts are always checked. Wall time depends on the machine the budgets
+were recorded on, so it's only checked when RINK_BENCHMARK_TIME_FACTOR is set,
+scaling every time budget by that factor.
+
+Run with RINK_BENCHMARK_RECORD=1 to write the measured numbers back to the
+budgets file after an intentional change, and review the diff before
+committing it.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from dateutil.relativedelta import relativedelta
+from decimal import Decimal
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import get_perms_for_model
+import json
+import os
+from statistics import median
+from time import perf_counter
+from types import SimpleNamespace
+
+from billing.ledger import rebuild_invoice_ledger
+from billing.models import BillingGroupMembership, BillingPeriod, BillingSubscription, Invoice
+from billing.tests.factories import BillingGroupFactory
+from league.models import League, LeagueMembership
+from league.tests.factories import InsuranceTypeFactory, LeagueFactory
+from legal.models import LegalSignature
+from legal.tests.factories import LegalDocumentFactory
+from registration.models import RegistrationData, RegistrationEventCounter, RegistrationInvite, Roster
+from registration.tests.factories import RegistrationDataFactory, RegistrationEventFactory
+from roster.search import refresh_search_entries
+from users.models import Tag, User, UserTag
+from users.tests.factories import OrgAdminUserFactory, UserFactoryNoPermissions, user_password
+from voting.models import (
+    Election, ElectionAnswer, ElectionQuestion, VotingInvite, VotingResponse, VotingResponseAnswer)
+
+from rink.utils.testing import get_random_derby_name, get_random_first_last_name
+
+
+BENCHMARK_BUDGETS_FILE = os.path.join(os.path.dirname(__file__), 'benchmark_budgets.json')
+
+# Size of the seeded league. Budgets are recorded against the defaults, query
+# counts that change with these are the N+1 problems the budgets are there to
+# catch.
+BENCHMARK_USERS = int(os.environ.get('RINK_BENCHMARK_USERS', 2000))
+BENCHMARK_EVENTS = int(os.environ.get('RINK_BENCHMARK_EVENTS', 2))
+BENCHMARK_MONTHS = int(os.environ.get('RINK_BENCHMARK_MONTHS', 6))
+
+# Requests timed per page, after one untimed request to warm the caches.
+BENCHMARK_REPEAT = 3
+
+# Recorded time budgets are this many times the measured median, wall time
+# is noisy. Time budgets are only checked with RINK_BENCHMARK_TIME_FACTOR set,
+# eg. 1 on the machine they were recorded on or 2 on one twice as slow.
+BENCHMARK_TIME_HEADROOM = 3
+BENCHMARK_TIME_FACTOR = os.environ.get('RINK_BENCHMARK_TIME_FACTOR')
+
+BENCHMARK_RECORD = bool(os.environ.get('RINK_BENCHMARK_RECORD'))
+
+
+def seed_benchmark_league(users=BENCHMARK_USERS, events=BENCHMARK_EVENTS, months=BENCHMARK_MONTHS):
+    """
+    Creates a league with `users` members, `events` events each running the
+    last `months` months with monthly billing periods, and an election.
+
+    Most members are registered for every event, with an invoice for each
+    billing period so far. Every seventh registration is behind on dues.
+    """
+    today = timezone.now().date()
+
+    # Registration forms render the Stripe key, nothing here talks to Stripe.
+    league = LeagueFactory(stripe_public_key="pk_test_benchmark", stripe_private_key="sk_test_benchmark")
+    organization = league.organization
+    admin = OrgAdminUserFactory(organization=organization, league=league)
+
+    tags = [Tag.objects.create(league=league, text="Benchmark Tag {}".format(i)) for i in range(0, 5)]
+    billing_groups = [
+        BillingGroupFactory(league=league, default_group_for_league=(i == 0)) for i in range(0, 3)
+    ]
+    insurance_type = InsuranceTypeFactory(league=league)
+    legal_document = LegalDocumentFactory(league=league)
+
+    # Members, built with the factory but inserted in bulk since the factory
+    # saves (and assigns permissions) one user at a time.
+    members = UserFactoryNoPermissions.build_batch(users, league=league, organization=organization)
+    for member in members:
+        member.first_name, member.last_name = get_random_first_last_name()
+        member.derby_name = get_random_derby_name()
+    User.objects.bulk_create(members)
+    members = list(User.objects.filter(league=league).exclude(pk=admin.pk).order_by('pk'))
+
+    member_permission = [perm for perm in get_perms_for_model(League) if perm.codename == 'league_member'][0]
+    UserObjectPermission.objects.bulk_create([
+        UserObjectPermission(
+            user=member,
+            permission=member_permission,
+            content_type=ContentType.objects.get_for_model(League),
+            object_pk=str(league.pk),
+        )
+        for member in members
+    ])
+    LeagueMembership.objects.bulk_create([
+        LeagueMembership(user=member, league=league, permissions='league_member') for member in members
+    ])
+
+    UserTag.objects.bulk_create([
+        UserTag(user=member, tag=tags[i % len(tags)]) for i, member in enumerate(members) if i % 3 == 0
+    ])
+    BillingGroupMembership.objects.bulk_create([
+        BillingGroupMembership(user=member, league=league, group=billing_groups[i % len(billing_groups)])
+        for i, member in enumerate(members) if i % 2 == 0
+    ])
+
+    start_date = (today - relativedelta(months=months - 1)).replace(day=1)
+    seeded_events = []
+    for e in range(0, events):
+        event = RegistrationEventFactory(
+            league=league,
+            start_date=start_date,
+            end_date=start_date + relativedelta(months=months) - relativedelta(days=1),
+        )
+        event.legal_forms.add(legal_document)
+        event.create_monthly_billing_periods()
+        periods = list(BillingPeriod.objects.filter(event=event, invoice_date__lte=today).order_by('start_date'))
+        seed_benchmark_event(event, members, periods, insurance_type, legal_document)
+        RegistrationEventCounter.reconcile(event.pk)
+        seeded_events.append(event)
+
+    election = seed_benchmark_election(league, members)
+
+    refresh_search_entries(league.pk)
+    rebuild_invoice_ledger(league.pk)
+
+    return SimpleNamespace(
+        league=league,
+        organization=organization,
+        admin=admin,
+        members=members,
+        events=seeded_events,
+        election=election,
+    )
+
+
+def seed_benchmark_event(event, members, periods, insurance_type, legal_document):
+    now = timezone.now()
+
+    # Everyone is invited, three quarters of the league registered.
+    RegistrationInvite.objects.bulk_create([
+        RegistrationInvite(
+            user=member,
+            email=member.email,
+            event=event,
+            sent_date=now,
+            completed_date=now if i % 4 else None,
+        )
+        for i, member in enumerate(members)
+    ])
+    invites = {
+        invite.user_id: invite
+        for invite in RegistrationInvite.objects.filter(event=event, completed_date__isnull=False)
+    }
+    registered = [member for member in members if member.pk in invites]
+
+    Roster.objects.bulk_create([
+        Roster(
+            user=member,
+            event=event,
+            email=member.email,
+            first_name=member.first_name,
+            last_name=member.last_name,
+            derby_name=member.derby_name,
+        )
+        for member in registered
+    ])
+    rosters = {roster.user_id: roster for roster in Roster.objects.filter(event=event)}
+
+    BillingSubscription.objects.bulk_create([
+        BillingSubscription(user=member, league=event.league, event=event, roster=rosters[member.pk])
+        for member in registered
+    ])
+    subscriptions = {
+        subscription.user_id: subscription
+        for subscription in BillingSubscription.objects.filter(event=event)
+    }
+
+    RegistrationData.objects.bulk_create([
+        RegistrationDataFactory.build(
+            user=member,
+            invite=invites[member.pk],
+            event=event,
+            organization=event.league.organization,
+            roster=rosters[member.pk],
+            billing_subscription=subscriptions[member.pk],
+            derby_insurance_type=insurance_type,
+        )
+        for member in registered
+    ])
+    LegalSignature.objects.bulk_create([
+        LegalSignature(
+            user_id=registration.user_id,
+            document=legal_document,
+            league=event.league,
+            event=event,
+            registration=registration,
+        )
+        for registration in RegistrationData.objects.filter(event=event)
+    ])
+
+    invoices = []
+    for i, member in enumerate(registered):
+        for period in periods:
+            paid = bool(i % 7) or period == periods[0]
+            invoices.append(Invoice(
+                user=member,
+                league=event.league,
+                billing_period=period,
+                subscription=subscriptions[member.pk],
+                description="{} Dues".format(period.name),
+                invoice_amount=Decimal('50.00'),
+                paid_amount=Decimal('50.00') if paid else Decimal('0.00'),
+                status='paid' if paid else 'unpaid',
+                invoice_date=period.invoice_date,
+                due_date=period.due_date,
+                paid_date=now if paid else None,
+            ))
+    Invoice.objects.bulk_create(invoices)
+
+
+def seed_benchmark_election(league, members, questions=5, answers=4):
+    now = timezone.now()
+    election = Election.objects.create(
+        league=league,
+        name="Benchmark Election",
+        description="Benchmark Election",
+        start_date=now - relativedelta(days=7),
+        end_date=now + relativedelta(days=7),
+    )
+
+    election_questions = []
+    for q in range(0, questions):
+        question = ElectionQuestion.objects.create(
+            election=election,
+            question="Question {}".format(q),
+            allow_write_in=(q == 0),
+        )
+        ElectionAnswer.objects.bulk_create([
+            ElectionAnswer(question=question, answer="Answer {}".format(a)) for a in range(0, answers)
+        ])
+        election_questions.append(question)
+
+    # Three out of five members voted.
+    VotingInvite.objects.bulk_create([
+        VotingInvite(user=member, election=election, date_responded=now if i % 5 < 3 else None)
+        for i, member in enumerate(members)
+    ])
+    voted = VotingInvite.objects.filter(election=election, date_responded__isnull=False).count()
+    VotingResponse.objects.bulk_create([
+        VotingResponse(election=election, comment="Comment {}".format(i) if i % 10 == 0 else "")
+        for i in range(0, voted)
+    ])
+    VotingResponseAnswer.objects.bulk_create([
+        VotingResponseAnswer(
+            response=response,
+            question=question,
+            answer=(
+                "Write in {}".format(i % 3) if question.allow_write_in and i % 4 == 0
+                else "Answer {}".format(i % answers)
+            ),
+        )
+        for i, response in enumerate(VotingResponse.objects.filter(election=election))
+        for question in election_questions
+    ])
+
+    return election
+
+
+def load_budgets():
+    try:
+        with open(BENCHMARK_BUDGETS_FILE) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def record_budget(name, queries, ms):
+    budgets = load_budgets()
+    budgets[name] = {
+        'queries': queries,
+        'ms': int(ms * BENCHMARK_TIME_HEADROOM) + 1,
+    }
+    with open(BENCHMARK_BUDGETS_FILE, 'w') as fh:
+        json.dump(budgets, fh, indent=4, sort_keys=True)
+        fh.write("\n")
+
+
+def measure_request(client, url, data=None, repeat=BENCHMARK_REPEAT):
+    """
+    Returns (response, query count, median milliseconds) for GETting url.
+    The first request isn't counted, it fills the league, permission and
+    template caches a running site would already have.
+    """
+    client.get(url, data)
+
+    timings = []
+    for i in range(0, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            response = client.get(url, data)
+            timings.append((perf_counter() - start) * 1000)
+
+    return response, len(queries), median(timings)
+
+
+class BenchmarkTest(object):
+    """
+    TestCase mixin, seeds one benchmark league for the whole class and logs
+    in as an organization admin.
+    """
+    benchmark = None
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.benchmark = seed_benchmark_league()
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(email=self.benchmark.admin.email, password=user_password)
+
+    def assertWithinBudget(self, name, url, data=None, status_code=200):
+        response, queries, ms = measure_request(self.client, url, data)
+        self.assertEqual(response.status_code, status_code, "{} returned {}".format(name, response.status_code))
+
+        if BENCHMARK_RECORD:
+            record_budget(name, queries, ms)
+            return response
+
+        budget = load_budgets().get(name)
+        if budget is None:
+            self.fail("No benchmark budget for '{}', record one with RINK_BENCHMARK_RECORD=1".format(name))
+
+        self.assertLessEqual(
+            queries, budget['queries'],
+            "'{}' ran {} queries, the budget is {}".format(name, queries, budget['queries']),
+        )
+        if BENCHMARK_TIME_FACTOR:
+            self.assertLessEqual(
+                ms, budget['ms'] * float(BENCHMARK_TIME_FACTOR),
+                "'{}' took {:.0f}ms, the budget is {}ms".format(name, ms, budget['ms']),
+            )
+        return response
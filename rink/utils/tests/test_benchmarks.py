@@ -0,0 +1,110 @@
+from django.urls import reverse
+
+from billing.models import Invoice
+from registration.models import Roster
+
+from test_plus.test import TestCase
+
+from .benchmark import BenchmarkTest
+
+
+class TestAdminViewBudgets(BenchmarkTest, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.benchmark.events[0]
+        self.event_kwargs = {'event_slug': self.event.slug}
+        self.roster = Roster.objects.filter(event=self.event).select_related('user').order_by('pk').first()
+        self.member = self.roster.user
+
+    def test_billing_admin(self):
+        self.assertWithinBudget('billing_admin', reverse('billing:billing_admin'))
+
+    def test_billing_admin_next_page(self):
+        response = self.client.get(reverse('billing:billing_admin'))
+        self.assertWithinBudget('billing_admin_next_page', reverse('billing:billing_admin'), {
+            'page': response.context['table'].page.next_page_number(),
+        })
+
+    def test_billing_dashboard(self):
+        self.assertWithinBudget('billing_dashboard', reverse('billing:billing_dashboard'))
+
+    def test_billing_admin_detail(self):
+        invoice = Invoice.objects.filter(user=self.member).first()
+        url = reverse('billing:billing_admin_detail', kwargs={'pk': invoice.pk})
+        self.assertWithinBudget('billing_admin_detail', url)
+
+    def test_roster_list(self):
+        self.assertWithinBudget('roster_list', reverse('roster:list'))
+
+    def test_roster_list_next_page(self):
+        response = self.client.get(reverse('roster:list'))
+        self.assertWithinBudget('roster_list_next_page', reverse('roster:list'), {
+            'page': response.context['table'].page.next_page_number(),
+        })
+
+    def test_roster_list_filtered(self):
+        self.assertWithinBudget('roster_list_filtered', reverse('roster:list'), {
+            'filtered': 1,
+            'search': self.member.last_name,
+            'unpaid_invoice': 'on',
+        })
+
+    def test_roster_admin_profile(self):
+        self.assertWithinBudget('roster_admin_profile', reverse('roster:admin_profile', kwargs={'pk': self.member.pk}))
+
+    def test_roster_admin_events(self):
+        self.assertWithinBudget('roster_admin_events', reverse('roster:admin_events', kwargs={'pk': self.member.pk}))
+
+    def test_roster_admin_billing(self):
+        self.assertWithinBudget('roster_admin_billing', reverse('roster:admin_billing', kwargs={'pk': self.member.pk}))
+
+    def test_roster_admin_subscriptions(self):
+        url = reverse('roster:admin_subscriptions', kwargs={'pk': self.member.pk})
+        self.assertWithinBudget('roster_admin_subscriptions', url)
+
+    def test_roster_admin_legal(self):
+        self.assertWithinBudget('roster_admin_legal', reverse('roster:admin_legal', kwargs={'pk': self.member.pk}))
+
+    def test_event_admin_list(self):
+        self.assertWithinBudget('event_admin_list', reverse('registration:event_admin_list'))
+
+    def test_event_admin_invites(self):
+        url = reverse('registration:event_admin_invites', kwargs=self.event_kwargs)
+        self.assertWithinBudget('event_admin_invites', url)
+
+    def test_event_admin_invite_users(self):
+        url = reverse('registration:event_admin_invite_users', kwargs=self.event_kwargs)
+        self.assertWithinBudget('event_admin_invite_users', url)
+
+    def test_event_admin_roster(self):
+        url = reverse('registration:event_admin_roster', kwargs=self.event_kwargs)
+        self.assertWithinBudget('event_admin_roster', url)
+
+    def test_event_admin_roster_detail(self):
+        kwargs = {'roster_id': self.roster.pk, **self.event_kwargs}
+        url = reverse('registration:event_admin_roster_detail', kwargs=kwargs)
+        self.assertWithinBudget('event_admin_roster_detail', url)
+
+    def test_event_admin_billing_periods(self):
+        url = reverse('registration:event_admin_billing_periods', kwargs=self.event_kwargs)
+        self.assertWithinBudget('event_admin_billing_periods', url)
+
+    def test_voting_admin_stats(self):
+        url = reverse('voting:admin_voting_stats_details', kwargs={'election_slug': self.benchmark.election.slug})
+        self.assertWithinBudget('voting_admin_stats', url)
+
+
+class TestRegistrationViewBudgets(BenchmarkTest, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = self.benchmark.events[0]
+        self.event_kwargs = {'league_slug': self.benchmark.league.slug, 'event_slug': self.event.slug}
+
+    def test_register_event(self):
+        self.client.logout()
+        url = reverse('register:register_event', kwargs=self.event_kwargs)
+        self.assertWithinBudget('register_event', url, status_code=302)
+
+    def test_register_show_form(self):
+        self.client.get(reverse('register:register_event', kwargs=self.event_kwargs))
+        self.assertWithinBudget('register_show_form', reverse('register:show_form', kwargs=self.event_kwargs))
@@ -0,0 +1,111 @@
+from django.urls import reverse
+
+from billing.models import Invoice
+from billing.tests.factories import BillingPeriodFactory, InvoiceFactory
+from league.tests.factories import LeagueFactory
+from rink.utils.pagination import KeysetPaginator, estimate_count, get_keyset_ordering
+from roster.tables import RosterTable
+from users.models import User
+from users.tests.factories import OrgAdminUserFactory, UserFactory, user_password
+
+from test_plus.test import TestCase
+
+
+class TestKeysetPaginator(TestCase):
+    def setUp(self):
+        self.league = LeagueFactory()
+        # Repeated names, so the primary key has to break ties.
+        for i in range(7):
+            UserFactory(
+                league=self.league,
+                organization=self.league.organization,
+                first_name="First{}".format(i % 2),
+                last_name="Last{}".format(i % 3),
+            )
+        self.users = User.objects.filter(league=self.league)
+
+    def get_page(self, cursor=None, order_by=None):
+        table = RosterTable(self.users, order_by=order_by)
+        table.paginate(klass=KeysetPaginator, per_page=3, cursor=cursor)
+        return table.page
+
+    def get_pks(self, page):
+        return [row.record.pk for row in page.object_list]
+
+    def walk(self, order_by=None):
+        page = self.get_page(order_by=order_by)
+        self.assertFalse(page.has_previous())
+        pages = [page]
+        while page.has_next():
+            page = self.get_page(page.next_page_number(), order_by)
+            pages.append(page)
+        return pages
+
+    def test_walk_forward_and_back(self):
+        for order_by in [None, ['legal_name'], ['-derby_name'], ['-email']]:
+            ordered = RosterTable(self.users, order_by=order_by).data.data
+            expected = list(ordered.order_by(*get_keyset_ordering(ordered)).values_list('pk', flat=True))
+            pages = self.walk(order_by)
+            self.assertEqual([pk for page in pages for pk in self.get_pks(page)], expected, order_by)
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+            page = pages[-1]
+            backwards = []
+            while page.has_previous():
+                page = self.get_page(page.previous_page_number(), order_by)
+                backwards.append(self.get_pks(page))
+            self.assertEqual(backwards, [self.get_pks(pages[1]), self.get_pks(pages[0])])
+
+    def test_constant_queries(self):
+        page = self.walk()[1]
+        with self.assertNumQueries(1):
+            self.get_pks(self.get_page(page.next_page_number()))
+
+    def test_bad_or_stale_cursor_starts_over(self):
+        first = self.get_pks(self.get_page())
+        self.assertEqual(self.get_pks(self.get_page("2")), first)
+
+        # A cursor made for another sort order.
+        cursor = self.get_page(order_by=['-email']).next_page_number()
+        self.assertEqual(self.get_pks(self.get_page(cursor)), first)
+
+    def test_past_the_end(self):
+        last = self.walk()[-1]
+        cursor = self.get_page(order_by=None).next_page_number()
+        User.objects.filter(pk__in=self.users.values('pk')).exclude(
+            pk__in=self.get_pks(self.get_page())).delete()
+
+        page = self.get_page(cursor)
+        self.assertEqual(len(page), 0)
+        self.assertTrue(page.has_previous())
+        self.assertEqual(page.previous_page_number(), "")
+        self.assertFalse(last.has_next())
+
+    def test_count(self):
+        self.assertEqual(estimate_count(self.users), (7, False))
+        page = self.get_page()
+        self.assertEqual(page.paginator.count, 7)
+        self.assertFalse(page.paginator.count_is_estimate)
+
+
+class TestKeysetViews(TestCase):
+    def setUp(self):
+        self.admin = OrgAdminUserFactory()
+        self.client.login(email=self.admin.email, password=user_password)
+
+    def test_billing_admin_pages(self):
+        league = self.admin.league
+        period = BillingPeriodFactory(league=league, event__league=league)
+        for i in range(55):
+            InvoiceFactory(user=UserFactory(league=league, organization=league.organization), billing_period=period)
+
+        response = self.client.get(reverse('billing:billing_admin'))
+        table = response.context['table']
+        first = [row.record.pk for row in table.page.object_list]
+        self.assertEqual(len(first), 50)
+
+        response = self.client.get(reverse('billing:billing_admin'), {'page': table.page.next_page_number()})
+        second = [row.record.pk for row in response.context['table'].page.object_list]
+        self.assertEqual(len(second), 5)
+        self.assertEqual(set(first + second), set(Invoice.objects.filter(league=league).values_list('pk', flat=True)))
+        self.assertContains(response, "55 total")
@@ -0,0 +1,95 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+
+from celery.signals import before_task_publish
+
+from rink.utils import profiling
+from rink.utils.profiling import (
+    RequestProfile, get_records, normalize_sql, store_record, summarize_records)
+from users.tests.factories import OrgAdminUserFactory, UserFactory, user_password
+
+from test_plus.test import TestCase
+
+
+class TestNormalizeSQL(TestCase):
+    def test_literals_and_in_lists_are_collapsed(self):
+        self.assertEqual(
+            normalize_sql('SELECT * FROM "users_user" WHERE "id" IN (%s, %s, %s) AND "email" = \'a@b.c\' LIMIT 21'),
+            'SELECT * FROM "users_user" WHERE "id" IN (...) AND "email" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            normalize_sql('SELECT *  FROM "users_user"\n WHERE "id" IN (%s)'),
+            normalize_sql('SELECT * FROM "users_user" WHERE "id" IN (%s, %s)'),
+        )
+
+
+@override_settings(RINK_PROFILING_BUFFER_SIZE=3)
+class TestProfilingMiddleware(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = OrgAdminUserFactory()
+        self.client.login(email=self.admin.email, password=user_password)
+
+    def test_not_sampled(self):
+        with override_settings(RINK_PROFILING_SAMPLE_RATE=0):
+            self.client.get(reverse('users:profile'))
+        self.assertEqual(get_records(), [])
+
+    def test_sampled(self):
+        with override_settings(RINK_PROFILING_SAMPLE_RATE=1):
+            self.client.get(reverse('users:profile'))
+
+        record = get_records()[0]
+        self.assertEqual(record['view'], 'users:profile')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['sql_count'], 0)
+        self.assertLessEqual(sum(count for sql, count, ms in record['statements']), record['sql_count'])
+        self.assertGreater(record['template_ms'], 0)
+        self.assertGreaterEqual(record['total_ms'], record['template_ms'])
+
+    def test_records_tasks_published(self):
+        profile = profiling._active.profile = RequestProfile()
+        try:
+            before_task_publish.send(sender='billing.tasks.email_invoice')
+        finally:
+            profiling._active.profile = None
+        before_task_publish.send(sender='billing.tasks.email_invoice')
+        self.assertEqual(profile.tasks, ['billing.tasks.email_invoice'])
+
+    def test_ring_buffer_keeps_latest(self):
+        for i in range(0, 5):
+            store_record({'time': i})
+        self.assertEqual([record['time'] for record in get_records()], [4, 3, 2])
+
+
+class TestProfilingSummary(TestCase):
+    def test_groups_by_league_and_view(self):
+        records = [
+            {'league_id': 1, 'view': 'roster:list', 'total_ms': 100, 'sql_count': 10, 'sql_ms': 50,
+             'template_ms': 40, 'tasks': [], 'statements': [['SELECT ?', 10, 50]]},
+            {'league_id': 1, 'view': 'roster:list', 'total_ms': 300, 'sql_count': 20, 'sql_ms': 150,
+             'template_ms': 100, 'tasks': ['task'], 'statements': [['SELECT ?', 20, 150]]},
+            {'league_id': 2, 'view': 'roster:list', 'total_ms': 50, 'sql_count': 5, 'sql_ms': 10,
+             'template_ms': 30, 'tasks': [], 'statements': []},
+        ]
+        summary = summarize_records(records)
+
+        self.assertEqual([(group['league_id'], group['requests']) for group in summary], [(1, 2), (2, 1)])
+        self.assertEqual(summary[0]['avg_total_ms'], 200)
+        self.assertEqual(summary[0]['max_ms'], 300)
+        self.assertEqual(summary[0]['avg_sql_count'], 15)
+        self.assertEqual(summary[0]['avg_tasks'], 0.5)
+        self.assertEqual(summary[0]['statements'], [{'sql': 'SELECT ?', 'count': 15, 'ms': 100}])
+
+    def test_admin_only(self):
+        url = reverse('profiling_summary')
+        user = UserFactory()
+        self.client.login(email=user.email, password=user_password)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        user.is_admin = True
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'utils/profiling_summary.html')
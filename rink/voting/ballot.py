@@ -0,0 +1,52 @@
+"""
+What a ballot looks like: the election, its questions and their answers.
+None of it changes while people vote, so it's read once and cached per
+election, along with the rendered questions of an untouched ballot. The
+handlers clear both when the election, a question or an answer is saved or
+deleted.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Election, ElectionQuestion
+
+
+BALLOT_CACHE_KEY = "voting:ballot:{}"
+BALLOT_HTML_CACHE_KEY = "voting:ballot_html:{}"
+BALLOT_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_ballot(election_id):
+    """
+    {'election', 'questions'} for an election, the election with its league
+    and the questions with their answers prefetched.
+    """
+    key = BALLOT_CACHE_KEY.format(election_id)
+    ballot = cache.get(key)
+    if ballot is None:
+        election = Election.objects.select_related('league').get(pk=election_id)
+        questions = list(ElectionQuestion.objects.filter(election=election).prefetch_related('answers').order_by('pk'))
+        for question in questions:
+            question.election = election
+        ballot = {'election': election, 'questions': questions}
+        cache.set(key, ballot, BALLOT_CACHE_TIMEOUT)
+    return ballot
+
+
+def render_ballot_questions(election, questions, filled_in=False):
+    # Only a blank ballot is the same for everybody, one that's being sent
+    # back with errors shows the voter's answers.
+    if filled_in:
+        return render_to_string("voting/ballot_questions.html", {'questions': questions})
+
+    key = BALLOT_HTML_CACHE_KEY.format(election.pk)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string("voting/ballot_questions.html", {'questions': questions})
+        cache.set(key, html, BALLOT_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def invalidate_ballot(election_id):
+    cache.delete_many([BALLOT_CACHE_KEY.format(election_id), BALLOT_HTML_CACHE_KEY.format(election_id)])
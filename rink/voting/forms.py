@@ -9,7 +9,15 @@ class ElectionEmailInviteForm(forms.Form):
         widget=forms.Textarea,
         label="Email Addresses",
         help_text="Email addresses invites should be sent to. One per line, please. Email addresses must match user account on file.",
-        required=True,
+        required=False,
+    )
+
+    invite_all_members = forms.BooleanField(
+        label="Invite every current league member",
+        help_text=(
+            "Ignores the email addresses above. Members who were already invited and haven't voted get a reminder."
+        ),
+        required=False,
     )
 
     def __init__(self, league, *args, **kwargs):
@@ -18,11 +26,17 @@ class ElectionEmailInviteForm(forms.Form):
 
         self.helper.layout = Layout(
             'emails',
-            'billing_group',
+            'invite_all_members',
             ButtonHolder(
                 Submit('submit', 'Send Invites to Vote', css_class='button white')
             )
         )
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('invite_all_members') and not cleaned_data.get('emails', '').strip():
+            self.add_error('emails', "Enter some email addresses, or invite every league member.")
+        return cleaned_data
+
     class Meta:
-        fields = ['emails', ]
+        fields = ['emails', 'invite_all_members', ]
@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .ballot import invalidate_ballot
+from .models import Election, ElectionAnswer, ElectionQuestion
+
+
+# Cleared once the change is committed, a ballot read before that would put
+# the old version back in the cache.
+
+def invalidate_ballot_on_commit(election_id):
+    transaction.on_commit(lambda: invalidate_ballot(election_id))
+
+
+@receiver(post_save, sender=Election)
+@receiver(post_delete, sender=Election)
+def invalidate_election_ballot(sender, instance, **kwargs):
+    invalidate_ballot_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=ElectionQuestion)
+@receiver(post_delete, sender=ElectionQuestion)
+def invalidate_question_ballot(sender, instance, **kwargs):
+    invalidate_ballot_on_commit(instance.election_id)
+
+
+@receiver(post_save, sender=ElectionAnswer)
+@receiver(post_delete, sender=ElectionAnswer)
+def invalidate_answer_ballot(sender, instance, **kwargs):
+    # Answers are deleted before their question, it's still there.
+    election_id = ElectionQuestion.objects.filter(pk=instance.question_id).values_list('election_id', flat=True).first()
+    if election_id:
+        invalidate_ballot_on_commit(election_id)
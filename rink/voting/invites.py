@@ -0,0 +1,87 @@
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from league.models import LeagueMembership
+from users.models import User
+
+from .models import Election, VotingInvite
+
+
+def get_voting_member_ids(league_id, user_ids=None):
+    # Users with the league_member permission, the ones allowed to vote.
+    memberships = LeagueMembership.objects.filter(league_id=league_id, permissions__contains='league_member')
+    if user_ids is not None:
+        memberships = memberships.filter(user_id__in=user_ids)
+    return {
+        user_id for user_id, permissions in memberships.values_list('user_id', 'permissions')
+        if 'league_member' in permissions.split(",")
+    }
+
+
+def resolve_voter_emails(league, emails):
+    """
+    Match email addresses to league members with two queries however many
+    addresses there are. Returns (user_ids, errors), errors are messages for
+    the addresses that can't be invited.
+    """
+    errors = []
+    valid_emails = []
+    for email in emails:
+        try:
+            validate_email(email)
+        except ValidationError:
+            errors.append("Invalid email: {}. Please check your list and try again.".format(email))
+        else:
+            valid_emails.append(email)
+
+    users = dict(User.objects.filter(email__in=valid_emails).values_list('email', 'pk'))
+    member_ids = get_voting_member_ids(league.pk, users.values())
+
+    user_ids = []
+    for email in valid_emails:
+        if email not in users:
+            errors.append("Email address does not have a Rink account: {}".format(email))
+        elif users[email] not in member_ids:
+            errors.append("Email {} does not appear to be a member of this league (no permissions).".format(email))
+        elif users[email] not in user_ids:
+            user_ids.append(users[email])
+    return user_ids, errors
+
+
+def bulk_voting_invites(election, user_ids):
+    """
+    Invite users to vote in an election. New invites are created with one
+    bulk_create, users who were already invited and haven't voted get a
+    reminder instead.
+
+    Returns (invite_ids, reminder_ids), the invites to email.
+    """
+    user_ids = set(user_ids)
+    with transaction.atomic():
+        # Locked until the invites are committed, a second admin inviting the
+        # same people waits and then finds these invites instead of hitting
+        # the (user, election) unique constraint.
+        Election.objects.select_for_update().only('pk').get(pk=election.pk)
+
+        existing = dict(VotingInvite.objects.filter(
+            election=election,
+            user_id__in=user_ids,
+        ).values_list('user_id', 'date_responded'))
+        reminder_users = [user_id for user_id, date_responded in existing.items() if date_responded is None]
+
+        new_users = user_ids - set(existing)
+        VotingInvite.objects.bulk_create([
+            VotingInvite(user_id=user_id, election=election) for user_id in sorted(new_users)
+        ])
+
+    # bulk_create doesn't set primary keys on every database, fetch them.
+    invite_ids = []
+    reminder_ids = []
+    for pk, user_id in VotingInvite.objects.filter(
+            election=election, user_id__in=new_users.union(reminder_users)).values_list('pk', 'user_id'):
+        if user_id in new_users:
+            invite_ids.append(pk)
+        else:
+            reminder_ids.append(pk)
+    return sorted(invite_ids), sorted(reminder_ids)
@@ -0,0 +1,105 @@
+"""
+Election vote tallies. Counted with one grouped query, kept in the cache per
+election and updated in place as ballots come in, so the live results page
+reads them from the cache instead of recounting.
+
+The cached tallies remember how many ballots they include, counted in the
+same query as the votes. A new ballot is only added in place when the
+tallies are exactly one ballot behind the database. Otherwise it was either
+already counted, or another ballot recorded at the same moment overwrote
+this update, and the tallies are counted again.
+"""
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, Subquery
+
+from .models import VotingResponse, VotingResponseAnswer
+
+
+ELECTION_RESULTS_CACHE_KEY = "voting:results:{}"
+ELECTION_RESULTS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_results_cache_key(election):
+    return ELECTION_RESULTS_CACHE_KEY.format(getattr(election, 'pk', election))
+
+
+def count_ballots(election):
+    return VotingResponse.objects.filter(election=election).count()
+
+
+def count_votes(election):
+    """
+    {'ballots': number of ballots, 'votes': {question_id: {answer: votes}}},
+    write-ins included. The ballots are counted by a subquery of the votes
+    query, so a ballot committed partway through is in both or neither.
+    """
+    ballots = VotingResponse.objects.filter(election=election).order_by().values('election').annotate(
+        ballots=Count('pk')).values('ballots')
+    rows = VotingResponseAnswer.objects.filter(question__election=election).values(
+        'question_id', 'answer').annotate(
+        votes=Count('pk'),
+        ballots=Subquery(ballots, output_field=IntegerField()),
+    ).order_by()
+
+    tallies = {'ballots': None, 'votes': {}}
+    for row in rows:
+        tallies['ballots'] = row['ballots']
+        tallies['votes'].setdefault(row['question_id'], {})[row['answer']] = row['votes']
+    if tallies['ballots'] is None:
+        # No votes to count twice.
+        tallies['ballots'] = count_ballots(election)
+    return tallies
+
+
+def get_election_tallies(election):
+    """
+    {'ballots': number of ballots counted, 'votes': {question_id: {answer: votes}}}
+    from the cache, counted if they're missing.
+    """
+    key = get_results_cache_key(election)
+    tallies = cache.get(key)
+    if tallies is None:
+        tallies = count_votes(election)
+        cache.set(key, tallies, ELECTION_RESULTS_CACHE_TIMEOUT)
+    return tallies
+
+
+def record_ballot(election, answers):
+    """
+    Adds one committed ballot, a list of (question_id, answer), to the cached
+    tallies. Nothing to do if they aren't cached, the next read counts.
+    """
+    key = get_results_cache_key(election)
+    tallies = cache.get(key)
+    if tallies is None:
+        return
+    if tallies['ballots'] + 1 == count_ballots(election):
+        for question_id, answer in answers:
+            question_votes = tallies['votes'].setdefault(question_id, {})
+            question_votes[answer] = question_votes.get(answer, 0) + 1
+        tallies['ballots'] += 1
+    else:
+        tallies = count_votes(election)
+    cache.set(key, tallies, ELECTION_RESULTS_CACHE_TIMEOUT)
+
+
+def invalidate_election_tallies(election):
+    cache.delete(get_results_cache_key(election))
+
+
+def get_question_results(question, votes):
+    """
+    Rows of {'answer', 'count', 'percent'} for a question: its answers in
+    order, votes or not, then any write-ins.
+    """
+    votes = dict(votes)
+    total = sum(votes.values())
+    rows = []
+    for answer in question.answers.all():
+        rows.append({'answer': answer.answer, 'count': votes.pop(answer.answer, 0)})
+    for answer, count in sorted(votes.items(), key=lambda item: (-item[1], item[0])):
+        rows.append({'answer': answer, 'count': count})
+
+    for row in rows:
+        row['percent'] = int((float(row['count']) / total) * 100) if total else 0
+    return rows
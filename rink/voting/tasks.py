@@ -1,27 +1,47 @@
 from celery import shared_task
 
-from league.utils import send_email
+from league.utils import send_emails
+from rink.utils.chunks import chunked
+from taskapp.metrics import record_items
 
 from voting.models import VotingInvite
 
 
+# Invite lists larger than this are split into subtasks, so inviting a whole
+# league doesn't all ride on one long running task.
+VOTING_INVITE_CHUNK_SIZE = 50
+
+
+def group_invites_by_league(invites):
+    # An invite list is almost always for one election, send_emails works per league.
+    leagues = {}
+    for invite in invites:
+        leagues.setdefault(invite.election.league_id, (invite.election.league, []))[1].append(invite)
+    return leagues.values()
+
+
 @shared_task(ignore_result=True)
 def send_voting_invite(invite_ids=[], reminder=False):
+    invite_ids = list(invite_ids)
+    if len(invite_ids) > VOTING_INVITE_CHUNK_SIZE:
+        for chunk in chunked(invite_ids, VOTING_INVITE_CHUNK_SIZE):
+            send_voting_invite.delay(invite_ids=chunk, reminder=reminder)
+        return
+
     if reminder:
         template = 'voting_reminder'
     else:
         template = 'voting_invite'
 
-    for invite in invite_ids:
-        invite = VotingInvite.objects.get(pk=invite)
-
-        send_email(
-            league=invite.election.league,
-            to_email=invite.user.email,
+    invites = VotingInvite.objects.filter(pk__in=invite_ids).select_related('election__league', 'user')
+    for league, league_invites in group_invites_by_league(invites):
+        send_emails(
+            league=league,
             template=template,
-            context={
+            recipients=[(invite.user.email, {
                 'invite': invite,
                 'election': invite.election,
                 'user': invite.user,
-            },
+            }) for invite in league_invites],
         )
+        record_items(len(league_invites))
@@ -0,0 +1,32 @@
+from django.utils import timezone
+
+import factory
+
+from league.tests.factories import LeagueFactory
+
+
+class ElectionFactory(factory.django.DjangoModelFactory):
+    name = factory.Sequence(lambda n: f'Test Election {n}')
+    league = factory.SubFactory(LeagueFactory)
+    description = "Vote for things."
+    start_date = factory.LazyFunction(lambda: timezone.now() - timezone.timedelta(days=1))
+    end_date = factory.LazyFunction(lambda: timezone.now() + timezone.timedelta(days=7))
+
+    class Meta:
+        model = 'voting.Election'
+
+
+class ElectionQuestionFactory(factory.django.DjangoModelFactory):
+    election = factory.SubFactory(ElectionFactory)
+    question = factory.Sequence(lambda n: f'Question {n}?')
+
+    class Meta:
+        model = 'voting.ElectionQuestion'
+
+
+class ElectionAnswerFactory(factory.django.DjangoModelFactory):
+    question = factory.SubFactory(ElectionQuestionFactory)
+    answer = factory.Sequence(lambda n: f'Answer {n}')
+
+    class Meta:
+        model = 'voting.ElectionAnswer'
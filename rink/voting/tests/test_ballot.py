@@ -0,0 +1,118 @@
+from unittest.mock import patch
+
+from voting.models import VotingInvite, VotingResponse, VotingResponseAnswer
+
+from .test_results import VotingTestCase
+
+
+class TestSubmitBallot(VotingTestCase):
+    def test_submit(self):
+        invite = self.add_invite()
+        response = self.vote([1, 0], comment="Go team", invite=invite)
+        self.assertEqual(response.status_code, 302)
+
+        invite.refresh_from_db()
+        self.assertIsNotNone(invite.date_responded)
+        ballot = VotingResponse.objects.get(election=self.election)
+        self.assertEqual(ballot.comment, "Go team")
+        self.assertEqual(
+            list(VotingResponseAnswer.objects.filter(response=ballot).order_by('question_id').values_list(
+                'question_id', 'answer')),
+            [
+                (self.questions[0].pk, self.questions[0].answers.order_by('pk')[1].answer),
+                (self.questions[1].pk, self.questions[1].answers.order_by('pk')[0].answer),
+            ]
+        )
+
+    def test_invalid_answer(self):
+        invite = self.add_invite()
+        # Write-ins aren't allowed on these questions.
+        response = self.vote([0, "Skate Mate"], invite=invite)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['errors'])
+
+        invite.refresh_from_db()
+        self.assertIsNone(invite.date_responded)
+        self.assertFalse(VotingResponse.objects.exists())
+
+    def test_concurrent_ballot(self):
+        invite = self.add_invite()
+        self.vote([0, 0], invite=invite)
+        # The other request read the invite before this one marked it.
+        with patch.object(VotingInvite, 'responded', return_value=False):
+            response = self.vote([1, 1], invite=invite)
+        self.assertContains(response, "already voted")
+        self.assertEqual(VotingResponse.objects.count(), 1)
+        self.assertEqual(VotingResponseAnswer.objects.count(), 2)
+
+    def test_queries(self):
+        invite = self.add_invite()
+        data = self.ballot_data([0, 0])
+        with self.assertNumQueries(11):
+            self.submit_ballot(invite, data)
+
+        self.questions += [self.add_question(answers=3) for i in range(3)]
+        invite = self.add_invite()
+        data = self.ballot_data([0, 0, 1, 2, 0])
+        with self.assertNumQueries(11):
+            self.submit_ballot(invite, data)
+        self.assertEqual(VotingResponseAnswer.objects.filter(response__election=self.election).count(), 7)
+
+
+class TestViewBallot(VotingTestCase):
+    def test_cached_ballot(self):
+        url = self.get_ballot_url(self.add_invite())
+        response = self.client.get(url)
+        for question in self.questions:
+            for answer in question.answers.all():
+                self.assertContains(response, answer.answer)
+
+        # Just the invite.
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, self.questions[1].answers.last().answer)
+
+    def test_edits_clear_cached_ballot(self):
+        url = self.get_ballot_url(self.add_invite())
+        self.client.get(url)
+
+        answer = self.questions[0].answers.first()
+        answer.answer = "Skate Mate"
+        answer.save()
+        self.assertContains(self.client.get(url), "Skate Mate")
+
+        question = self.add_question(answers=0, question="Who runs the bake sale?")
+        self.assertContains(self.client.get(url), "Who runs the bake sale?")
+
+        question.delete()
+        self.assertNotContains(self.client.get(url), "Who runs the bake sale?")
+
+        self.election.description = "Pick wisely"
+        self.election.save()
+        self.assertContains(self.client.get(url), "Pick wisely")
+
+    def test_errors_keep_answers(self):
+        self.questions[1].allow_write_in = True
+        self.questions[1].save()
+        invite = self.add_invite()
+        self.client.get(self.get_ballot_url(invite))
+
+        data = self.ballot_data([1, "Skate Mate"])
+        data['question{}'.format(self.questions[0].pk)] = "Nobody"
+        response = self.submit_ballot(invite, data)
+        self.assertContains(response, 'value="Skate Mate"')
+        self.assertContains(response, 'value="custom" checked="checked"')
+        self.assertContains(response, 'checked="checked"', count=1)
+
+        data = self.ballot_data([1, 0])
+        data['question{}'.format(self.questions[1].pk)] = "Nobody"
+        response = self.submit_ballot(invite, data)
+        self.assertContains(response, 'value="{}" checked="checked"'.format(
+            self.questions[0].answers.order_by('pk')[1].answer))
+
+        # The blank ballot is still blank.
+        self.assertNotContains(self.client.get(self.get_ballot_url(invite)), 'checked="checked"')
+
+    def test_unknown_invite(self):
+        url = self.get_ballot_url(self.add_invite()).replace(str(self.league.slug), "other-league")
+        self.assertContains(self.client.get(url), "Survey not found.")
@@ -0,0 +1,88 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from unittest.mock import patch
+
+from users.tests.factories import OrgAdminUserFactory, UserFactory, UserFactoryNoPermissions, user_password
+from voting.invites import bulk_voting_invites, get_voting_member_ids, resolve_voter_emails
+from voting.models import VotingInvite
+from voting.tasks import VOTING_INVITE_CHUNK_SIZE, send_voting_invite
+
+from .factories import ElectionFactory
+
+from test_plus.test import TestCase
+
+
+class TestVotingInvites(TestCase):
+    def setUp(self):
+        self.admin = OrgAdminUserFactory()
+        self.league = self.admin.league
+        self.election = ElectionFactory(league=self.league)
+        self.members = [self.add_member() for i in range(3)]
+
+    def add_member(self):
+        return UserFactory(league=self.league, organization=self.league.organization)
+
+    def test_resolve_emails(self):
+        outsider = UserFactoryNoPermissions(league=self.league, organization=self.league.organization)
+        emails = [self.members[0].email, "not an email", "nobody@example.com", outsider.email, self.members[0].email]
+
+        user_ids, errors = resolve_voter_emails(self.league, emails)
+        self.assertEqual(user_ids, [self.members[0].pk])
+        self.assertEqual(len(errors), 3)
+        self.assertIn("Invalid email: not an email", errors[0])
+        self.assertIn("does not have a Rink account", errors[1])
+        self.assertIn("{} does not appear to be a member".format(outsider.email), errors[2])
+
+    def test_resolve_emails_constant_queries(self):
+        emails = [member.email for member in self.members]
+        with CaptureQueriesContext(connection) as small:
+            resolve_voter_emails(self.league, emails)
+        emails += [self.add_member().email for i in range(10)]
+        with self.assertNumQueries(len(small.captured_queries)):
+            user_ids, errors = resolve_voter_emails(self.league, emails)
+        self.assertEqual((len(user_ids), errors), (13, []))
+
+    def test_bulk_invites_and_reminders(self):
+        voted = VotingInvite.objects.create(user=self.members[0], election=self.election, date_responded=timezone.now())
+        waiting = VotingInvite.objects.create(user=self.members[1], election=self.election)
+
+        invite_ids, reminder_ids = bulk_voting_invites(self.election, [member.pk for member in self.members])
+        new_invite = VotingInvite.objects.get(election=self.election, user=self.members[2])
+        self.assertEqual(invite_ids, [new_invite.pk])
+        self.assertEqual(reminder_ids, [waiting.pk])
+        self.assertEqual(VotingInvite.objects.filter(election=self.election).count(), 3)
+        self.assertNotIn(voted.pk, invite_ids + reminder_ids)
+
+    def test_invite_all_members(self):
+        UserFactoryNoPermissions(league=self.league, organization=self.league.organization)
+        self.client.login(email=self.admin.email, password=user_password)
+        url = reverse('voting:admin_voting_invites', kwargs={'election_slug': self.election.slug})
+        self.assertContains(self.client.get(url), 'name="invite_all_members"')
+
+        with patch('voting.views_admin.send_voting_invite.delay') as delay, \
+                patch('voting.views_admin.transaction.on_commit', side_effect=lambda func: func()):
+            response = self.client.post(url, {'invite_all_members': 'on'})
+        self.assertRedirects(response, url)
+        self.assertEqual(
+            set(VotingInvite.objects.filter(election=self.election).values_list('user_id', flat=True)),
+            {member.pk for member in self.members})
+        self.assertEqual(set(get_voting_member_ids(self.league.pk)), {member.pk for member in self.members})
+        delay.assert_called_once()
+
+    def test_send_in_chunks(self):
+        invite_ids = list(range(1, VOTING_INVITE_CHUNK_SIZE * 2 + 2))
+        with patch('voting.tasks.send_voting_invite.delay') as delay:
+            send_voting_invite(invite_ids=invite_ids, reminder=True)
+        self.assertEqual(delay.call_count, 3)
+        self.assertEqual(delay.call_args[1], {'invite_ids': invite_ids[-1:], 'reminder': True})
+
+    def test_send_emails(self):
+        invite_ids, reminder_ids = bulk_voting_invites(self.election, [member.pk for member in self.members])
+        with patch('voting.tasks.send_emails') as send_emails:
+            send_voting_invite(invite_ids=invite_ids)
+        recipients = send_emails.call_args[1]['recipients']
+        self.assertEqual(send_emails.call_args[1]['template'], 'voting_invite')
+        self.assertEqual({email for email, context in recipients}, {member.email for member in self.members})
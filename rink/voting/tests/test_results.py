@@ -0,0 +1,148 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from unittest.mock import patch
+
+from users.tests.factories import OrgAdminUserFactory, UserFactory, user_password
+from voting.models import VotingInvite, VotingResponse, VotingResponseAnswer
+from voting.results import get_election_tallies, get_question_results
+
+from .factories import ElectionAnswerFactory, ElectionFactory, ElectionQuestionFactory
+
+from test_plus.test import TestCase
+
+
+class VotingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Test cases never commit, clear cached ballots straight away.
+        on_commit = patch('voting.handlers.transaction.on_commit', side_effect=lambda func: func())
+        on_commit.start()
+        self.addCleanup(on_commit.stop)
+        self.admin = OrgAdminUserFactory()
+        self.league = self.admin.league
+        self.election = ElectionFactory(league=self.league)
+        self.questions = [self.add_question() for i in range(2)]
+
+    def add_question(self, answers=2, **kwargs):
+        question = ElectionQuestionFactory(election=self.election, **kwargs)
+        for i in range(answers):
+            ElectionAnswerFactory(question=question, answer="{} {}".format(question.question, i))
+        return question
+
+    def add_invite(self):
+        return VotingInvite.objects.create(
+            election=self.election,
+            user=UserFactory(league=self.league, organization=self.league.organization),
+        )
+
+    def get_ballot_url(self, invite):
+        return reverse('voting:view_voting_invite', kwargs={
+            'league_slug': self.league.slug,
+            'vote_key': invite.uuid,
+        })
+
+    def ballot_data(self, answers, comment=""):
+        # answers are indexes into each question's answers, or write-in text.
+        data = {'anything_else': comment}
+        for question, answer in zip(self.questions, answers):
+            if isinstance(answer, int):
+                data['question{}'.format(question.pk)] = question.answers.order_by('pk')[answer].answer
+            else:
+                data['question{}'.format(question.pk)] = 'custom'
+                data['question{}custom'.format(question.pk)] = answer
+        return data
+
+    def submit_ballot(self, invite, data):
+        with patch('voting.views.transaction.on_commit', side_effect=lambda func: func()):
+            return self.client.post(self.get_ballot_url(invite), data)
+
+    def vote(self, answers, comment="", invite=None):
+        return self.submit_ballot(invite or self.add_invite(), self.ballot_data(answers, comment))
+
+
+class TestElectionResults(VotingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.questions[1].allow_write_in = True
+        self.questions[1].save()
+
+    def test_tallies_with_write_ins(self):
+        self.vote([0, 1])
+        self.vote([0, "Skate Mate"])
+        self.vote([1, "Skate Mate"], comment="Go team")
+
+        votes = get_election_tallies(self.election)['votes']
+        first, second = self.questions
+        self.assertEqual(get_question_results(first, votes[first.pk]), [
+            {'answer': first.answers.order_by('pk')[0].answer, 'count': 2, 'percent': 66},
+            {'answer': first.answers.order_by('pk')[1].answer, 'count': 1, 'percent': 33},
+        ])
+        self.assertEqual(get_question_results(second, votes[second.pk]), [
+            {'answer': second.answers.order_by('pk')[0].answer, 'count': 0, 'percent': 0},
+            {'answer': second.answers.order_by('pk')[1].answer, 'count': 1, 'percent': 33},
+            {'answer': "Skate Mate", 'count': 2, 'percent': 66},
+        ])
+
+    def test_ballots_update_cached_tallies(self):
+        self.vote([0, 0])
+        self.assertEqual(get_election_tallies(self.election)['ballots'], 1)
+
+        self.vote([1, "Skate Mate"])
+        with self.assertNumQueries(0):
+            tallies = get_election_tallies(self.election)
+        self.assertEqual(tallies['ballots'], 2)
+        self.assertEqual(tallies['votes'][self.questions[1].pk], {
+            self.questions[1].answers.order_by('pk')[0].answer: 1,
+            "Skate Mate": 1,
+        })
+
+    def test_missed_ballot_recounts(self):
+        self.vote([0, 0])
+        get_election_tallies(self.election)
+        # A ballot the cache didn't hear about.
+        response = VotingResponse.objects.create(election=self.election)
+        VotingResponseAnswer.objects.create(response=response, question=self.questions[0], answer="Late")
+
+        self.vote([0, 0])
+        tallies = get_election_tallies(self.election)
+        self.assertEqual(tallies['ballots'], 3)
+        self.assertEqual(tallies['votes'][self.questions[0].pk]["Late"], 1)
+
+    def test_ballot_counted_before_it_is_recorded(self):
+        self.vote([0, 0])
+        # The tallies are counted after the ballot commits, but before its
+        # on-commit update runs.
+        with patch('voting.views.transaction.on_commit') as on_commit:
+            self.client.post(self.get_ballot_url(self.add_invite()), self.ballot_data([0, 0]))
+        get_election_tallies(self.election)
+        on_commit.call_args[0][0]()
+
+        tallies = get_election_tallies(self.election)
+        self.assertEqual(tallies['ballots'], 2)
+        first_answer = self.questions[0].answers.order_by('pk')[0].answer
+        self.assertEqual(tallies['votes'][self.questions[0].pk], {first_answer: 2})
+
+    def test_stats_view(self):
+        self.client.login(email=self.admin.email, password=user_password)
+        url = reverse('voting:admin_voting_stats_details', kwargs={'election_slug': self.election.slug})
+        self.vote([0, "Skate Mate"], comment="Go team")
+        self.add_invite()
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['invites_responded']), 1)
+        self.assertEqual(len(response.context['invites_waiting']), 1)
+        self.assertEqual(response.context['invites_responded_percent'], 50)
+        self.assertContains(response, "Skate Mate")
+        self.assertContains(response, "Go team")
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        queries = len(context.captured_queries)
+        self.questions.append(self.add_question(answers=4))
+        for i in range(3):
+            self.vote([1, "Other", 2])
+        with self.assertNumQueries(queries):
+            self.client.get(url)
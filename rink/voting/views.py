@@ -1,13 +1,13 @@
+from django.db import transaction
 from django.http import HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
 from django.views import View
 
-from datetime import datetime
-
-from voting.models import Election, VotingInvite, ElectionQuestion, \
-    ElectionAnswer, VotingResponse, VotingResponseAnswer
+from voting.ballot import get_ballot, render_ballot_questions
+from voting.models import Election, VotingInvite, VotingResponse, VotingResponseAnswer
+from voting.results import record_ballot
 
 
 class BallotThanks(View):
@@ -36,7 +36,9 @@ class ViewBallot(View):
         except VotingInvite.DoesNotExist:
             error = "Survey not found."
         else:
-            self.election = self.invite.election
+            ballot = get_ballot(self.invite.election_id)
+            self.election = self.invite.election = ballot['election']
+            self.questions = ballot['questions']
 
             if self.invite.responded():
                 error = "It appears you already voted in this election."
@@ -48,44 +50,32 @@ class ViewBallot(View):
         if error:
             return render(request, "voting/error.html", {
                 "error": error,
-                'league': self.election.league
+                'league': self.election.league if self.election else None,
             })
 
-        self.questions = ElectionQuestion.objects.filter(election=self.election).select_related()
-
         return super().dispatch(request, *args, **kwargs)
 
     def get(self, request, *args, **kwargs):
         return render(request, "voting/voting.html", {
             'election': self.election,
-            'questions': self.questions,
+            'ballot': render_ballot_questions(self.election, self.questions),
             'league': self.election.league,
         })
 
     def post(self, request, *args, **kwargs):
         errors = False
-        try:
-            anything_else = request.POST.get("anything_else")
-        except:
-            anything_else = ""
+        anything_else = request.POST.get("anything_else", "")
 
         for question in self.questions:
-            valid_answer = False
-            answer_text = False
+            valid_answers = {answer.answer for answer in question.answers.all()}
+            answer_text = request.POST.get("question%s" % (question.id))
             custom_answer = ""
-            try:
-                answer_text = request.POST.get("question%s" % (question.id))
-                valid_answer = ElectionAnswer.objects.get(question=question, answer=answer_text).answer
-            except:
-                pass
+            valid_answer = answer_text if answer_text in valid_answers else False
 
             if not valid_answer and answer_text == "custom" and question.allow_write_in:
-                try:
-                    custom_answer = request.POST.get("question%scustom" % (question.id))
-                    if custom_answer != "":
-                        valid_answer = "custom"
-                except:
-                    pass
+                custom_answer = request.POST.get("question%scustom" % (question.id), "")
+                if custom_answer != "":
+                    valid_answer = "custom"
 
             if valid_answer:
                 question.selected = valid_answer
@@ -96,25 +86,37 @@ class ViewBallot(View):
 
         if not errors:
             """ Hooray, save the response. """
-            """ At some point we would upgrade this to use legitimate database transactions, but for now
-            we'll just keep it simple and not do that. """
-            self.invite.date_responded = datetime.now()
-            self.invite.save()
-
-            response = VotingResponse()
-            response.election = self.election
-            response.comment = anything_else
-            response.save()
-
-            for question in self.questions:
-                response_answer = VotingResponseAnswer()
-                response_answer.response = response
-                response_answer.question = question
-                if question.selected == "custom":
-                    response_answer.answer = question.custom
-                else:
-                    response_answer.answer = question.selected
-                response_answer.save()
+            with transaction.atomic():
+                # Only the first of two ballots sent at the same time for an
+                # invite gets to mark it as responded.
+                marked = VotingInvite.objects.filter(
+                    pk=self.invite.pk,
+                    date_responded__isnull=True,
+                ).update(date_responded=timezone.now())
+                if not marked:
+                    return render(request, "voting/error.html", {
+                        "error": "It appears you already voted in this election.",
+                        'league': self.election.league,
+                    })
+
+                response = VotingResponse.objects.create(
+                    election=self.election,
+                    comment=anything_else,
+                )
+
+                response_answers = []
+                for question in self.questions:
+                    response_answers.append(VotingResponseAnswer(
+                        response=response,
+                        question=question,
+                        answer=question.custom if question.selected == "custom" else question.selected,
+                    ))
+                VotingResponseAnswer.objects.bulk_create(response_answers)
+
+            ballot = [(answer.question_id, answer.answer) for answer in response_answers]
+
+            # Keep the live results current without recounting them.
+            transaction.on_commit(lambda: record_ballot(self.election, ballot))
 
             return HttpResponseRedirect(reverse("voting:view_voting_thanks",
                     kwargs={'league_slug': self.election.league.slug,
@@ -123,7 +125,7 @@ class ViewBallot(View):
 
         return render(request, "voting/voting.html", {
             'election': self.election,
-            'questions': self.questions,
+            'ballot': render_ballot_questions(self.election, self.questions, filled_in=True),
             'anything_else': anything_else,
             'errors': errors,
             'league': self.election.league,